@@ -1,26 +1,132 @@
-import firebase_admin
-from firebase_admin import firestore
-from google.cloud.firestore_v1.base_query import FieldFilter
+import os
+from urllib.parse import quote
+
+import base_datos
+import metricas
+import sesion
 from werkzeug.security import generate_password_hash, check_password_hash
 
 # Se asume que Firebase ya fue inicializado en el script principal (login.py)
-db = firestore.client()
+db = base_datos.obtener_db()
+
+# --- COSTE DEL HASH DE CONTRASEÑAS ---
+# Método y parámetros de werkzeug ("scrypt:N:r:p" o "pbkdf2:sha256:iteraciones"). Un coste
+# mayor resiste mejor un ataque por fuerza bruta pero hace más lento cada inicio de sesión
+# (ver benchmarks/bench_hash.py). Se cambia con RASTRO_METODO_HASH o configurar_hash(); los
+# usuarios con un hash de otros parámetros se actualizan solos al iniciar sesión.
+VARIABLE_METODO_HASH = "RASTRO_METODO_HASH"
+METODO_HASH = os.environ.get(VARIABLE_METODO_HASH, "scrypt:32768:8:1")
+_prefijo_vigente = None
+
+
+def configurar_hash(metodo):
+    global METODO_HASH, _prefijo_vigente
+    METODO_HASH = metodo
+    _prefijo_vigente = None
+
+
+def generar_hash(clave):
+    return generate_password_hash(clave, method=METODO_HASH)
+
+
+def hash_desactualizado(clave_hash):
+    """Indica si un hash se generó con otros parámetros que los de METODO_HASH."""
+    global _prefijo_vigente
+    if _prefijo_vigente is None:
+        # werkzeug completa los parámetros omitidos ("scrypt" -> "scrypt:32768:8:1"), así
+        # que se compara con lo que escribe de verdad y no con el texto configurado
+        _prefijo_vigente = generar_hash("").split("$", 1)[0]
+    return clave_hash.split("$", 1)[0] != _prefijo_vigente
+
+# --- ÍNDICE DE CORREOS ---
+# usuarios_por_correo/{correo normalizado} -> {'usuario_id': ...}
+# El ID del documento es el propio correo, así que buscar un usuario es leer un documento
+# por clave en lugar de consultar la colección, y como dos documentos no pueden tener el
+# mismo ID, crearlo en la misma transacción que el usuario impide correos duplicados.
+# Los usuarios registrados antes de este índice se indexan la primera vez que inician
+# sesión (o todos de una vez con migrar_indice_correos.py).
+#
+# Mientras quedan usuarios sin indexar, un correo que no está en el índice se busca además
+# con la consulta anterior. migrar_indice_correos.py marca el índice como completo en
+# configuracion/indice_correos al terminar; desde entonces un correo desconocido (p. ej. uno
+# mal escrito al iniciar sesión) cuesta una sola lectura. La marca se lee una vez por proceso.
+_indice_completo = None
+
+
+class CorreoYaRegistrado(Exception):
+    pass
+
+
+def normalizar_correo(correo):
+    return (correo or "").strip().lower()
+
+
+def referencia_indice_correo(correo):
+    # Un ID de documento no puede contener '/', así que el correo se codifica
+    return db.collection('usuarios_por_correo').document(quote(normalizar_correo(correo), safe="@.+-_"))
+
+
+@base_datos.transactional
+def _crear_usuario_en_transaccion(transaccion, indice_ref, usuario_ref, nuevo_usuario):
+    if indice_ref.get(transaction=transaccion).exists:
+        raise CorreoYaRegistrado()
+    transaccion.create(usuario_ref, nuevo_usuario)
+    transaccion.create(indice_ref, {'usuario_id': usuario_ref.id})
+
+
+@base_datos.transactional
+def _indexar_en_transaccion(transaccion, indice_ref, usuario_id):
+    """Indexa un usuario antiguo; si otro proceso ya lo hizo, no cambia nada."""
+    if not indice_ref.get(transaction=transaccion).exists:
+        transaccion.create(indice_ref, {'usuario_id': usuario_id})
+
+
+def indice_correos_completo():
+    """Indica si ya no quedan usuarios fuera del índice, es decir, si sobra la consulta anterior."""
+    global _indice_completo
+    if _indice_completo is None:
+        marca = db.collection('configuracion').document('indice_correos').get()
+        _indice_completo = marca.exists and bool(marca.to_dict().get('completo'))
+    return _indice_completo
+
+
+def _buscar_por_consulta(correo):
+    """Búsqueda anterior al índice, solo para usuarios aún no indexados."""
+    consulta = db.collection('usuarios').where(filter=base_datos.FieldFilter("correo", "==", correo)).limit(1).stream()
+    resultados = list(consulta)
+    return resultados[0] if resultados else None
+
+
+@metricas.medir('firestore.buscar_usuario')
+def buscar_usuario(correo):
+    """Devuelve el snapshot del usuario con ese correo, o None si no existe."""
+    indice = referencia_indice_correo(correo).get()
+    if indice.exists:
+        usuario_doc = db.collection('usuarios').document(indice.get('usuario_id')).get()
+        return usuario_doc if usuario_doc.exists else None
+    if indice_correos_completo():
+        return None
+
+    usuario_doc = _buscar_por_consulta(correo)
+    if usuario_doc is not None:
+        _indexar_en_transaccion(db.transaction(), referencia_indice_correo(correo), usuario_doc.id)
+    return usuario_doc
+
 
 def registrar_usuario(nombre, correo, clave, rol='usuario'):
     """
     Registra un nuevo usuario en la colección 'usuarios' de Firestore.
     Almacena la contraseña de forma segura y asigna el rol especificado.
     """
+    correo = normalizar_correo(correo)
     try:
-        # Verifica eficientemente si el correo ya existe
-        usuarios_ref = db.collection('usuarios')
-        consulta = usuarios_ref.where(filter=FieldFilter("correo", "==", correo)).limit(1).stream()
-
-        if len(list(consulta)) > 0:
+        # El índice lo comprueba la transacción; un usuario antiguo aún no indexado solo se
+        # encuentra con la consulta, y solo hace falta hasta que se complete la migración
+        if not indice_correos_completo() and _buscar_por_consulta(correo) is not None:
             return False, "El correo electrónico ya está registrado."
 
         # Hashea la contraseña para no guardarla en texto plano
-        clave_hasheada = generate_password_hash(clave)
+        clave_hasheada = generar_hash(clave)
 
         # Crea el documento del nuevo usuario con el rol proporcionado
         nuevo_usuario = {
@@ -28,16 +134,28 @@ def registrar_usuario(nombre, correo, clave, rol='usuario'):
             'correo': correo,
             'clave_hash': clave_hasheada,
             'rol': rol,
-            'fecha_registro': firestore.SERVER_TIMESTAMP
+            'fecha_registro': base_datos.SERVER_TIMESTAMP
         }
 
-        # Agrega el nuevo usuario a la base de datos
-        usuarios_ref.add(nuevo_usuario)
+        # El usuario y su entrada en el índice se crean juntos o no se crea ninguno
+        _crear_usuario_en_transaccion(db.transaction(), referencia_indice_correo(correo),
+                                      db.collection('usuarios').document(), nuevo_usuario)
         return True, "Registro exitoso."
+    except CorreoYaRegistrado:
+        return False, "El correo electrónico ya está registrado."
     except Exception as e:
         return False, f"Ocurrió un error en el registro: {e}"
 
 
+@base_datos.transactional
+def _rehashear_en_transaccion(transaccion, usuario_ref, hash_anterior, hash_nuevo):
+    # Si la clave cambió mientras tanto (p. ej. la editó un admin), no se pisa
+    usuario_doc = usuario_ref.get(transaction=transaccion)
+    if usuario_doc.exists and usuario_doc.to_dict().get('clave_hash') == hash_anterior:
+        transaccion.update(usuario_ref, {'clave_hash': hash_nuevo})
+
+
+@metricas.medir('auth.login')
 def verificar_usuario(correo, clave):
     """
     Verifica las credenciales de un usuario.
@@ -45,14 +163,10 @@ def verificar_usuario(correo, clave):
     Si no, devuelve None.
     """
     try:
-        usuarios_ref = db.collection('usuarios')
-        consulta = usuarios_ref.where(filter=FieldFilter("correo", "==", correo)).limit(1).stream()
-        resultados = list(consulta)
-
-        if not resultados:
+        usuario_doc = buscar_usuario(correo)
+        if usuario_doc is None:
             return None, "Correo o contraseña incorrectos."
 
-        usuario_doc = resultados[0]
         usuario_data = usuario_doc.to_dict()
         
         # Añadimos el ID del documento a los datos, será útil para futuras actualizaciones
@@ -61,7 +175,15 @@ def verificar_usuario(correo, clave):
         clave_guardada_hash = usuario_data.get('clave_hash')
 
         # Compara de forma segura la contraseña proporcionada con el hash guardado
-        if check_password_hash(clave_guardada_hash, clave):
+        with metricas.medir('auth.hash'):
+            clave_correcta = check_password_hash(clave_guardada_hash, clave)
+        if clave_correcta:
+            # Solo ahora se conoce la clave en claro: si el hash tiene parámetros viejos se regenera
+            if hash_desactualizado(clave_guardada_hash):
+                try:
+                    _rehashear_en_transaccion(db.transaction(), usuario_doc.reference, clave_guardada_hash, generar_hash(clave))
+                except Exception as e:
+                    print(f"No se pudo actualizar el hash de la contraseña: {e}")
             # Devolvemos todos los datos del usuario si la clave es correcta
             return usuario_data, "Inicio de sesión exitoso."
         else:
@@ -70,6 +192,38 @@ def verificar_usuario(correo, clave):
         return None, f"Ocurrió un error en la verificación: {e}"
 
 
+@base_datos.transactional
+def _actualizar_en_transaccion(transaccion, usuario_ref, datos_actualizados):
+    """
+    Actualiza el usuario y, si cambia su correo, mueve su entrada del índice en la misma transacción.
+    Si cambia la contraseña o el rol, sube version_sesion para invalidar las sesiones guardadas
+    (ver sesion.py); devuelve True en ese caso.
+    """
+    usuario_doc = usuario_ref.get(transaction=transaccion)
+    if not usuario_doc.exists:
+        raise ValueError("El usuario no existe.")
+    usuario_actual = usuario_doc.to_dict()
+    invalida_sesiones = 'clave_hash' in datos_actualizados or (
+        'rol' in datos_actualizados and datos_actualizados['rol'] != usuario_actual.get('rol'))
+    if invalida_sesiones:
+        datos_actualizados['version_sesion'] = usuario_actual.get('version_sesion', 0) + 1
+    correo_anterior = usuario_actual.get('correo')
+    correo_nuevo = datos_actualizados.get('correo')
+    if correo_nuevo is not None and normalizar_correo(correo_nuevo) != normalizar_correo(correo_anterior):
+        indice_nuevo = referencia_indice_correo(correo_nuevo)
+        if indice_nuevo.get(transaction=transaccion).exists:
+            raise CorreoYaRegistrado()
+        # La entrada del correo anterior solo se borra si es de este usuario: un usuario
+        # antiguo aún sin indexar podría compartir correo con otro que sí lo está
+        indice_anterior = referencia_indice_correo(correo_anterior)
+        entrada_anterior = indice_anterior.get(transaction=transaccion)
+        if entrada_anterior.exists and entrada_anterior.to_dict().get('usuario_id') == usuario_ref.id:
+            transaccion.delete(indice_anterior)
+        transaccion.create(indice_nuevo, {'usuario_id': usuario_ref.id})
+    transaccion.update(usuario_ref, datos_actualizados)
+    return invalida_sesiones
+
+
 def actualizar_usuario(usuario_id, datos_actualizados):
     """
     Actualiza los datos de un usuario. Si se incluye una nueva clave,
@@ -81,10 +235,40 @@ def actualizar_usuario(usuario_id, datos_actualizados):
             nueva_clave = datos_actualizados.pop('clave') # La sacamos del diccionario
             # Solo hashear si el campo de nueva clave no está vacío
             if nueva_clave:
-                datos_actualizados['clave_hash'] = generate_password_hash(nueva_clave)
+                datos_actualizados['clave_hash'] = generar_hash(nueva_clave)
+
+        if 'correo' in datos_actualizados:
+            datos_actualizados['correo'] = normalizar_correo(datos_actualizados['correo'])
+            # Los usuarios indexados los rechaza la transacción; la consulta es para los demás
+            if not indice_correos_completo():
+                otro = _buscar_por_consulta(datos_actualizados['correo'])
+                if otro is not None and otro.id != usuario_id:
+                    return False, "El correo electrónico ya está registrado."
 
         usuario_ref = db.collection('usuarios').document(usuario_id)
-        usuario_ref.update(datos_actualizados)
+        if _actualizar_en_transaccion(db.transaction(), usuario_ref, datos_actualizados):
+            # Las sesiones de otros equipos caen al comprobarse; la de este se borra ya
+            sesion.olvidar_sesion(usuario_id)
         return True, "Usuario actualizado correctamente."
+    except CorreoYaRegistrado:
+        return False, "El correo electrónico ya está registrado."
     except Exception as e:
-        return False, f"Ocurrió un error al actualizar el usuario: {e}"
\ No newline at end of file
+        return False, f"Ocurrió un error al actualizar el usuario: {e}"
+
+
+def comprobar_sesion(datos_sesion):
+    """
+    Comprueba una sesión guardada contra el usuario: una lectura por clave, sin hash.
+    Devuelve (datos_usuario, mensaje), con datos_usuario None si la sesión ya no vale
+    porque el usuario no existe o cambió su contraseña o su rol desde que se guardó.
+    Los errores de red se propagan: la sesión no se descarta por no poder comprobarla.
+    """
+    usuario_doc = db.collection('usuarios').document(datos_sesion['id']).get()
+    if not usuario_doc.exists:
+        return None, "El usuario ya no existe."
+    usuario_data = usuario_doc.to_dict()
+    if (usuario_data.get('version_sesion', 0) != datos_sesion.get('version_sesion', 0)
+            or usuario_data.get('rol') != datos_sesion.get('rol')):
+        return None, "Tu contraseña o tus permisos cambiaron. Inicia sesión de nuevo."
+    usuario_data['id'] = usuario_doc.id
+    return usuario_data, "Sesión vigente."
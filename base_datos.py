@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+
+# --- SELECCIÓN DEL BACKEND DE DATOS ---
+# Todos los módulos obtienen su cliente con obtener_db() en lugar de firestore.client(),
+# así la misma aplicación (o un benchmark) puede correr contra:
+#   - "firestore"        el proyecto real (por defecto; requiere Firebase inicializado)
+#   - "memoria"          base_datos_local sin persistencia
+#   - "sqlite:<ruta>"    base_datos_local guardando los datos en un archivo SQLite
+# Se elige con la variable de entorno RASTRO_BASE_DATOS o con configurar() antes del
+# primer uso. Los valores especiales (SERVER_TIMESTAMP, Increment, FieldFilter...) se
+# piden también a este módulo, porque cada backend tiene los suyos.
+
+VARIABLE_ENTORNO = "RASTRO_BASE_DATOS"
+
+_backend = os.environ.get(VARIABLE_ENTORNO, "firestore")
+_db = None
+# La carga de login.py y los trabajos en segundo plano pueden pedir el cliente a la vez
+_lock_db = threading.Lock()
+
+# --- CANAL DE FIRESTORE ---
+# Opciones del canal gRPC, compartido por todas las consultas, escrituras y listeners del
+# proceso. Los keepalive detectan antes una conexión caída (p. ej. tras suspender el equipo)
+# sin esperar al timeout de TCP; no se envían pings sin llamadas activas porque Google cierra
+# las conexiones que los mandan demasiado seguido. Se cambian con configurar_canal().
+OPCIONES_CANAL = {
+    'grpc.keepalive_time_ms': 30000,
+    'grpc.keepalive_timeout_ms': 10000,
+    'grpc.keepalive_permit_without_calls': 0,
+    'grpc.http2.max_pings_without_data': 0,
+    # Sin límite de tamaño de mensaje, como la librería por defecto
+    'grpc.max_send_message_length': -1,
+    'grpc.max_receive_message_length': -1,
+}
+# Versión de google-cloud-firestore con la que se comprobó _usar_opciones_canal
+VERSION_FIRESTORE_COMPROBADA = "2.34."
+# El precalentamiento es un solo intento: sin red no debe quedarse reintentando
+TIEMPO_MAXIMO_PRECALENTAMIENTO_S = 10
+
+
+def configurar(backend):
+    """Cambia el backend; debe llamarse antes de importar los módulos que usan la base de datos."""
+    global _backend, _db
+    if _db is not None and backend != _backend:
+        raise RuntimeError(f"La base de datos ya se inició con el backend '{_backend}'.")
+    _backend = backend
+
+
+def configurar_canal(**opciones):
+    """Cambia opciones del canal gRPC, p. ej. configurar_canal(**{'grpc.keepalive_time_ms': 60000}); antes del primer uso."""
+    if _db is not None:
+        raise RuntimeError("El cliente de la base de datos ya se creó con las opciones anteriores.")
+    OPCIONES_CANAL.update(opciones)
+
+
+def es_local():
+    return _backend != "firestore"
+
+
+def identificador():
+    """
+    Identifica los datos del backend activo (el proyecto o el archivo SQLite), p. ej. para
+    no mezclar copias locales de dos bases distintas. None si los datos no persisten.
+    """
+    if _backend == "firestore":
+        return f"firestore:{obtener_db().project}"
+    if _backend.startswith("sqlite:"):
+        return f"sqlite:{os.path.abspath(_backend[len('sqlite:'):])}"
+    return None
+
+
+def obtener_db():
+    """Devuelve el cliente compartido del backend configurado (se crea en la primera llamada)."""
+    global _db
+    with _lock_db:
+        if _db is None:
+            if _backend == "firestore":
+                _db = _crear_cliente_firestore()
+            elif _backend == "memoria":
+                from base_datos_local import ClienteLocal
+                _db = ClienteLocal()
+            elif _backend.startswith("sqlite:"):
+                from base_datos_local import ClienteLocal
+                _db = ClienteLocal(_backend[len("sqlite:"):])
+            else:
+                raise ValueError(f"Backend de base de datos desconocido: '{_backend}'.")
+        return _db
+
+
+def _crear_cliente_firestore():
+    from firebase_admin import firestore
+    return _usar_opciones_canal(firestore.client())
+
+
+def _usar_opciones_canal(cliente):
+    """
+    La librería no acepta opciones del canal: lo crea en la primera llamada con las suyas
+    (BaseClient._firestore_api_helper). Se le adelanta uno con OPCIONES_CANAL, construido
+    igual; eso obliga a usar atributos privados del cliente, así que solo se hace con la
+    versión comprobada (VERSION_FIRESTORE_COMPROBADA, fijada en requirements.txt).
+    """
+    from google.cloud import firestore as firestore_cloud
+    if not firestore_cloud.__version__.startswith(VERSION_FIRESTORE_COMPROBADA):
+        print(f"ADVERTENCIA: google-cloud-firestore {firestore_cloud.__version__} no es la versión comprobada "
+              f"({VERSION_FIRESTORE_COMPROBADA}x); se usa su canal por defecto.")
+        return cliente
+    if cliente._emulator_host is not None:
+        return cliente
+    from google.cloud.firestore_v1.services.firestore import client as firestore_client
+    from google.cloud.firestore_v1.services.firestore.transports.grpc import FirestoreGrpcTransport
+    canal = FirestoreGrpcTransport.create_channel(cliente._target, credentials=cliente._credentials,
+                                                  options=list(OPCIONES_CANAL.items()))
+    # client_info va en los parámetros del transporte y del cliente, no en el módulo de la librería
+    transporte = FirestoreGrpcTransport(host=cliente._target, channel=canal, client_info=cliente._client_info)
+    cliente._transport = transporte
+    cliente._firestore_api_internal = firestore_client.FirestoreClient(
+        transport=transporte, client_options=cliente._client_options, client_info=cliente._client_info)
+    return cliente
+
+
+def precalentar():
+    """
+    Abre la conexión con Firestore (canal gRPC, TLS y token de acceso) con una lectura del
+    documento que la galería pide primero, para que la primera consulta real no pague ese
+    costo. Pensado para correr en segundo plano mientras se muestra el login.
+    """
+    if es_local():
+        return
+    import metricas
+    inicio = time.perf_counter()
+    try:
+        obtener_db().collection('configuracion').document('subasta').get(retry=None, timeout=TIEMPO_MAXIMO_PRECALENTAMIENTO_S)
+    except Exception as e:
+        print(f"No se pudo precalentar la conexión con Firestore: {e}")
+        return
+    metricas.observar('firestore.precalentamiento', (time.perf_counter() - inicio) * 1000)
+
+
+def _valores_firestore():
+    from firebase_admin import firestore
+    from google.api_core import exceptions
+    from google.cloud.firestore_v1.base_query import FieldFilter
+    return {
+        'SERVER_TIMESTAMP': firestore.SERVER_TIMESTAMP,
+        'DELETE_FIELD': firestore.DELETE_FIELD,
+        'Increment': firestore.Increment,
+        'ArrayUnion': firestore.ArrayUnion,
+        'ArrayRemove': firestore.ArrayRemove,
+        'FieldFilter': FieldFilter,
+        'ASCENDING': firestore.Query.ASCENDING,
+        'DESCENDING': firestore.Query.DESCENDING,
+        'transactional': firestore.transactional,
+        # Errores con los que el servidor rechaza una transacción por contención
+        'ERRORES_DE_CONFLICTO': (exceptions.Aborted, exceptions.Conflict),
+        # Errores pasajeros tras los que una escritura idempotente puede repetirse
+        'ERRORES_TRANSITORIOS': (exceptions.Aborted, exceptions.DeadlineExceeded, exceptions.InternalServerError,
+                                 exceptions.ResourceExhausted, exceptions.ServiceUnavailable),
+    }
+
+
+def _valores_locales():
+    import base_datos_local as local
+    return {
+        'SERVER_TIMESTAMP': local.SERVER_TIMESTAMP,
+        'DELETE_FIELD': local.DELETE_FIELD,
+        'Increment': local.Increment,
+        'ArrayUnion': local.ArrayUnion,
+        'ArrayRemove': local.ArrayRemove,
+        'FieldFilter': local.FieldFilter,
+        'ASCENDING': local.ASCENDING,
+        'DESCENDING': local.DESCENDING,
+        'transactional': local.transactional,
+        'ERRORES_DE_CONFLICTO': (local.TransaccionAbortada,),
+        'ERRORES_TRANSITORIOS': (local.TransaccionAbortada,),
+    }
+
+
+def __getattr__(nombre):
+    # base_datos.SERVER_TIMESTAMP, base_datos.FieldFilter, etc. según el backend activo
+    valores = _valores_locales() if es_local() else _valores_firestore()
+    if nombre in valores:
+        return valores[nombre]
+    raise AttributeError(f"module 'base_datos' has no attribute '{nombre}'")
@@ -0,0 +1,773 @@
+import copy
+import enum
+import functools
+import pickle
+import queue
+import random
+import sqlite3
+import string
+import threading
+import time
+from datetime import datetime, timezone
+
+# --- BACKEND LOCAL (EN MEMORIA O SQLITE) ---
+# Reproduce el subconjunto de la API de Firestore que usa la aplicación: colecciones y
+# subcolecciones, consultas con filtros, orden y cursores, lotes, transacciones y
+# listeners (on_snapshot). Sirve para pruebas de carga, benchmarks y simulaciones sin
+# un proyecto de Firebase ni serviceAccountKey.json. Se elige con base_datos.py.
+#
+# Todos los datos viven en memoria; con una ruta de archivo, cada escritura confirmada
+# se guarda también en SQLite y se vuelve a cargar al abrir el cliente.
+
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+
+_CARACTERES_ID = string.ascii_letters + string.digits
+
+
+class TransaccionAbortada(Exception):
+    """Otra escritura cambió un documento leído por la transacción antes de confirmarla."""
+
+
+class DocumentoNoEncontrado(Exception):
+    """update() sobre un documento que no existe."""
+
+
+class DocumentoYaExiste(Exception):
+    """create() sobre un documento que ya existe."""
+
+
+# --- VALORES ESPECIALES (equivalentes a los de firestore) ---
+
+class _Centinela:
+    def __init__(self, descripcion):
+        self.descripcion = descripcion
+
+    def __repr__(self):
+        return f"Centinela({self.descripcion})"
+
+
+SERVER_TIMESTAMP = _Centinela("hora del servidor")
+DELETE_FIELD = _Centinela("borrar campo")
+
+
+class Increment:
+    def __init__(self, value):
+        self.value = value
+
+
+class ArrayUnion:
+    def __init__(self, values):
+        self.values = list(values)
+
+
+class ArrayRemove:
+    def __init__(self, values):
+        self.values = list(values)
+
+
+class FieldFilter:
+    def __init__(self, field_path, op_string, value=None):
+        self.field_path = field_path
+        self.op_string = op_string
+        self.value = value
+
+
+class TipoCambio(enum.Enum):
+    ADDED = 1
+    REMOVED = 2
+    MODIFIED = 3
+
+
+class CambioDocumento:
+    def __init__(self, tipo, documento, old_index, new_index):
+        self.type = tipo
+        self.document = documento
+        self.old_index = old_index
+        self.new_index = new_index
+
+
+# --- COMPARACIÓN DE VALORES ---
+# Mismo orden entre tipos que Firestore: nulo < booleano < número < fecha < texto
+# < bytes < referencia < arreglo < mapa.
+
+def _clave_valor(valor):
+    if valor is None:
+        return (0,)
+    if isinstance(valor, bool):
+        return (1, valor)
+    if isinstance(valor, (int, float)):
+        return (2, valor)
+    if isinstance(valor, datetime):
+        if valor.tzinfo is None:
+            valor = valor.replace(tzinfo=timezone.utc)
+        return (3, valor)
+    if isinstance(valor, str):
+        return (4, valor)
+    if isinstance(valor, bytes):
+        return (5, valor)
+    if isinstance(valor, ReferenciaDocumento):
+        return (6, valor.path)
+    if isinstance(valor, (list, tuple)):
+        return (7, tuple(_clave_valor(v) for v in valor))
+    if isinstance(valor, dict):
+        return (8, tuple((k, _clave_valor(v)) for k, v in sorted(valor.items())))
+    return (9, repr(valor))
+
+
+def _comparar(a, b):
+    clave_a, clave_b = _clave_valor(a), _clave_valor(b)
+    return (clave_a > clave_b) - (clave_a < clave_b)
+
+
+_FALTA = object()
+
+
+def _leer_campo(datos, ruta_campo):
+    valor = datos
+    for parte in ruta_campo.split('.'):
+        if not isinstance(valor, dict) or parte not in valor:
+            return _FALTA
+        valor = valor[parte]
+    return valor
+
+
+def _cumple_filtro(datos, filtro):
+    valor = _leer_campo(datos, filtro.field_path)
+    if valor is _FALTA:
+        return False
+    op, esperado = filtro.op_string, filtro.value
+    if op == '==':
+        return _comparar(valor, esperado) == 0
+    if op == '!=':
+        return valor is not None and _comparar(valor, esperado) != 0
+    if op in ('<', '<=', '>', '>='):
+        # Las desigualdades solo comparan valores del mismo tipo
+        if _clave_valor(valor)[0] != _clave_valor(esperado)[0]:
+            return False
+        resultado = _comparar(valor, esperado)
+        return {'<': resultado < 0, '<=': resultado <= 0, '>': resultado > 0, '>=': resultado >= 0}[op]
+    if op == 'in':
+        return any(_comparar(valor, v) == 0 for v in esperado)
+    if op == 'not-in':
+        return valor is not None and all(_comparar(valor, v) != 0 for v in esperado)
+    if op == 'array_contains':
+        return isinstance(valor, list) and any(_comparar(v, esperado) == 0 for v in valor)
+    if op == 'array_contains_any':
+        return isinstance(valor, list) and any(_comparar(v, e) == 0 for v in valor for e in esperado)
+    raise ValueError(f"Operador de filtro no soportado: {op}")
+
+
+# --- APLICACIÓN DE ESCRITURAS ---
+
+def _resolver(valor, actual, ahora):
+    """Valor final de un campo a partir del valor escrito y del que había antes."""
+    if valor is SERVER_TIMESTAMP:
+        return ahora
+    if isinstance(valor, Increment):
+        es_numero = isinstance(actual, (int, float)) and not isinstance(actual, bool)
+        return (actual if es_numero else 0) + valor.value
+    if isinstance(valor, ArrayUnion):
+        resultado = list(actual) if isinstance(actual, list) else []
+        for v in valor.values:
+            if not any(_comparar(v, existente) == 0 for existente in resultado):
+                resultado.append(copy.deepcopy(v))
+        return resultado
+    if isinstance(valor, ArrayRemove):
+        resultado = actual if isinstance(actual, list) else []
+        return [v for v in resultado if not any(_comparar(v, quitar) == 0 for quitar in valor.values)]
+    if isinstance(valor, dict):
+        # Los mapas pueden contener a su vez valores especiales
+        return {k: _resolver(v, _FALTA, ahora) for k, v in valor.items() if v is not DELETE_FIELD}
+    return copy.deepcopy(valor)
+
+
+def _mezclar(destino, datos, ahora):
+    """set(merge=True): los mapas se mezclan campo a campo en lugar de reemplazarse."""
+    for campo, valor in datos.items():
+        if valor is DELETE_FIELD:
+            destino.pop(campo, None)
+        elif isinstance(valor, dict) and isinstance(destino.get(campo), dict):
+            _mezclar(destino[campo], valor, ahora)
+        else:
+            destino[campo] = _resolver(valor, destino.get(campo, _FALTA), ahora)
+
+
+def _actualizar_campos(destino, datos, ahora):
+    """update(): cada clave es una ruta con puntos y su valor reemplaza al anterior."""
+    for ruta_campo, valor in datos.items():
+        partes = ruta_campo.split('.')
+        contenedor = destino
+        for parte in partes[:-1]:
+            if not isinstance(contenedor.get(parte), dict):
+                contenedor[parte] = {}
+            contenedor = contenedor[parte]
+        campo = partes[-1]
+        if valor is DELETE_FIELD:
+            contenedor.pop(campo, None)
+        else:
+            contenedor[campo] = _resolver(valor, contenedor.get(campo, _FALTA), ahora)
+
+
+def _nuevo_id():
+    return ''.join(random.choice(_CARACTERES_ID) for _ in range(20))
+
+
+class _Registro:
+    __slots__ = ('datos', 'create_time', 'update_time', 'version')
+
+    def __init__(self, datos, create_time, update_time, version):
+        self.datos = datos
+        self.create_time = create_time
+        self.update_time = update_time
+        self.version = version
+
+
+# --- SNAPSHOTS Y REFERENCIAS ---
+
+class SnapshotDocumento:
+    def __init__(self, referencia, registro, read_time):
+        self.reference = referencia
+        self.id = referencia.id
+        self.exists = registro is not None
+        self._datos = registro.datos if registro else None
+        self.create_time = registro.create_time if registro else None
+        self.update_time = registro.update_time if registro else None
+        self.read_time = read_time
+        self._version = registro.version if registro else None
+
+    def to_dict(self):
+        return copy.deepcopy(self._datos) if self.exists else None
+
+    def get(self, ruta_campo):
+        if not self.exists:
+            return None
+        valor = _leer_campo(self._datos, ruta_campo)
+        if valor is _FALTA:
+            raise KeyError(ruta_campo)
+        return copy.deepcopy(valor)
+
+
+class ReferenciaDocumento:
+    def __init__(self, cliente, ruta_coleccion, id_documento):
+        self._cliente = cliente
+        self._ruta_coleccion = ruta_coleccion
+        self.id = id_documento
+        self.path = f"{ruta_coleccion}/{id_documento}"
+
+    def __eq__(self, otra):
+        return isinstance(otra, ReferenciaDocumento) and otra.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    @property
+    def parent(self):
+        return ReferenciaColeccion(self._cliente, self._ruta_coleccion)
+
+    def collection(self, nombre):
+        return ReferenciaColeccion(self._cliente, f"{self.path}/{nombre}")
+
+    def get(self, field_paths=None, transaction=None):
+        if transaction is not None:
+            return transaction._leer_documento(self)
+        return self._cliente._leer(self)
+
+    def set(self, datos, merge=False):
+        return self._cliente._confirmar([('set', self, datos, merge)])[0]
+
+    def create(self, datos):
+        return self._cliente._confirmar([('create', self, datos, False)])[0]
+
+    def update(self, datos):
+        return self._cliente._confirmar([('update', self, datos, False)])[0]
+
+    def delete(self):
+        return self._cliente._confirmar([('delete', self, None, False)])[0]
+
+    def on_snapshot(self, callback):
+        return self._cliente._escuchar(_ConsultaDocumento(self), callback)
+
+
+class Consulta:
+    def __init__(self, cliente, ruta_coleccion, filtros=(), ordenes=(), limite=None, inicio=None, fin=None):
+        self._cliente = cliente
+        self._ruta_coleccion = ruta_coleccion
+        self._filtros = tuple(filtros)
+        self._ordenes = tuple(ordenes)
+        self._limite = limite
+        self._inicio = inicio    # (valores, incluye_igual)
+        self._fin = fin
+
+    def _copiar(self, **cambios):
+        campos = dict(filtros=self._filtros, ordenes=self._ordenes, limite=self._limite, inicio=self._inicio, fin=self._fin)
+        campos.update(cambios)
+        return Consulta(self._cliente, self._ruta_coleccion, **campos)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        filtro = filter if filter is not None else FieldFilter(field_path, op_string, value)
+        return self._copiar(filtros=self._filtros + (filtro,))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copiar(ordenes=self._ordenes + ((field_path, direction),))
+
+    def limit(self, cantidad):
+        return self._copiar(limite=cantidad)
+
+    def _cursor(self, documento_o_valores, incluye_igual):
+        if isinstance(documento_o_valores, SnapshotDocumento):
+            datos = documento_o_valores._datos or {}
+            valores = [_leer_campo(datos, campo) for campo, _ in self._ordenes]
+            # Con un documento, el ID desempata igual que el __name__ implícito de Firestore
+            return (valores + [documento_o_valores.id], incluye_igual)
+        if isinstance(documento_o_valores, dict):
+            return ([_leer_campo(documento_o_valores, campo) for campo, _ in self._ordenes], incluye_igual)
+        return (list(documento_o_valores), incluye_igual)
+
+    def start_at(self, documento_o_valores):
+        return self._copiar(inicio=self._cursor(documento_o_valores, True))
+
+    def start_after(self, documento_o_valores):
+        return self._copiar(inicio=self._cursor(documento_o_valores, False))
+
+    def end_at(self, documento_o_valores):
+        return self._copiar(fin=self._cursor(documento_o_valores, True))
+
+    def end_before(self, documento_o_valores):
+        return self._copiar(fin=self._cursor(documento_o_valores, False))
+
+    def _comparar_con_cursor(self, id_documento, datos, valores):
+        direccion_id = self._ordenes[-1][1] if self._ordenes else ASCENDING
+        claves = list(self._ordenes) + [(None, direccion_id)]
+        for (campo, direccion), esperado in zip(claves, valores):
+            valor = id_documento if campo is None else _leer_campo(datos, campo)
+            resultado = _comparar(valor, esperado)
+            if resultado:
+                return -resultado if direccion == DESCENDING else resultado
+        return 0
+
+    def _ordenar(self, elementos):
+        def comparar(a, b):
+            (id_a, reg_a), (id_b, reg_b) = a, b
+            for campo, direccion in self._ordenes:
+                resultado = _comparar(_leer_campo(reg_a.datos, campo), _leer_campo(reg_b.datos, campo))
+                if resultado:
+                    return -resultado if direccion == DESCENDING else resultado
+            resultado = (id_a > id_b) - (id_a < id_b)
+            if self._ordenes and self._ordenes[-1][1] == DESCENDING:
+                return -resultado
+            return resultado
+        return sorted(elementos, key=functools.cmp_to_key(comparar))
+
+    def _ejecutar(self, documentos):
+        """Aplica la consulta sobre {id: registro} y devuelve la lista ordenada de (id, registro)."""
+        elementos = []
+        for id_documento, registro in documentos.items():
+            if not all(_cumple_filtro(registro.datos, filtro) for filtro in self._filtros):
+                continue
+            # Como en Firestore, un documento sin el campo de orden no aparece en la consulta
+            if any(_leer_campo(registro.datos, campo) is _FALTA for campo, _ in self._ordenes):
+                continue
+            elementos.append((id_documento, registro))
+        elementos = self._ordenar(elementos)
+
+        if self._inicio is not None:
+            valores, incluye_igual = self._inicio
+            elementos = [(i, r) for i, r in elementos
+                         if (self._comparar_con_cursor(i, r.datos, valores) >= 0 if incluye_igual
+                             else self._comparar_con_cursor(i, r.datos, valores) > 0)]
+        if self._fin is not None:
+            valores, incluye_igual = self._fin
+            elementos = [(i, r) for i, r in elementos
+                         if (self._comparar_con_cursor(i, r.datos, valores) <= 0 if incluye_igual
+                             else self._comparar_con_cursor(i, r.datos, valores) < 0)]
+        if self._limite is not None:
+            elementos = elementos[:self._limite]
+        return elementos
+
+    def _referencia(self, id_documento):
+        return ReferenciaDocumento(self._cliente, self._ruta_coleccion, id_documento)
+
+    def stream(self, transaction=None):
+        if transaction is not None:
+            return iter(transaction._leer_consulta(self))
+        return iter(self._cliente._consultar(self))
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction=transaction))
+
+    def on_snapshot(self, callback):
+        return self._cliente._escuchar(self, callback)
+
+
+class ReferenciaColeccion(Consulta):
+    def __init__(self, cliente, ruta_coleccion):
+        super().__init__(cliente, ruta_coleccion)
+        self.id = ruta_coleccion.rsplit('/', 1)[-1]
+
+    def document(self, id_documento=None):
+        return ReferenciaDocumento(self._cliente, self._ruta_coleccion, id_documento or _nuevo_id())
+
+    def add(self, datos, document_id=None):
+        referencia = self.document(document_id)
+        resultado = referencia.create(datos)
+        return resultado, referencia
+
+    def list_documents(self):
+        return [self.document(id_documento) for id_documento in self._cliente._documentos_de(self._ruta_coleccion)]
+
+
+class _ConsultaDocumento:
+    """Adaptador para escuchar un solo documento con la misma maquinaria que las consultas."""
+
+    def __init__(self, referencia):
+        self._referencia_doc = referencia
+        self._ruta_coleccion = referencia._ruta_coleccion
+
+    def _ejecutar(self, documentos):
+        registro = documentos.get(self._referencia_doc.id)
+        return [(self._referencia_doc.id, registro)] if registro else []
+
+    def _referencia(self, id_documento):
+        return self._referencia_doc
+
+
+# --- LOTES Y TRANSACCIONES ---
+
+class LoteEscritura:
+    def __init__(self, cliente):
+        self._cliente = cliente
+        self._escrituras = []
+
+    def set(self, referencia, datos, merge=False):
+        self._escrituras.append(('set', referencia, datos, merge))
+
+    def create(self, referencia, datos):
+        self._escrituras.append(('create', referencia, datos, False))
+
+    def update(self, referencia, datos):
+        self._escrituras.append(('update', referencia, datos, False))
+
+    def delete(self, referencia):
+        self._escrituras.append(('delete', referencia, None, False))
+
+    def __len__(self):
+        return len(self._escrituras)
+
+    def commit(self):
+        escrituras, self._escrituras = self._escrituras, []
+        return self._cliente._confirmar(escrituras)
+
+
+class Transaccion(LoteEscritura):
+    """
+    Transacción optimista: recuerda la versión de cada documento leído y, al confirmar,
+    aborta si alguno cambió. El resultado para el código que la usa es el mismo que con
+    Firestore: la función transaccional se reintenta y, agotados los intentos, falla.
+    """
+
+    def __init__(self, cliente, max_attempts=5):
+        super().__init__(cliente)
+        self._max_attempts = max_attempts
+        self._lecturas = {}
+
+    def _reiniciar(self):
+        self._escrituras = []
+        self._lecturas = {}
+
+    def _leer_documento(self, referencia):
+        if self._escrituras:
+            raise ValueError("Las lecturas de una transacción deben hacerse antes de sus escrituras.")
+        snapshot = self._cliente._leer(referencia)
+        self._lecturas[referencia.path] = snapshot._version
+        return snapshot
+
+    def _leer_consulta(self, consulta):
+        if self._escrituras:
+            raise ValueError("Las lecturas de una transacción deben hacerse antes de sus escrituras.")
+        snapshots = self._cliente._consultar(consulta)
+        for snapshot in snapshots:
+            self._lecturas[snapshot.reference.path] = snapshot._version
+        return snapshots
+
+    def commit(self):
+        escrituras, self._escrituras = self._escrituras, []
+        return self._cliente._confirmar(escrituras, self._lecturas)
+
+
+def transactional(funcion):
+    """Equivalente a firestore.transactional para transacciones locales."""
+    @functools.wraps(funcion)
+    def envoltura(transaccion, *args, **kwargs):
+        ultimo_error = None
+        for _ in range(transaccion._max_attempts):
+            transaccion._reiniciar()
+            try:
+                resultado = funcion(transaccion, *args, **kwargs)
+                transaccion.commit()
+                return resultado
+            except TransaccionAbortada as e:
+                ultimo_error = e
+            except Exception:
+                transaccion._reiniciar()
+                raise
+        raise ValueError(f"No se pudo confirmar la transacción en {transaccion._max_attempts} intentos.") from ultimo_error
+    return envoltura
+
+
+# --- LISTENERS ---
+
+class Escucha:
+    def __init__(self, cliente, consulta, callback):
+        self._cliente = cliente
+        self.consulta = consulta
+        self.callback = callback
+        self.activa = True
+        self.anteriores = []    # [(id, versión)] del último snapshot entregado
+
+    def unsubscribe(self):
+        self.activa = False
+        self._cliente._dejar_de_escuchar(self)
+
+
+# --- CLIENTE ---
+
+class ClienteLocal:
+    """
+    Cliente con la misma forma que firestore.client(). Si 'ruta_sqlite' es None los datos
+    solo existen mientras viva el proceso.
+    """
+
+    def __init__(self, ruta_sqlite=None):
+        self._lock = threading.RLock()
+        self._colecciones = {}  # ruta de colección -> {id: _Registro}
+        self._version = 0
+        self._escuchas = []
+        self._cola_eventos = queue.Queue()
+        self._hilo_eventos = None
+        # Operaciones facturables, para comparar cargas en benchmarks y simulaciones
+        self.estadisticas = {'lecturas': 0, 'escrituras': 0, 'borrados': 0, 'transacciones_abortadas': 0}
+        # Demora artificial de cada lectura y confirmación, para imitar el viaje de ida y vuelta
+        # a Firestore: sin ella las transacciones casi nunca chocan y una simulación de carga
+        # no muestra los conflictos reales
+        self.latencia_s = 0.0
+
+        self._sqlite = None
+        if ruta_sqlite:
+            self._sqlite = sqlite3.connect(ruta_sqlite, check_same_thread=False)
+            self._sqlite.execute("CREATE TABLE IF NOT EXISTS documentos "
+                                 "(coleccion TEXT NOT NULL, id TEXT NOT NULL, registro BLOB NOT NULL, PRIMARY KEY (coleccion, id))")
+            self._sqlite.commit()
+            self._cargar_sqlite()
+
+    def _cargar_sqlite(self):
+        for coleccion, id_documento, registro in self._sqlite.execute("SELECT coleccion, id, registro FROM documentos"):
+            datos, create_time, update_time = pickle.loads(registro)
+            self._version += 1
+            self._colecciones.setdefault(coleccion, {})[id_documento] = _Registro(datos, create_time, update_time, self._version)
+
+    # --- API PÚBLICA ---
+
+    def collection(self, ruta):
+        return ReferenciaColeccion(self, ruta)
+
+    def document(self, ruta):
+        ruta_coleccion, id_documento = ruta.rsplit('/', 1)
+        return ReferenciaDocumento(self, ruta_coleccion, id_documento)
+
+    def batch(self):
+        return LoteEscritura(self)
+
+    def transaction(self, max_attempts=5, read_only=False):
+        return Transaccion(self, max_attempts)
+
+    def get_all(self, referencias, field_paths=None, transaction=None):
+        for referencia in referencias:
+            yield referencia.get(transaction=transaction)
+
+    def collections(self):
+        return [ReferenciaColeccion(self, ruta) for ruta in self._colecciones if '/' not in ruta]
+
+    def close(self):
+        if self._sqlite is not None:
+            self._sqlite.close()
+            self._sqlite = None
+
+    # --- LECTURAS ---
+
+    def _documentos_de(self, ruta_coleccion):
+        return self._colecciones.get(ruta_coleccion, {})
+
+    def _simular_red(self):
+        if self.latencia_s:
+            time.sleep(self.latencia_s)
+
+    def _leer(self, referencia):
+        self._simular_red()
+        with self._lock:
+            registro = self._documentos_de(referencia._ruta_coleccion).get(referencia.id)
+            self.estadisticas['lecturas'] += 1
+            return SnapshotDocumento(referencia, registro, datetime.now(timezone.utc))
+
+    def _consultar(self, consulta):
+        self._simular_red()
+        with self._lock:
+            elementos = consulta._ejecutar(self._documentos_de(consulta._ruta_coleccion))
+            # Firestore cobra al menos una lectura por consulta, aunque no devuelva nada
+            self.estadisticas['lecturas'] += max(1, len(elementos))
+            ahora = datetime.now(timezone.utc)
+            return [SnapshotDocumento(consulta._referencia(i), r, ahora) for i, r in elementos]
+
+    # --- ESCRITURAS ---
+
+    def _confirmar(self, escrituras, lecturas=None):
+        """Aplica un grupo de escrituras de forma atómica; devuelve la hora de cada una."""
+        self._simular_red()
+        with self._lock:
+            if lecturas:
+                for ruta, version in lecturas.items():
+                    ruta_coleccion, id_documento = ruta.rsplit('/', 1)
+                    registro = self._documentos_de(ruta_coleccion).get(id_documento)
+                    if (registro.version if registro else None) != version:
+                        self.estadisticas['transacciones_abortadas'] += 1
+                        raise TransaccionAbortada(f"El documento {ruta} cambió durante la transacción.")
+
+            ahora = datetime.now(timezone.utc)
+            # Se calcula todo sobre copias y solo al final se publica, para que un error no deje el lote a medias
+            nuevos = {}
+            for tipo, referencia, datos, merge in escrituras:
+                clave = (referencia._ruta_coleccion, referencia.id)
+                if clave in nuevos:
+                    actual = nuevos[clave]
+                else:
+                    actual = self._documentos_de(referencia._ruta_coleccion).get(referencia.id)
+                    actual = _Registro(copy.deepcopy(actual.datos), actual.create_time, actual.update_time, actual.version) if actual else None
+
+                if tipo == 'delete':
+                    nuevos[clave] = None
+                    continue
+                if tipo == 'create' and actual is not None:
+                    raise DocumentoYaExiste(f"El documento {referencia.path} ya existe.")
+                if tipo == 'update' and actual is None:
+                    raise DocumentoNoEncontrado(f"No existe el documento {referencia.path}.")
+
+                if tipo == 'update':
+                    contenido = actual.datos
+                    _actualizar_campos(contenido, datos, ahora)
+                elif merge:
+                    contenido = actual.datos if actual else {}
+                    _mezclar(contenido, datos, ahora)
+                else:
+                    contenido = _resolver(datos, _FALTA, ahora)
+
+                create_time = actual.create_time if actual else ahora
+                nuevos[clave] = _Registro(contenido, create_time, ahora, None)
+
+            colecciones_tocadas = set()
+            for (ruta_coleccion, id_documento), registro in nuevos.items():
+                documentos = self._colecciones.setdefault(ruta_coleccion, {})
+                if registro is None:
+                    documentos.pop(id_documento, None)
+                    self.estadisticas['borrados'] += 1
+                else:
+                    self._version += 1
+                    registro.version = self._version
+                    documentos[id_documento] = registro
+                    self.estadisticas['escrituras'] += 1
+                colecciones_tocadas.add(ruta_coleccion)
+
+            self._persistir(nuevos)
+            self._notificar(colecciones_tocadas)
+            return [ahora] * len(escrituras)
+
+    def _persistir(self, nuevos):
+        if self._sqlite is None or not nuevos:
+            return
+        with self._sqlite:
+            for (ruta_coleccion, id_documento), registro in nuevos.items():
+                if registro is None:
+                    self._sqlite.execute("DELETE FROM documentos WHERE coleccion = ? AND id = ?", (ruta_coleccion, id_documento))
+                else:
+                    blob = pickle.dumps((registro.datos, registro.create_time, registro.update_time))
+                    self._sqlite.execute("INSERT OR REPLACE INTO documentos (coleccion, id, registro) VALUES (?, ?, ?)",
+                                         (ruta_coleccion, id_documento, blob))
+
+    # --- LISTENERS ---
+    # Como en Firestore, los callbacks se ejecutan en un hilo propio y nunca en el que escribe.
+
+    def _escuchar(self, consulta, callback):
+        escucha = Escucha(self, consulta, callback)
+        with self._lock:
+            self._escuchas.append(escucha)
+            self._evaluar(escucha, inicial=True)
+        return escucha
+
+    def _dejar_de_escuchar(self, escucha):
+        with self._lock:
+            if escucha in self._escuchas:
+                self._escuchas.remove(escucha)
+
+    def _notificar(self, colecciones_tocadas):
+        for escucha in self._escuchas:
+            if escucha.consulta._ruta_coleccion in colecciones_tocadas:
+                self._evaluar(escucha)
+
+    def _evaluar(self, escucha, inicial=False):
+        """Compara el resultado actual de la consulta con el último entregado (con el lock tomado)."""
+        elementos = escucha.consulta._ejecutar(self._documentos_de(escucha.consulta._ruta_coleccion))
+        actuales = [(i, r.version) for i, r in elementos]
+        if not inicial and actuales == escucha.anteriores:
+            return
+
+        ahora = datetime.now(timezone.utc)
+        snapshots = [SnapshotDocumento(escucha.consulta._referencia(i), r, ahora) for i, r in elementos]
+        indices_anteriores = {id_doc: (indice, version) for indice, (id_doc, version) in enumerate(escucha.anteriores)}
+        indices_actuales = {id_doc: indice for indice, (id_doc, _) in enumerate(actuales)}
+
+        cambios = []
+        for id_doc, (indice, _) in indices_anteriores.items():
+            if id_doc not in indices_actuales:
+                eliminado = SnapshotDocumento(escucha.consulta._referencia(id_doc), None, ahora)
+                cambios.append(CambioDocumento(TipoCambio.REMOVED, eliminado, indice, -1))
+        for indice, (id_doc, version) in enumerate(actuales):
+            if id_doc not in indices_anteriores:
+                cambios.append(CambioDocumento(TipoCambio.ADDED, snapshots[indice], -1, indice))
+            elif indices_anteriores[id_doc][1] != version:
+                cambios.append(CambioDocumento(TipoCambio.MODIFIED, snapshots[indice], indices_anteriores[id_doc][0], indice))
+        escucha.anteriores = actuales
+        self.estadisticas['lecturas'] += max(1, len(cambios)) if inicial else len(cambios)
+
+        if isinstance(escucha.consulta, _ConsultaDocumento) and not snapshots:
+            # Un listener de documento siempre recibe su snapshot, aunque el documento no exista
+            snapshots = [SnapshotDocumento(escucha.consulta._referencia_doc, None, ahora)]
+        self._cola_eventos.put((escucha, snapshots, cambios, ahora))
+        self._arrancar_hilo_eventos()
+
+    def _arrancar_hilo_eventos(self):
+        if self._hilo_eventos is None:
+            self._hilo_eventos = threading.Thread(target=self._entregar_eventos, name="local-listeners", daemon=True)
+            self._hilo_eventos.start()
+
+    def _entregar_eventos(self):
+        while True:
+            escucha, snapshots, cambios, read_time = self._cola_eventos.get()
+            if not escucha.activa:
+                continue
+            try:
+                escucha.callback(snapshots, cambios, read_time)
+            except Exception as e:
+                print(f"Error en un listener local: {e}")
+
+    def esperar_listeners(self, timeout=5):
+        """Espera a que se entreguen los eventos pendientes (útil en benchmarks)."""
+        listo = threading.Event()
+        self._cola_eventos.put((_EscuchaCentinela(listo), [], [], None))
+        self._arrancar_hilo_eventos()
+        return listo.wait(timeout)
+
+
+class _EscuchaCentinela:
+    activa = True
+
+    def __init__(self, evento):
+        self.callback = lambda *args: evento.set()
@@ -0,0 +1,109 @@
+"""
+Mide el arranque en frío de login.py, cada repetición en un proceso nuevo:
+
+    python benchmarks/bench_arranque.py [--repeticiones N] [--backend memoria]
+
+  importar login      lo que tarda 'import login', que ya no carga Firebase ni las galerías
+  importar todo       lo que importaba antes login.py antes de pintar nada (firebase_admin,
+                      auth, galeria_admin y galeria_app), como referencia
+  primera ventana     desde que arranca el intérprete hasta que la ventana de selección de
+                      rol está dibujada (requiere pantalla; con Xvfb también vale)
+  carga completa      desde que arranca el intérprete hasta que terminó la carga en segundo
+                      plano y se puede entrar a una galería
+
+Por defecto usa la base local en memoria, para no depender de credenciales ni de la red;
+con --backend firestore se mide también la conexión real.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IMPORTAR_LOGIN = """
+import time
+inicio = time.perf_counter()
+import login
+print(json_resultado(importar_login=time.perf_counter() - inicio))
+"""
+
+_IMPORTAR_TODO = """
+import time
+inicio = time.perf_counter()
+try:
+    import firebase_admin
+except ImportError:
+    pass
+import auth, galeria_admin, galeria_app
+print(json_resultado(importar_todo=time.perf_counter() - inicio))
+"""
+
+# Se reemplaza mainloop para medir y salir en cuanto la ventana se dibuja
+_VENTANA = """
+import time, tkinter as tk
+import login
+
+def medir_y_salir(root, n=0):
+    root.update()
+    primera_ventana = time.time() - ARRANQUE
+    login.modulos()
+    carga_completa = time.time() - ARRANQUE
+    print(json_resultado(primera_ventana=primera_ventana, carga_completa=carga_completa))
+    root.destroy()
+
+tk.Tk.mainloop = medir_y_salir
+login.iniciar_app_escritorio()
+"""
+
+_PREAMBULO = """
+import json, os
+ARRANQUE = float(os.environ['BENCH_ARRANQUE'])
+json_resultado = lambda **tiempos: "RESULTADO " + json.dumps(tiempos)
+"""
+
+
+def _ejecutar(codigo, backend):
+    env = dict(os.environ, RASTRO_BASE_DATOS=backend, BENCH_ARRANQUE=repr(time.time()),
+               RASTRO_DIR_CONFIG=os.path.join(RAIZ, "benchmarks", "resultados", "config-vacia"))
+    salida = subprocess.run([sys.executable, "-c", _PREAMBULO + codigo], cwd=RAIZ, env=env,
+                            capture_output=True, text=True)
+    for linea in salida.stdout.splitlines():
+        if linea.startswith("RESULTADO "):
+            return json.loads(linea[len("RESULTADO "):])
+    raise RuntimeError(salida.stderr.strip().splitlines()[-1] if salida.stderr.strip() else "sin resultado")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=10)
+    parser.add_argument("--backend", default="memoria")
+    args = parser.parse_args()
+
+    mediciones = [("importar login", _IMPORTAR_LOGIN), ("importar todo", _IMPORTAR_TODO)]
+    if os.environ.get("DISPLAY") or sys.platform in ("win32", "darwin"):
+        mediciones.append(("ventana", _VENTANA))
+    else:
+        print("Sin pantalla (DISPLAY): se omiten 'primera ventana' y 'carga completa'.\n")
+
+    tiempos = {}
+    for nombre, codigo in mediciones:
+        for _ in range(args.repeticiones):
+            try:
+                resultado = _ejecutar(codigo, args.backend)
+            except RuntimeError as e:
+                print(f"{nombre}: falló ({e})")
+                break
+            for clave, segundos in resultado.items():
+                tiempos.setdefault(clave, []).append(segundos * 1000)
+
+    print(f"{'medición':<18}{'mediana ms':>11}{'mín ms':>9}{'máx ms':>9}")
+    for clave, valores in tiempos.items():
+        print(f"{clave.replace('_', ' '):<18}{statistics.median(valores):>11.1f}{min(valores):>9.1f}{max(valores):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
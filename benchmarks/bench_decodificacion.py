@@ -0,0 +1,92 @@
+"""
+Compara el tiempo de decodificación y el pico de memoria (RSS) por miniatura de
+las distintas formas de reducir un JPEG, usando las imágenes de assets/:
+
+    python benchmarks/bench_decodificacion.py [--repeticiones N] [imagen.jpg ...]
+
+Cada combinación de método, imagen y tamaño se mide en un proceso nuevo, para
+que el pico de RSS de una no contamine a las demás.
+"""
+import argparse
+import glob
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+TAMANOS = [(150, 150), (250, 250), (700, 500)]
+METODOS = ["sin_draft", "anterior", "draft_previa", "draft_final"]
+
+
+def _decodificar(metodo, contenido, tamano):
+    from io import BytesIO
+    from PIL import Image
+    import servicio_imagenes
+
+    if metodo == "sin_draft":
+        # Decodifica la imagen completa y después la reduce
+        img = Image.open(BytesIO(contenido))
+        img.load()
+        img.thumbnail(tamano, Image.Resampling.LANCZOS, reducing_gap=None)
+        return img
+    if metodo == "anterior":
+        # Lo que hacía obtener_miniatura antes de decodificar_miniatura
+        img = Image.open(BytesIO(contenido))
+        img.thumbnail(tamano, Image.Resampling.LANCZOS)
+        img.load()
+        return img
+    return servicio_imagenes.decodificar_miniatura(contenido, tamano, rapida=(metodo == "draft_previa"))
+
+
+def _rss_maximo_kb():
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo informa en KB y macOS en bytes
+    return maximo / 1024 if sys.platform == "darwin" else maximo
+
+
+def _medir(metodo, ruta, tamano, repeticiones):
+    """Se ejecuta en un proceso hijo: devuelve (tiempos en ms, aumento del pico de RSS en KB)."""
+    import servicio_imagenes  # noqa: F401  Las importaciones no cuentan en la medida
+    with open(ruta, 'rb') as archivo:
+        contenido = archivo.read()
+    base = _rss_maximo_kb()
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        _decodificar(metodo, contenido, tamano)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return tiempos, _rss_maximo_kb() - base
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("imagenes", nargs="*", help="JPEG a medir (por defecto, los de assets/)")
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    rutas = args.imagenes or sorted(glob.glob(os.path.join(RAIZ, "assets", "*.jpg")))
+    if not rutas:
+        sys.exit("No hay imágenes que medir.")
+
+    from PIL import Image
+    contexto = multiprocessing.get_context("spawn")
+    print(f"{'imagen':<28}{'origen':>11}{'destino':>9}  {'método':<14}{'mediana ms':>11}{'p90 ms':>9}{'Δ RSS KB':>10}")
+    with contexto.Pool(1, maxtasksperchild=1) as pool:
+        for ruta in rutas:
+            with Image.open(ruta) as img:
+                origen = f"{img.width}x{img.height}"
+            for tamano in TAMANOS:
+                for metodo in METODOS:
+                    tiempos, rss_kb = pool.apply(_medir, (metodo, ruta, tamano, args.repeticiones))
+                    p90 = statistics.quantiles(tiempos, n=10)[-1] if len(tiempos) > 1 else tiempos[0]
+                    print(f"{os.path.basename(ruta):<28}{origen:>11}{tamano[0]:>5}x{tamano[1]:<3}  {metodo:<14}"
+                          f"{statistics.median(tiempos):>11.2f}{p90:>9.2f}{rss_kb:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Mide cuánto tarda un inicio de sesión (auth.verificar_usuario) con cada coste de hash,
+para elegir el valor de RASTRO_METODO_HASH. Corre contra la base local, sin red, así que
+el tiempo medido es casi todo el de check_password_hash:
+
+    python benchmarks/bench_hash.py [--metodos scrypt:32768:8:1 ...] [--repeticiones N]
+
+La columna 'rehash' es el primer inicio de sesión con cada método, que regenera el hash
+guardado con los parámetros de la fila anterior (en la primera no hay nada que regenerar):
+cuesta dos hashes y solo ocurre una vez por usuario.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+METODOS = [
+    "pbkdf2:sha256:260000",
+    "pbkdf2:sha256:600000",
+    "scrypt:16384:8:1",
+    "scrypt:32768:8:1",
+    "scrypt:65536:8:1",
+]
+CORREO = "bench@ejemplo.com"
+CLAVE = "una clave de prueba"
+
+
+def _iniciar_sesion(auth):
+    inicio = time.perf_counter()
+    usuario_data, msg = auth.verificar_usuario(CORREO, CLAVE)
+    assert usuario_data is not None, msg
+    return (time.perf_counter() - inicio) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--metodos", nargs="+", default=METODOS)
+    parser.add_argument("--repeticiones", type=int, default=30)
+    args = parser.parse_args()
+
+    import base_datos
+    base_datos.configurar("memoria")
+    import auth
+
+    print(f"{'método':<22}{'rehash ms':>10}{'p50 ms':>9}{'p99 ms':>9}")
+    auth.configurar_hash(args.metodos[0])
+    ok, msg = auth.registrar_usuario("Bench", CORREO, CLAVE)
+    assert ok, msg
+    for metodo in args.metodos:
+        auth.configurar_hash(metodo)
+        rehash = _iniciar_sesion(auth)
+        tiempos = [_iniciar_sesion(auth) for _ in range(args.repeticiones)]
+        p99 = statistics.quantiles(tiempos, n=100)[-1] if len(tiempos) > 1 else tiempos[0]
+        print(f"{metodo:<22}{rehash:>10.1f}{statistics.median(tiempos):>9.1f}{p99:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Compara la latencia de buscar un usuario por correo al iniciar sesión: con la consulta
+where('correo', '==', ...) de antes y con la lectura por clave de usuarios_por_correo.
+Corre contra la base local (base_datos_local), sin red:
+
+    python benchmarks/bench_login.py [--usuarios 1000 10000] [--repeticiones N]
+
+Solo se mide la búsqueda: la comprobación del hash de la contraseña cuesta lo mismo en
+los dos casos. Una consulta local recorre la colección entera, mientras que Firestore
+usa un índice, así que la diferencia absoluta aquí exagera la de producción; lo que se
+mantiene es que la lectura por clave no depende del tamaño de la colección.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+def _poblar(db, auth, desde, hasta):
+    lote = db.batch()
+    for i in range(desde, hasta):
+        correo = f"usuario{i}@ejemplo.com"
+        usuario_ref = db.collection('usuarios').document()
+        lote.set(usuario_ref, {'nombre': f"Usuario {i}", 'correo': correo, 'clave_hash': "-", 'rol': 'usuario'})
+        lote.set(auth.referencia_indice_correo(correo), {'usuario_id': usuario_ref.id})
+        if len(lote) >= 500:
+            lote.commit()
+            lote = db.batch()
+    lote.commit()
+
+
+def _medir(funcion, correos):
+    tiempos = []
+    for correo in correos:
+        inicio = time.perf_counter()
+        usuario_doc = funcion(correo)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        assert usuario_doc is not None and usuario_doc.exists
+    return tiempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--usuarios", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeticiones", type=int, default=200)
+    args = parser.parse_args()
+
+    import base_datos
+    base_datos.configurar("memoria")
+    import auth
+    db = base_datos.obtener_db()
+
+    print(f"{'usuarios':>9}  {'búsqueda':<10}{'mediana ms':>11}{'p99 ms':>9}{'lecturas':>10}")
+    total = 0
+    for cantidad in sorted(args.usuarios):
+        _poblar(db, auth, total, cantidad)
+        total = cantidad
+        correos = [f"usuario{random.randrange(total)}@ejemplo.com" for _ in range(args.repeticiones)]
+        for nombre, funcion in (("consulta", auth._buscar_por_consulta), ("clave", auth.buscar_usuario)):
+            lecturas = db.estadisticas['lecturas']
+            tiempos = _medir(funcion, correos)
+            lecturas = (db.estadisticas['lecturas'] - lecturas) / len(correos)
+            p99 = statistics.quantiles(tiempos, n=100)[-1] if len(tiempos) > 1 else tiempos[0]
+            print(f"{total:>9}  {nombre:<10}{statistics.median(tiempos):>11.3f}{p99:>9.3f}{lecturas:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+"""
+Simula el cierre de una subasta con muchos postores a la vez, sin interfaz y contra la
+base local (base_datos_local), con una latencia artificial por viaje a la base:
+
+    python benchmarks/simulador_subasta.py [--postores 200] [--curva oleada_final]
+                                           [--latencia-ms 20] [--comparar anterior.json]
+
+Fases, en orden y una tras otra para poder atribuir lecturas y escrituras a cada operación:
+  registro   auth.registrar_usuario, un usuario por postor
+  login      auth.verificar_usuario
+  galeria    lo que hace abrir_galeria: leer la configuración, poner al día la réplica
+             local del catálogo (cada postor tiene la suya, ver replica_catalogo.py) y
+             quedarse escuchando los cambios; como la galería, cada postor ve los precios
+             nuevos por sus listeners. Sin --reapertura cada réplica empieza vacía y se
+             descarga el catálogo entero; con --reapertura ya estaba sincronizada, como al
+             volver a abrir la aplicación, y solo se pide lo que cambió
+  oferta     subasta.registrar_oferta, con las mismas validaciones previas que hace
+             crear_funcion_ofertar; las llegadas siguen la curva elegida
+  cierre     cierre_subasta.cerrar_subasta, una vez terminado el plazo
+
+De cada fase se informa rendimiento, latencia p50/p95/p99 y lecturas y escrituras por
+operación. Las lecturas que reciben los listeners de las galerías abiertas se cuentan
+aparte: en Firestore se facturan igual. Los resultados se guardan en JSON (por defecto en
+benchmarks/resultados/) para comparar ejecuciones con --comparar.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+DIRECTORIO_RESULTADOS = os.path.join(RAIZ, 'benchmarks', 'resultados')
+CURVAS = ("uniforme", "creciente", "oleada_final")
+CONTADORES = ('lecturas', 'escrituras', 'borrados', 'transacciones_abortadas')
+# En la realidad cada postor calcula el hash de su contraseña en su propio equipo; aquí
+# registro y login se limitan a un hilo por núcleo (scrypt usa 32 MB por hash en curso)
+HILOS_HASH = os.cpu_count() or 4
+
+
+# --- LLEGADAS ---
+
+def instantes_de_llegada(curva, cantidad, duracion, fraccion_oleada, ventana_oleada, azar):
+    """
+    Segundos desde la apertura en que llega cada oferta:
+      uniforme      a ritmo constante
+      creciente     el ritmo sube en línea recta hasta el cierre
+      oleada_final  'fraccion_oleada' de las ofertas llega en el último 'ventana_oleada' del plazo
+    """
+    instantes = []
+    inicio_oleada = duracion * (1 - ventana_oleada)
+    for _ in range(cantidad):
+        if curva == "uniforme":
+            instante = azar.uniform(0, duracion)
+        elif curva == "creciente":
+            instante = duracion * math.sqrt(azar.random())
+        elif azar.random() < fraccion_oleada:
+            instante = azar.uniform(inicio_oleada, duracion)
+        else:
+            instante = azar.uniform(0, inicio_oleada)
+        instantes.append(instante)
+    return sorted(instantes)
+
+
+# --- MEDICIÓN ---
+
+class Fase:
+    """Latencias y resultados de las operaciones de una fase, más los contadores de la base."""
+
+    def __init__(self, nombre, db):
+        self.nombre = nombre
+        self.db = db
+        self.latencias_ms = []
+        self.resultados = {}
+        self.lecturas_listeners = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self._contadores = dict(self.db.estadisticas)
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.db.esperar_listeners()
+        self.duracion_s = time.perf_counter() - self._inicio
+        self.contadores = {c: self.db.estadisticas[c] - self._contadores[c] for c in CONTADORES}
+
+    def registrar(self, latencia_ms, resultado):
+        with self._lock:
+            self.latencias_ms.append(latencia_ms)
+            self.resultados[resultado] = self.resultados.get(resultado, 0) + 1
+
+    def sumar_lecturas_listener(self, cantidad):
+        with self._lock:
+            self.lecturas_listeners += cantidad
+
+    def resumen(self):
+        operaciones = len(self.latencias_ms)
+        latencias = sorted(self.latencias_ms) or [0.0]
+        percentiles = statistics.quantiles(latencias, n=100, method='inclusive') if len(latencias) > 1 else latencias * 99
+        lecturas = self.contadores['lecturas'] - self.lecturas_listeners
+        por_operacion = lambda total: round(total / operaciones, 2) if operaciones else 0
+        return {
+            'operaciones': operaciones,
+            'duracion_s': round(self.duracion_s, 3),
+            'operaciones_por_s': round(operaciones / self.duracion_s, 1) if self.duracion_s else 0,
+            'p50_ms': round(percentiles[49], 2),
+            'p95_ms': round(percentiles[94], 2),
+            'p99_ms': round(percentiles[98], 2),
+            'max_ms': round(latencias[-1], 2),
+            'resultados': dict(sorted(self.resultados.items())),
+            'lecturas_por_operacion': por_operacion(lecturas),
+            'escrituras_por_operacion': por_operacion(self.contadores['escrituras'] + self.contadores['borrados']),
+            'lecturas_listeners': self.lecturas_listeners,
+            'transacciones_abortadas': self.contadores['transacciones_abortadas'],
+        }
+
+
+def ejecutar_concurrente(fase, trabajos, hilos):
+    """Lanza todos los trabajos a la vez; cada uno devuelve el nombre de su resultado."""
+    def medir(trabajo):
+        inicio = time.perf_counter()
+        try:
+            resultado = trabajo()
+        except Exception as e:
+            resultado = f"error: {type(e).__name__}"
+        fase.registrar((time.perf_counter() - inicio) * 1000, resultado)
+
+    with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+        list(ejecutor.map(medir, trabajos))
+
+
+# --- POSTORES ---
+
+class Postor:
+    def __init__(self, numero, azar):
+        self.correo = f"postor{numero}@simulacion.local"
+        self.clave = f"clave-{numero}"
+        self.datos_usuario = None
+        self.precios = {}  # obra_id -> precio que ve en su galería
+        self.azar = azar
+        self.replica = None
+        self.listeners = []
+        # Fase a la que se cargan las lecturas del listener; el primer snapshot, que llega
+        # antes de fijarla, es parte del coste de abrir la galería
+        self.fase_listener = None
+
+    def al_recibir_cambios(self, cambios):
+        if self.fase_listener is not None:
+            self.fase_listener.sumar_lecturas_listener(len(cambios))
+        for tipo, obra_id, obra_data in cambios:
+            if tipo == 'REMOVED':
+                self.precios.pop(obra_id, None)
+            else:
+                self.precios[obra_id] = self._precio(obra_data)
+
+    @staticmethod
+    def _precio(obra_data):
+        from subasta import precio_actual_de
+        return precio_actual_de(obra_data)
+
+    def elegir_obra(self, populares):
+        """Dos tercios de las ofertas van a unas pocas obras populares, como en una subasta real."""
+        if populares and self.azar.random() < 2 / 3:
+            return self.azar.choice(populares)
+        return self.azar.choice(list(self.precios))
+
+    def monto_para(self, obra_id):
+        precio = int(self.precios[obra_id])
+        return precio + self.azar.randint(1, max(1, precio // 20))
+
+
+# --- SIMULACIÓN ---
+
+def preparar_catalogo(db, repositorio, obras, duracion_s):
+    escritor = repositorio.EscritorPorLotes(db)
+    for i in range(obras):
+        escritor.set(db.collection('obras_subasta').document(f"obra-sim-{i:04d}"), {
+            'nombre': f"Obra {i}", 'autor': f"Autor {i % 7}", 'fecha': '', 'descripcion': '',
+            'image_urls': [], 'ofertas': {'precio_base': float(1000 + 100 * i), 'subasta_abierta': True},
+            'timestamp': datetime.now(timezone.utc) - timedelta(seconds=i),
+        })
+    escritor.close()
+    ahora = datetime.now(timezone.utc)
+    db.collection('configuracion').document('subasta').set({
+        'fecha_inicio': ahora, 'fecha_fin': ahora + timedelta(seconds=duracion_s)})
+
+
+def simular(args):
+    import base_datos
+    base_datos.configurar("memoria")
+    db = base_datos.obtener_db()
+    import auth
+    import cierre_subasta
+    import replica_catalogo
+    import repositorio
+    from subasta import registrar_oferta
+
+    azar = random.Random(args.semilla)
+    if args.metodo_hash:
+        auth.configurar_hash(args.metodo_hash)
+    preparar_catalogo(db, repositorio, args.obras, args.duracion)
+    db.latencia_s = args.latencia_ms / 1000
+    postores = [Postor(i, random.Random(azar.random())) for i in range(args.postores)]
+    hilos = args.postores
+    fases = []
+
+    print(f"{args.postores} postores, {args.obras} obras, curva '{args.curva}', latencia {args.latencia_ms} ms, hash {auth.METODO_HASH}")
+
+    with Fase('registro', db) as fase:
+        def registrar(postor):
+            ok, msg = auth.registrar_usuario(f"Postor {postor.correo}", postor.correo, postor.clave)
+            return "ok" if ok else "rechazado"
+        ejecutar_concurrente(fase, [lambda p=p: registrar(p) for p in postores], min(hilos, HILOS_HASH))
+    fases.append(fase)
+
+    with Fase('login', db) as fase:
+        def iniciar_sesion(postor):
+            postor.datos_usuario, msg = auth.verificar_usuario(postor.correo, postor.clave)
+            return "ok" if postor.datos_usuario else "rechazado"
+        ejecutar_concurrente(fase, [lambda p=p: iniciar_sesion(p) for p in postores], min(hilos, HILOS_HASH))
+    fases.append(fase)
+
+    for postor in postores:
+        postor.replica = replica_catalogo.ReplicaCatalogo(":memory:", None)
+        if args.reapertura:
+            # Lo que dejó la sesión anterior; no cuenta para la fase
+            replica_catalogo.descargar_todo(postor.replica)
+
+    with Fase('galeria', db) as fase:
+        def abrir_galeria(postor):
+            db.collection('configuracion').document('subasta').get()
+            postor.al_recibir_cambios([('ADDED', obra_id, obra_data) for obra_id, obra_data in postor.replica.obras()])
+            if args.sin_listeners or postor.replica.marcas() is None:
+                replica_catalogo.sincronizar(postor.replica, postor.al_recibir_cambios)
+            if not args.sin_listeners:
+                postor.listeners = replica_catalogo.escuchar(postor.replica, postor.al_recibir_cambios)
+            return "ok"
+        ejecutar_concurrente(fase, [lambda p=p: abrir_galeria(p) for p in postores], hilos)
+    fases.append(fase)
+
+    obras_visibles = sorted(postores[0].precios)
+    populares = obras_visibles[:max(1, len(obras_visibles) // 10)]
+    llegadas = instantes_de_llegada(args.curva, args.postores * args.ofertas_por_postor, args.duracion,
+                                    args.fraccion_oleada, args.ventana_oleada, azar)
+    linea_tiempo = {}
+
+    with Fase('oferta', db) as fase:
+        for postor in postores:
+            postor.fase_listener = fase
+        inicio = time.perf_counter()
+
+        def ofertar(postor, instante):
+            # Las mismas comprobaciones que crear_funcion_ofertar antes de llamar a registrar_oferta
+            obra_id = postor.elegir_obra(populares)
+            monto = postor.monto_para(obra_id)
+            if monto <= postor.precios[obra_id]:
+                resultado = "rechazada_en_cliente"
+            else:
+                ok, msg = registrar_oferta(obra_id, postor.datos_usuario, monto)
+                if ok:
+                    resultado = "aceptada"
+                elif "simultáneas" in msg:
+                    resultado = "conflicto"
+                elif msg.startswith("No se pudo"):
+                    resultado = "error"
+                else:
+                    resultado = "rechazada"
+            # La latencia incluye la espera en el pool: es la que percibe el postor desde que pulsa
+            latencia_ms = (time.perf_counter() - inicio - instante) * 1000
+            fase.registrar(latencia_ms, resultado)
+            segundo = linea_tiempo.setdefault(int(instante), {})
+            segundo[resultado] = segundo.get(resultado, 0) + 1
+
+        with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+            for instante in llegadas:
+                espera = instante - (time.perf_counter() - inicio)
+                if espera > 0:
+                    time.sleep(espera)
+                ejecutor.submit(ofertar, azar.choice(postores), instante)
+    fases.append(fase)
+
+    for postor in postores:
+        for listener in postor.listeners:
+            listener.unsubscribe()
+    espera_cierre = (db.collection('configuracion').document('subasta').get().to_dict()['fecha_fin']
+                     - datetime.now(timezone.utc)).total_seconds()
+    if espera_cierre > 0:
+        time.sleep(espera_cierre)
+
+    with Fase('cierre', db) as fase:
+        ejecutar_concurrente(fase, [lambda: "ok" if cierre_subasta.cerrar_subasta()[0] else "sin_cerrar"], 1)
+    fases.append(fase)
+
+    return {
+        'fecha': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'version': _version_codigo(),
+        'python': platform.python_version(),
+        'parametros': dict({clave: valor for clave, valor in vars(args).items() if clave not in ('salida', 'comparar')},
+                           metodo_hash=auth.METODO_HASH),
+        'fases': {fase.nombre: fase.resumen() for fase in fases},
+        'ofertas_por_segundo': {str(segundo): conteo for segundo, conteo in sorted(linea_tiempo.items())},
+    }
+
+
+def _version_codigo():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- INFORME ---
+
+def imprimir(resultado, anterior=None):
+    print(f"\n{'fase':<10}{'ops':>7}{'ops/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'lect/op':>9}{'escr/op':>9}{'lect list.':>11}{'abortadas':>10}")
+    for nombre, fase in resultado['fases'].items():
+        print(f"{nombre:<10}{fase['operaciones']:>7}{fase['operaciones_por_s']:>9.1f}{fase['p50_ms']:>9.1f}"
+              f"{fase['p95_ms']:>9.1f}{fase['p99_ms']:>9.1f}{fase['lecturas_por_operacion']:>9.2f}"
+              f"{fase['escrituras_por_operacion']:>9.2f}{fase['lecturas_listeners']:>11}{fase['transacciones_abortadas']:>10}")
+    for nombre, fase in resultado['fases'].items():
+        print(f"  {nombre}: {fase['resultados']}")
+
+    if anterior:
+        print(f"\nComparación con {anterior['fecha']} ({anterior.get('version') or 'sin versión'}):")
+        for nombre, fase in resultado['fases'].items():
+            previa = anterior['fases'].get(nombre)
+            if not previa:
+                continue
+            cambios = []
+            for campo in ('operaciones_por_s', 'p50_ms', 'p99_ms', 'lecturas_por_operacion'):
+                if previa[campo]:
+                    cambios.append(f"{campo} {100 * (fase[campo] - previa[campo]) / previa[campo]:+.0f}%")
+            print(f"  {nombre:<10}" + ", ".join(cambios))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--postores", type=int, default=200)
+    parser.add_argument("--obras", type=int, default=20)
+    parser.add_argument("--ofertas-por-postor", type=int, default=5)
+    parser.add_argument("--duracion", type=float, default=30, help="Segundos entre la apertura y el cierre")
+    parser.add_argument("--curva", choices=CURVAS, default="oleada_final")
+    parser.add_argument("--fraccion-oleada", type=float, default=0.6, help="Parte de las ofertas que llega en la oleada final")
+    parser.add_argument("--ventana-oleada", type=float, default=0.1, help="Parte final del plazo que dura la oleada")
+    parser.add_argument("--latencia-ms", type=float, default=20, help="Demora de cada lectura y confirmación")
+    parser.add_argument("--metodo-hash", default=None, help="Método de hash de contraseñas (por defecto el de auth)")
+    parser.add_argument("--sin-listeners", action="store_true", help="No abre listeners de galería")
+    parser.add_argument("--reapertura", action="store_true", help="Las réplicas locales ya están sincronizadas al abrir la galería")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--salida", default=None, help="Archivo JSON de resultados")
+    parser.add_argument("--comparar", default=None, help="Resultado JSON de una ejecución anterior")
+    args = parser.parse_args()
+
+    anterior = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as archivo:
+            anterior = json.load(archivo)
+
+    resultado = simular(args)
+    imprimir(resultado, anterior)
+
+    salida = args.salida or os.path.join(DIRECTORIO_RESULTADOS, f"simulacion-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as archivo:
+        json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en {salida}")
+
+
+if __name__ == "__main__":
+    main()
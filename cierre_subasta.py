@@ -0,0 +1,161 @@
+"""
+Cierre de la subasta: cuando pasa fecha_fin, un único proceso cierra todas las obras y
+escribe en ganadores/{usuario_id} el resumen de lo que ganó cada usuario, así la pantalla
+de pago lee un solo documento en lugar de recorrer el catálogo.
+
+Lo lanzan las galerías al llegar el cierre (ver galeria_app.py); también puede ejecutarse
+a mano o desde un cron:
+
+    python cierre_subasta.py
+"""
+import sys
+from datetime import datetime, timedelta, timezone
+
+import base_datos
+
+# El avance queda en configuracion/subasta, campo 'cierre':
+#   {'estado': 'en_curso' | 'completado', 'fecha_fin': <la de la subasta cerrada>, 'inicio': ...}
+# Un cierre en curso más antiguo que DURACION_MAXIMA_CIERRE se da por caído y otro proceso
+# puede retomarlo; todas sus escrituras son idempotentes, así que repetirlo es seguro.
+CIERRE_EN_CURSO = "en_curso"
+CIERRE_COMPLETADO = "completado"
+DURACION_MAXIMA_CIERRE = timedelta(minutes=10)
+
+
+def cierre_pendiente(config_data, ahora):
+    """Indica si la subasta ya terminó y nadie la ha cerrado (ni la está cerrando)."""
+    if not config_data or ahora < config_data['fecha_fin']:
+        return False
+    cierre = config_data.get('cierre') or {}
+    if cierre.get('fecha_fin') != config_data['fecha_fin']:
+        # Nunca se cerró, o el cierre es de una subasta anterior con otras fechas
+        return True
+    if cierre.get('estado') == CIERRE_COMPLETADO:
+        return False
+    return ahora - cierre['inicio'] > DURACION_MAXIMA_CIERRE
+
+
+@base_datos.transactional
+def _reclamar_cierre(transaccion, config_ref, ahora):
+    """Marca el cierre como en curso si le toca a este proceso; devuelve la configuración o None."""
+    snapshot = config_ref.get(transaction=transaccion)
+    config_data = snapshot.to_dict() if snapshot.exists else {}
+    if not cierre_pendiente(config_data, ahora):
+        return None
+    transaccion.update(config_ref, {'cierre': {'estado': CIERRE_EN_CURSO, 'fecha_fin': config_data['fecha_fin'], 'inicio': ahora}})
+    return config_data
+
+
+def calcular_ganadores(obras):
+    """
+    Agrupa por usuario las obras que ganó; 'obras' es un iterable de (obra_id, obra_data).
+    El ganador de cada obra es su oferta más alta (ver mejor_oferta_de), identificado por
+    usuario_id. Devuelve ({usuario_id: resumen}, IDs de obras cuya oferta ganadora no tiene
+    usuario_id, que son ofertas antiguas y no pueden asignarse).
+    """
+    from subasta import mejor_oferta_de
+    ganadores = {}
+    sin_usuario = []
+    for obra_id, obra_data in obras:
+        oferta = mejor_oferta_de(obra_data)
+        if not oferta:
+            continue
+        usuario_id = oferta.get('usuario_id')
+        if not usuario_id:
+            sin_usuario.append(obra_id)
+            continue
+        resumen = ganadores.setdefault(usuario_id, {'usuario_id': usuario_id, 'nombre': oferta.get('nombre'), 'obras': [], 'total': 0})
+        resumen['obras'].append({'obra_id': obra_id, 'nombre': obra_data.get('nombre'), 'autor': obra_data.get('autor'), 'monto': oferta['monto']})
+        resumen['total'] += oferta['monto']
+    return ganadores, sin_usuario
+
+
+def cerrar_subasta(ahora=None):
+    """
+    Cierra la subasta si ya terminó y nadie lo hizo todavía. Primero marca cada obra como
+    cerrada, para que las transacciones de oferta que aún estén en vuelo fallen, y después
+    relee el catálogo para calcular los ganadores con el resultado definitivo.
+    Devuelve (True, mensaje) si la cerró este proceso o (False, mensaje) si no.
+    """
+    # repositorio crea el cliente al importarse; como script, main() inicia Firebase antes
+    import repositorio
+    db = base_datos.obtener_db()
+    ahora = ahora or datetime.now(timezone.utc)
+    config_ref = db.collection('configuracion').document('subasta')
+    config_data = _reclamar_cierre(db.transaction(), config_ref, ahora)
+    if config_data is None:
+        return False, "La subasta no ha terminado o ya se cerró."
+
+    escritor = repositorio.EscritorPorLotes(db)
+    abiertas = db.collection('obras_subasta').where(filter=base_datos.FieldFilter('ofertas.subasta_abierta', '==', True))
+    for obra_doc in abiertas.stream():
+        escritor.update(obra_doc.reference, {'ofertas.subasta_abierta': False, 'actualizado': base_datos.SERVER_TIMESTAMP})
+    escritor.flush()
+
+    obras = ((obra_doc.id, obra_doc.to_dict()) for obra_doc in db.collection('obras_subasta').stream())
+    ganadores, sin_usuario = calcular_ganadores(obras)
+    referencias = [db.collection('ganadores').document(usuario_id) for usuario_id in ganadores]
+    # merge solo conserva 'pagado' si este mismo cierre se repite después de que el usuario
+    # pagó; el documento de una subasta anterior se reemplaza entero
+    de_este_cierre = {snapshot.id for snapshot in db.get_all(referencias)
+                      if snapshot.exists and snapshot.to_dict().get('fecha_fin') == config_data['fecha_fin']}
+    for referencia in referencias:
+        resumen = ganadores[referencia.id]
+        resumen.update(fecha_fin=config_data['fecha_fin'], fecha_cierre=base_datos.SERVER_TIMESTAMP)
+        escritor.set(referencia, resumen, merge=referencia.id in de_este_cierre)
+    escritor.close()
+
+    config_ref.update({'cierre': {
+        'estado': CIERRE_COMPLETADO, 'fecha_fin': config_data['fecha_fin'], 'inicio': ahora,
+        'fin': base_datos.SERVER_TIMESTAMP, 'ganadores': len(ganadores),
+    }})
+    mensaje = f"Subasta cerrada: {len(ganadores)} ganadores."
+    if sin_usuario:
+        mensaje += f" {len(sin_usuario)} obras tienen una oferta ganadora sin ID de usuario y no se asignaron."
+    return True, mensaje
+
+
+def programar_subasta(fecha_inicio, fecha_fin):
+    """
+    Guarda las fechas de una nueva subasta y reabre las obras que dejó cerradas el cierre
+    anterior; sin esto registrar_oferta rechazaría toda oferta sobre ellas. Las obras conservan
+    sus ofertas: para empezar de cero hay que vaciar antes el catálogo de la subasta pasada.
+    Devuelve el número de obras reabiertas.
+    """
+    # Local como en cerrar_subasta: repositorio crea el cliente al importarse, y como script
+    # este módulo se importa antes de que main() inicie Firebase
+    import repositorio
+    db = base_datos.obtener_db()
+    escritor = repositorio.EscritorPorLotes(db)
+    reabiertas = 0
+    for obra_doc in repositorio.consulta_obras_cerradas().stream():
+        escritor.update(obra_doc.reference, {'ofertas.subasta_abierta': True, 'actualizado': base_datos.SERVER_TIMESTAMP})
+        reabiertas += 1
+    escritor.close()
+    # Las fechas se guardan al final: si algo falla antes, la subasta anterior sigue cerrada
+    db.collection('configuracion').document('subasta').set({'fecha_inicio': fecha_inicio, 'fecha_fin': fecha_fin})
+    return reabiertas
+
+
+def resumen_vigente(resumen, config_data):
+    """Indica si un documento de ganadores corresponde a la subasta configurada y no a una anterior."""
+    return bool(resumen) and bool(config_data) and resumen.get('fecha_fin') == config_data.get('fecha_fin')
+
+
+def main():
+    import firebase_admin
+    from firebase_admin import credentials
+    try:
+        if not base_datos.es_local() and not firebase_admin._apps:
+            cred = credentials.Certificate('serviceAccountKey.json')
+            firebase_admin.initialize_app(cred)
+        print("✅ Conexión con la base de datos exitosa.")
+    except Exception as e:
+        print(f"❌ Error al conectar con Firebase: {e}")
+        sys.exit(1)
+    cerrado, mensaje = cerrar_subasta()
+    print(("✅ " if cerrado else "") + mensaje)
+
+
+if __name__ == "__main__":
+    main()
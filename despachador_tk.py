@@ -0,0 +1,102 @@
+import queue
+import time
+import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
+
+import metricas
+
+# --- DESPACHADOR DE RESULTADOS HACIA EL HILO DE TK ---
+# Tk no es seguro entre hilos: los trabajadores nunca tocan widgets directamente,
+# sino que publican una función en esta cola y el bucle principal la ejecuta.
+
+# Tiempo máximo por ciclo dedicado a vaciar la cola, para no congelar la UI
+PRESUPUESTO_MS = 8
+# Espera entre ciclos cuando todavía quedan tareas pendientes
+INTERVALO_OCUPADO_MS = 1
+# Espera entre ciclos cuando la cola está vacía
+INTERVALO_LIBRE_MS = 30
+
+_cola = queue.Queue()
+_raiz = None
+
+
+def instalar(widget):
+    """Arranca el ciclo de vaciado sobre la raíz de Tk del widget (solo una vez)."""
+    global _raiz
+    raiz = widget.nametowidget('.')
+    if raiz is _raiz:
+        return
+    _raiz = raiz
+    raiz.after(INTERVALO_LIBRE_MS, _procesar_cola)
+
+
+def publicar(funcion, *args):
+    """Encola 'funcion(*args)' para ejecutarla en el hilo de Tk. Se puede llamar desde cualquier hilo."""
+    _cola.put((funcion, args, time.perf_counter()))
+
+
+def _procesar_cola():
+    global _raiz
+    limite = time.perf_counter() + PRESUPUESTO_MS / 1000
+    while time.perf_counter() < limite:
+        try:
+            funcion, args, encolada = _cola.get_nowait()
+        except queue.Empty:
+            break
+        # Cuánto esperó el resultado a que el hilo de Tk lo atendiera
+        metricas.observar('ui.espera_cola', (time.perf_counter() - encolada) * 1000)
+        try:
+            funcion(*args)
+        except tk.TclError:
+            # El widget destino se destruyó antes de recibir el resultado
+            pass
+        except Exception as e:
+            print(f"Error en una tarea de la interfaz: {e}")
+
+    intervalo = INTERVALO_LIBRE_MS if _cola.empty() else INTERVALO_OCUPADO_MS
+    try:
+        _raiz.after(intervalo, _procesar_cola)
+    except tk.TclError:
+        # La raíz fue destruida: el próximo instalar() arrancará un ciclo nuevo
+        _raiz = None
+
+
+# --- TRABAJOS EN SEGUNDO PLANO ---
+
+# Pool compartido para consultas y otras tareas lentas que no deben bloquear la UI
+_ejecutor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rastro-trabajo")
+
+
+def ejecutar_en_segundo_plano(funcion, al_terminar=None, al_fallar=None):
+    """
+    Ejecuta 'funcion()' en el pool de trabajo. Su resultado se entrega a
+    'al_terminar(resultado)' (o la excepción a 'al_fallar(error)') en el hilo de Tk.
+    """
+    def _trabajo():
+        try:
+            resultado = funcion()
+        except Exception as e:
+            if al_fallar:
+                publicar(al_fallar, e)
+            else:
+                print(f"Error en un trabajo en segundo plano: {e}")
+            return
+        if al_terminar:
+            publicar(al_terminar, resultado)
+    return _ejecutor.submit(_trabajo)
+
+
+# --- TEMPORIZADORES ---
+
+def programar(milisegundos, funcion):
+    """Ejecuta 'funcion()' en el hilo de Tk tras 'milisegundos'. Solo desde el hilo de Tk; devuelve un id para cancelar()."""
+    if _raiz is None:
+        raise RuntimeError("El despachador no está instalado.")
+    return _raiz.after(milisegundos, funcion)
+
+
+def cancelar(id_programado):
+    try:
+        _raiz.after_cancel(id_programado)
+    except (AttributeError, tk.TclError):
+        pass
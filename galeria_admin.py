@@ -1,53 +1,64 @@
 import tkinter as tk
 from tkinter import messagebox, filedialog, ttk
-from PIL import Image, ImageTk
-import requests
-from io import BytesIO
 from datetime import datetime, timezone
 import uuid
 import os
-from urllib.parse import unquote, urlparse
 import threading
 
-import firebase_admin
-from firebase_admin import credentials, firestore, storage
-from google.cloud.firestore_v1.base_query import FieldFilter
+import base_datos
 from auth import actualizar_usuario
-
-db = firestore.client()
-try:
-    bucket = storage.bucket()
-except Exception as e:
-    print(f"ADVERTENCIA: Storage no configurado. Error: {e}")
-    bucket = None
+import servicio_imagenes
+import subida_imagenes
+from lista_virtual import ListaVirtual
+import despachador_tk
+import repositorio
+import replica_catalogo
+import cierre_subasta
+import metricas
+import sesion
+
+db = base_datos.obtener_db()
+
+# El cliente de Storage se crea la primera vez que hace falta (al subir o borrar imágenes)
+# y no al abrir el panel: importarlo y resolver el bucket retrasaría el arranque
+_bucket = None
+_bucket_resuelto = False
+_lock_bucket = threading.Lock()
+
+
+def obtener_bucket():
+    """Devuelve el bucket de Storage, o None si no está configurado. Puede tardar: llamar fuera del hilo de Tk."""
+    global _bucket, _bucket_resuelto
+    with _lock_bucket:
+        if not _bucket_resuelto:
+            try:
+                from firebase_admin import storage
+                _bucket = storage.bucket()
+            except Exception as e:
+                print(f"ADVERTENCIA: Storage no configurado. Error: {e}")
+            _bucket_resuelto = True
+        return _bucket
+
+# Alto fijo de las tarjetas en las listas virtuales del panel
+ALTO_TARJETA_OBRA = 200
+ALTO_TARJETA_USUARIO = 100
+ALTO_FILA_OFERTA = 26
+# Cajas en las que se muestran las imágenes; determinan qué variante se descarga
+TAMANO_IMAGEN_TARJETA = (150, 150)
+TAMANO_IMAGEN_GALERIA = (500, 400)
+# Cada cuánto se refresca la pestaña de diagnóstico mientras está a la vista
+INTERVALO_DIAGNOSTICO_MS = 1000
 
 # --- FUNCIONES AUXILIARES (Definidas antes de ser usadas) ---
 
-def cargar_imagen_async(url, label_imagen, tamano=(150, 150)):
-    """Descarga una imagen en un hilo separado para no bloquear la UI."""
-    def _trabajo_de_hilo():
-        try:
-            headers = {'User-Agent': 'Mozilla/5.0'}
-            # Aumentamos el tiempo de espera a 20 segundos
-            response = requests.get(url, headers=headers, timeout=20)
-            response.raise_for_status()
-            
-            img_data = BytesIO(response.content)
-            img = Image.open(img_data)
-            img.thumbnail(tamano, Image.Resampling.LANCZOS)
-            photo = ImageTk.PhotoImage(img)
-            
-            # Actualizar la UI de forma segura desde el hilo principal
-            label_imagen.config(image=photo, text="", width=0, height=0)
-            label_imagen.image = photo
-        except Exception as e:
-            print(f"Error al descargar imagen (hilo): {e}")
-            label_imagen.config(text="Img Error")
-
-    threading.Thread(target=_trabajo_de_hilo, daemon=True).start()
+def cargar_imagen_async(url, label_imagen, tamano=TAMANO_IMAGEN_TARJETA, prioridad=servicio_imagenes.PRIORIDAD_FONDO):
+    """Carga una imagen a través del servicio compartido con caché en memoria y disco."""
+    servicio_imagenes.cargar_imagen_async(url, label_imagen, tamano, prioridad)
 
-def abrir_galeria_de_imagenes(nombre_obra, image_urls):
+def abrir_galeria_de_imagenes(obra_data):
     """Abre una ventana para mostrar todas las imágenes de una obra."""
+    nombre_obra = obra_data.get('nombre')
+    image_urls = obra_data.get('image_urls', [])
     ventana_galeria = tk.Toplevel()
     ventana_galeria.title(f"Imágenes de: {nombre_obra}")
     ventana_galeria.geometry("800x600")
@@ -63,11 +74,12 @@ def abrir_galeria_de_imagenes(nombre_obra, image_urls):
     if not image_urls:
         tk.Label(scroll_frame, text="No hay imágenes para esta obra.", font=("Arial", 14), bg="#e9f5ff").pack(padx=10, pady=10)
     else:
-        for url in image_urls:
+        for i in range(len(image_urls)):
             placeholder = tk.Label(scroll_frame, text="Cargando...", font=("Arial", 12), bg="#e0e0e0", width=50, height=20)
             placeholder.pack(padx=10, pady=10)
-            # Reutilizamos la función de carga asíncrona, ajustando el tamaño
-            cargar_imagen_async(url, placeholder, (500, 400))
+            # Reutilizamos la función de carga asíncrona, con la variante adecuada al tamaño
+            url = servicio_imagenes.elegir_variante(obra_data, i, TAMANO_IMAGEN_GALERIA)
+            cargar_imagen_async(url, placeholder, TAMANO_IMAGEN_GALERIA, servicio_imagenes.prioridad_por_posicion(i))
 
     canvas.pack(side="left", fill="both", expand=True)
     scrollbar.pack(side="right", fill="y")
@@ -75,19 +87,29 @@ def abrir_galeria_de_imagenes(nombre_obra, image_urls):
 # --- FUNCIONES DE LA VENTANA PRINCIPAL DEL ADMIN ---
 
 def abrir_panel_admin(root, datos_usuario):
-    """Abre el panel de administración principal con pestañas."""
+    """
+    Abre el panel de administración principal con pestañas.
+    Devuelve una función que cierra la ventana, p. ej. si la sesión deja de ser válida.
+    """
     root.withdraw()
     
     ventana_admin = tk.Toplevel(root)
     ventana_admin.title("Panel de Administración - Rastro de Luz")
     ventana_admin.geometry("1200x700")
     ventana_admin.configure(bg="#d0e7f9")
+    despachador_tk.instalar(ventana_admin)
 
+    def cerrar_ventana():
+        if ventana_admin.winfo_exists():
+            root.deiconify()
+            ventana_admin.destroy()
+
+    # Cerrar la ventana conserva la sesión guardada; el botón la borra
     def cerrar_sesion():
-        root.deiconify()
-        ventana_admin.destroy()
+        sesion.olvidar_sesion()
+        cerrar_ventana()
 
-    ventana_admin.protocol("WM_DELETE_WINDOW", cerrar_sesion)
+    ventana_admin.protocol("WM_DELETE_WINDOW", cerrar_ventana)
 
     top_frame = tk.Frame(ventana_admin, bg="#d0e7f9")
     top_frame.pack(fill="x", pady=10, padx=10)
@@ -109,6 +131,21 @@ def abrir_panel_admin(root, datos_usuario):
     setup_usuarios_tab(frame_usuarios)
     setup_configuracion_tab(frame_config)
 
+    # Pestaña de diagnóstico, oculta: Ctrl+Shift+D la muestra u oculta
+    frame_diagnostico = tk.Frame(notebook, bg="#d0e7f9")
+    notebook.add(frame_diagnostico, text="Diagnóstico")
+    notebook.hide(frame_diagnostico)
+    setup_diagnostico_tab(frame_diagnostico, notebook)
+
+    def alternar_diagnostico(event=None):
+        if notebook.tab(frame_diagnostico, 'state') == 'hidden':
+            notebook.add(frame_diagnostico)  # Vuelve a mostrarla en su posición
+            notebook.select(frame_diagnostico)
+        else:
+            notebook.hide(frame_diagnostico)
+    ventana_admin.bind("<Control-Shift-D>", alternar_diagnostico)
+    return cerrar_ventana
+
 # --- PESTAÑA DE GESTIÓN DE OBRAS ---
 
 def setup_obras_tab(parent_frame):
@@ -116,66 +153,163 @@ def setup_obras_tab(parent_frame):
     boton_frame = tk.Frame(parent_frame, bg="#d0e7f9")
     boton_frame.pack(pady=10)
     tk.Button(boton_frame, text="➕ Registrar Nueva Obra", font=("Arial", 15), bg="#a2f5a2",
-              command=lambda: abrir_ventana_registro_obra(lambda: refrescar_obras(scroll_frame))).pack()
-    
-    canvas = tk.Canvas(parent_frame, bg="#d0e7f9", highlightthickness=0)
-    scrollbar = tk.Scrollbar(parent_frame, orient="vertical", command=canvas.yview)
-    scroll_frame = tk.Frame(canvas, bg="#d0e7f9")
-    scroll_frame.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
-    canvas.create_window((0, 0), window=scroll_frame, anchor="nw")
-    canvas.configure(yscrollcommand=scrollbar.set)
-    canvas.pack(side="left", fill="both", expand=True)
-    scrollbar.pack(side="right", fill="y")
+              command=lambda: abrir_ventana_registro_obra(lambda obra_id: aplicar_obra(lista_obras, obra_id))).pack(side="left", padx=5)
+
+    # Acciones sobre varias obras a la vez
+    seleccion_frame = tk.Frame(parent_frame, bg="#d0e7f9")
+    seleccion_frame.pack(pady=(0, 10))
+    tk.Button(seleccion_frame, text="Seleccionar Todas", font=("Arial", 11),
+              command=lambda: lista_obras.seleccionar_todas()).pack(side="left", padx=3)
+    tk.Button(seleccion_frame, text="Quitar Selección", font=("Arial", 11),
+              command=lambda: lista_obras.limpiar_seleccion()).pack(side="left", padx=3)
+    boton_eliminar_seleccion = tk.Button(seleccion_frame, font=("Arial", 11), bg="#f5a2a2", state=tk.DISABLED,
+                                         command=lambda: eliminar_obras({obra_id: lista_obras.datos[obra_id] for obra_id in lista_obras.seleccionadas}, lista_obras))
+    boton_eliminar_seleccion.pack(side="left", padx=3)
+    tk.Button(seleccion_frame, text="Eliminar Obras Cerradas", font=("Arial", 11), bg="#f5a2a2",
+              command=lambda: eliminar_obras_cerradas(lista_obras)).pack(side="left", padx=3)
+    tk.Button(seleccion_frame, text="Limpiar Imágenes Huérfanas", font=("Arial", 11),
+              command=limpiar_imagenes_huerfanas).pack(side="left", padx=3)
+
+    def al_cambiar_seleccion(seleccionadas):
+        boton_eliminar_seleccion.config(text=f"Eliminar Seleccionadas ({len(seleccionadas)})",
+                                        state=tk.NORMAL if seleccionadas else tk.DISABLED)
+
+    def llenar_tarjeta(tarjeta, obra_id, obra_data, visible):
+        prioridad = servicio_imagenes.PRIORIDAD_VISIBLE if visible else servicio_imagenes.PRIORIDAD_FONDO
+        actualizar_widget_obra(lista_obras, tarjeta, obra_id, obra_data, prioridad)
+
+    # Lista virtual: las tarjetas se materializan solo cerca de la vista y se reciclan al hacer scroll
+    lista_obras = ListaVirtual(parent_frame, ALTO_TARJETA_OBRA, crear_widget_obra, llenar_tarjeta,
+                               al_cambiar_seleccion=al_cambiar_seleccion)
+    lista_obras.pack()
+    al_cambiar_seleccion(lista_obras.seleccionadas)
     
-    refrescar_obras(scroll_frame)
-
+    refrescar_obras(lista_obras)
+
+
+def refrescar_obras(lista_obras):
+    """
+    Pinta las obras guardadas en la réplica local (ver replica_catalogo.py) y después la
+    pone al día en segundo plano, pidiendo a Firestore solo lo que cambió desde la última vez.
+    """
+    def leer_replica():
+        replica = replica_catalogo.obtener_replica()
+        return replica, replica.obras()
+
+    def al_leer_replica(resultado):
+        replica, obras = resultado
+        lista_obras.mostrar_mensaje(None)
+        lista_obras.establecer(obras)
+        despachador_tk.ejecutar_en_segundo_plano(
+            lambda: replica_catalogo.sincronizar(replica, lambda cambios: despachador_tk.publicar(aplicar_cambios_obras, lista_obras, cambios)),
+            lambda _: lista_obras.mostrar_mensaje(None if lista_obras else "No hay obras para mostrar."),
+            lambda e: lista_obras.mostrar_mensaje(f"Error al sincronizar las obras: {e}", "red"))
+
+    despachador_tk.ejecutar_en_segundo_plano(leer_replica, al_leer_replica,
+                                             lambda e: lista_obras.mostrar_mensaje(f"Error al cargar las obras: {e}", "red"))
+
+
+def aplicar_cambios_obras(lista_obras, cambios):
+    lista_obras.aplicar_cambios(cambios, repositorio.clave_orden_obra)
+
+
+def aplicar_obra(lista_obras, obra_id):
+    """Relee en segundo plano un único documento y actualiza, inserta o quita solo su tarjeta."""
+    def al_leer(obra_doc):
+        if not obra_doc.exists:
+            lista_obras.eliminar(obra_id)
+        elif obra_id in lista_obras:
+            lista_obras.actualizar(obra_id, obra_doc.to_dict())
+        else:
+            # Las obras recién creadas son las más nuevas, y la lista va de más nueva a más antigua
+            lista_obras.insertar(obra_id, obra_doc.to_dict(), 0)
 
-def refrescar_obras(scroll_frame):
-    """Limpia y recarga la lista de obras desde Firestore."""
-    for widget in scroll_frame.winfo_children():
-        widget.destroy()
-    try:
-        obras_ref = db.collection('obras_subasta').order_by('timestamp', direction=firestore.Query.DESCENDING).stream()
-        for obra_doc in obras_ref:
-            crear_widget_obra(scroll_frame, obra_doc)
-    except Exception as e:
-        tk.Label(scroll_frame, text=f"Error al cargar obras: {e}", fg="red").pack()
+    despachador_tk.ejecutar_en_segundo_plano(
+        lambda: db.collection('obras_subasta').document(obra_id).get(), al_leer,
+        lambda e: messagebox.showerror("Error", f"No se pudo actualizar la obra en la lista: {e}"))
 
 
-def crear_widget_obra(parent, obra_doc):
-    """Crea el widget para una sola obra en la lista de admin."""
-    obra_id = obra_doc.id
-    obra_data = obra_doc.to_dict()
-    
+@metricas.medir('ui.crear_widget_obra_admin')
+def crear_widget_obra(parent):
+    """Crea una tarjeta de obra vacía para la lista de admin y devuelve sus partes."""
     contenedor = tk.Frame(parent, bd=2, relief="groove", bg="#e9f5ff", padx=15, pady=15)
-    contenedor.pack(pady=10, padx=10, fill="x")
+
+    seleccion_var = tk.BooleanVar(value=False)
+    check_seleccion = tk.Checkbutton(contenedor, variable=seleccion_var, bg="#e9f5ff")
+    check_seleccion.pack(side="left")
 
     label_img = tk.Label(contenedor, text="Cargando...", width=18, height=8, bg="#e0e0e0")
     label_img.pack(side="left", padx=10)
 
-    image_urls = obra_data.get('image_urls', [])
-    if image_urls:
-        cargar_imagen_async(image_urls[0], label_img)
-
     info_frame = tk.Frame(contenedor, bg="#e9f5ff")
     info_frame.pack(side="left", expand=True, fill="x", padx=10)
     
-    tk.Label(info_frame, text=f"{obra_data.get('nombre', 'N/A')}", font=("Arial", 16, "bold"), bg="#e9f5ff").pack(anchor="w")
-    tk.Label(info_frame, text=f"Autor: {obra_data.get('autor', 'N/A')}", font=("Arial", 13), bg="#e9f5ff").pack(anchor="w")
-    estado = "Activa" if obra_data.get('ofertas', {}).get('subasta_abierta') else "Cerrada"
-    tk.Label(info_frame, text=f"Estado: {estado}", font=("Arial", 13), bg="#e9f5ff").pack(anchor="w")
+    label_nombre = tk.Label(info_frame, font=("Arial", 16, "bold"), bg="#e9f5ff")
+    label_nombre.pack(anchor="w")
+    label_autor = tk.Label(info_frame, font=("Arial", 13), bg="#e9f5ff")
+    label_autor.pack(anchor="w")
+    label_estado = tk.Label(info_frame, font=("Arial", 13), bg="#e9f5ff")
+    label_estado.pack(anchor="w")
 
     botones_frame = tk.Frame(contenedor, bg="#e9f5ff")
     botones_frame.pack(side="right", padx=10)
     
-    tk.Button(botones_frame, text=f"Ver Imágenes ({len(image_urls)})", bg="#a9a9a9", font=("Arial", 11),
-              command=lambda nom=obra_data.get('nombre'), urls=image_urls: abrir_galeria_de_imagenes(nom, urls)).pack(fill="x", pady=2)
-    tk.Button(botones_frame, text="Ver Historial", bg="#d3d3d3", font=("Arial", 12),
-              command=lambda hist=obra_data.get('historial_ofertas', []), nom=obra_data.get('nombre'): abrir_ventana_historial(hist, nom)).pack(fill="x", pady=2)
-    tk.Button(botones_frame, text="Editar", bg="#add8e6", font=("Arial", 12),
-              command=lambda id=obra_id, data=obra_data: abrir_ventana_edicion_obra(id, data, lambda: refrescar_obras(parent))).pack(fill="x", pady=2)
-    tk.Button(botones_frame, text="Eliminar", bg="#f5a2a2", font=("Arial", 12),
-              command=lambda id=obra_id, data=obra_data: eliminar_obra(id, data, lambda: refrescar_obras(parent))).pack(fill="x", pady=2)
+    boton_imagenes = tk.Button(botones_frame, bg="#a9a9a9", font=("Arial", 11))
+    boton_imagenes.pack(fill="x", pady=2)
+    boton_historial = tk.Button(botones_frame, text="Ver Historial", bg="#d3d3d3", font=("Arial", 12))
+    boton_historial.pack(fill="x", pady=2)
+    boton_editar = tk.Button(botones_frame, text="Editar", bg="#add8e6", font=("Arial", 12))
+    boton_editar.pack(fill="x", pady=2)
+    boton_eliminar = tk.Button(botones_frame, text="Eliminar", bg="#f5a2a2", font=("Arial", 12))
+    boton_eliminar.pack(fill="x", pady=2)
+
+    return {
+        'contenedor': contenedor, 'label_img': label_img, 'label_nombre': label_nombre,
+        'label_autor': label_autor, 'label_estado': label_estado, 'boton_imagenes': boton_imagenes,
+        'boton_historial': boton_historial, 'boton_editar': boton_editar, 'boton_eliminar': boton_eliminar,
+        'seleccion_var': seleccion_var, 'check_seleccion': check_seleccion, 'datos': None, 'obra_id': None,
+    }
+
+
+def actualizar_widget_obra(lista_obras, tarjeta, obra_id, obra_data, prioridad=servicio_imagenes.PRIORIDAD_FONDO):
+    """Actualiza solo las partes de la tarjeta cuyos datos cambiaron."""
+    # La marca se repinta siempre: la tarjeta puede venir reciclada de otra obra
+    tarjeta['seleccion_var'].set(obra_id in lista_obras.seleccionadas)
+    tarjeta['check_seleccion'].config(command=lambda: lista_obras.seleccionar(obra_id, tarjeta['seleccion_var'].get()))
+    anterior = tarjeta['datos'] or {}
+    if anterior == obra_data and tarjeta['obra_id'] == obra_id:
+        return
+
+    def cambio(*claves):
+        return any(anterior.get(clave) != obra_data.get(clave) for clave in claves) or not anterior
+
+    image_urls = obra_data.get('image_urls', [])
+    if cambio('image_urls', 'variantes_imagenes'):
+        # Se descarga la variante más pequeña que cubre la tarjeta, no la imagen original.
+        # La imagen ya cargada se conserva si esa URL sigue siendo la misma
+        url_imagen = servicio_imagenes.elegir_variante(obra_data, 0, TAMANO_IMAGEN_TARJETA)
+        url_anterior = servicio_imagenes.elegir_variante(anterior, 0, TAMANO_IMAGEN_TARJETA)
+        if url_imagen and url_imagen != url_anterior:
+            servicio_imagenes.reiniciar_label(tarjeta['label_img'], "Cargando...", 18, 8)
+            cargar_imagen_async(url_imagen, tarjeta['label_img'], prioridad=prioridad)
+        elif not url_imagen:
+            servicio_imagenes.reiniciar_label(tarjeta['label_img'], "Sin imagen", 18, 8)
+        tarjeta['boton_imagenes'].config(text=f"Ver Imágenes ({len(image_urls)})")
+    if cambio('nombre'):
+        tarjeta['label_nombre'].config(text=f"{obra_data.get('nombre', 'N/A')}")
+    if cambio('autor'):
+        tarjeta['label_autor'].config(text=f"Autor: {obra_data.get('autor', 'N/A')}")
+    if cambio('ofertas'):
+        estado = "Activa" if obra_data.get('ofertas', {}).get('subasta_abierta') else "Cerrada"
+        tarjeta['label_estado'].config(text=f"Estado: {estado}")
+
+    # Los botones capturan los datos de la obra, así que se reenlazan con los nuevos
+    tarjeta['boton_imagenes'].config(command=lambda datos=obra_data: abrir_galeria_de_imagenes(datos))
+    tarjeta['boton_historial'].config(command=lambda nom=obra_data.get('nombre'): abrir_ventana_historial(obra_id, nom))
+    tarjeta['boton_editar'].config(command=lambda id=obra_id, data=obra_data: abrir_ventana_edicion_obra(id, data, lambda: aplicar_obra(lista_obras, id)))
+    tarjeta['boton_eliminar'].config(command=lambda id=obra_id, data=obra_data: eliminar_obras({id: data}, lista_obras))
+    tarjeta['datos'] = obra_data
+    tarjeta['obra_id'] = obra_id
 
 
 def abrir_ventana_registro_obra(callback_refrescar):
@@ -209,7 +343,7 @@ def abrir_ventana_registro_obra(callback_refrescar):
     
     def seleccionar_archivos():
         nonlocal rutas_locales
-        rutas = filedialog.askopenfilenames(title="Selecciona archivos de imagen", filetypes=[("Imágenes", "*.png;*.jpg;*.jpeg")])
+        rutas = filedialog.askopenfilenames(title="Selecciona archivos de imagen", filetypes=[("Imágenes", "*.png;*.jpg;*.jpeg;*.webp")])
         if rutas:
             rutas_locales = list(rutas)
             label_subida.config(text=f"{len(rutas_locales)} archivo(s) seleccionado(s).")
@@ -234,52 +368,94 @@ def abrir_ventana_registro_obra(callback_refrescar):
     tk.Radiobutton(metodo_frame, text="Subir Archivo", variable=metodo_var, value="SUBIR", bg="#d0e7f9", command=toggle_metodo).pack(anchor="w", side="left")
     toggle_metodo()
 
+    progreso_frame = tk.Frame(subida_frame, bg="#d0e7f9")
+    progreso_frame.pack(fill="x", pady=5)
+
+    def mostrar_progreso(rutas):
+        """Crea una fila con etiqueta y barra por cada archivo que se va a subir."""
+        for hijo in progreso_frame.winfo_children():
+            hijo.destroy()
+        filas = []
+        for ruta in rutas:
+            fila = tk.Frame(progreso_frame, bg="#d0e7f9")
+            fila.pack(fill="x", pady=1)
+            etiqueta = tk.Label(fila, text=os.path.basename(ruta), width=35, anchor="w", bg="#d0e7f9")
+            etiqueta.pack(side="left")
+            barra = ttk.Progressbar(fila, length=200, maximum=1.0)
+            barra.pack(side="left", padx=5)
+            filas.append((etiqueta, barra))
+        return filas
+
+    def registrar(lista_urls_final, variantes_imagenes, datos_formulario):
+        try:
+            datos_obra = dict(datos_formulario, image_urls=lista_urls_final, timestamp=base_datos.SERVER_TIMESTAMP,
+                              actualizado=base_datos.SERVER_TIMESTAMP)
+            if variantes_imagenes:
+                # Una entrada por imagen, alineada con image_urls, con la URL de cada tamaño
+                datos_obra["variantes_imagenes"] = variantes_imagenes
+            _, obra_ref = db.collection('obras_subasta').add(datos_obra)
+            messagebox.showinfo("Éxito", "Obra registrada.", parent=ventana_reg)
+            ventana_reg.destroy()
+            callback_refrescar(obra_ref.id)
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudo guardar la obra: {e}", parent=ventana_reg)
+
     def guardar_obra():
-        lista_urls_final = []
+        # Se valida el formulario antes de subir nada, para no dejar imágenes huérfanas
+        nombre = campos_info["Nombre"].get()
+        autor = campos_info["Autor"].get()
+        descripcion = campos_info["Descripción"].get()
+        if not all([nombre, autor, descripcion]):
+            messagebox.showerror("Error", "Todos los campos de texto son obligatorios.", parent=ventana_reg)
+            return
+        try:
+            precio_base = float(campos_info["Precio Base ($)"].get())
+        except ValueError:
+            messagebox.showerror("Error", "El precio base debe ser un número.", parent=ventana_reg)
+            return
+        datos_formulario = {"nombre": nombre, "autor": autor, "fecha": campos_info["Fecha"].get(), "descripcion": descripcion, "ofertas": {"precio_base": precio_base, "subasta_abierta": True}}
+
         if metodo_var.get() == "URL":
             urls_raw = urls_texto.get("1.0", tk.END).strip()
             lista_urls_final = [url.strip() for url in urls_raw.split('\n') if url.strip()]
-        else:
-            if not bucket:
-                messagebox.showerror("Error de Configuración", "Firebase Storage no está configurado.", parent=ventana_reg)
-                return
-            if not rutas_locales:
-                messagebox.showerror("Error", "No has seleccionado ningún archivo para subir.", parent=ventana_reg)
-                return
-            try:
-                for ruta in rutas_locales:
-                    nombre_unico = f"obras/{uuid.uuid4()}{os.path.splitext(ruta)[1]}"
-                    blob = bucket.blob(nombre_unico)
-                    blob.upload_from_filename(ruta)
-                    blob.make_public()
-                    lista_urls_final.append(blob.public_url)
-            except Exception as e:
-                messagebox.showerror("Error de Subida", f"No se pudieron subir las imágenes: {e}", parent=ventana_reg)
+            if not lista_urls_final:
+                messagebox.showerror("Error", "Debes proporcionar al menos una imagen.", parent=ventana_reg)
                 return
+            registrar(lista_urls_final, None, datos_formulario)
+            return
 
-        if not lista_urls_final:
-            messagebox.showerror("Error", "Debes proporcionar al menos una imagen.", parent=ventana_reg)
+        if not rutas_locales:
+            messagebox.showerror("Error", "No has seleccionado ningún archivo para subir.", parent=ventana_reg)
             return
+        boton_guardar.config(state=tk.DISABLED)
+        despachador_tk.ejecutar_en_segundo_plano(obtener_bucket, lambda bucket: subir(bucket, datos_formulario))
+
+    def subir(bucket, datos_formulario):
+        if not bucket:
+            boton_guardar.config(state=tk.NORMAL)
+            messagebox.showerror("Error de Configuración", "Firebase Storage no está configurado.", parent=ventana_reg)
+            return
+
+        # La subida corre en segundo plano; la ventana sigue respondiendo y muestra el avance
+        filas = mostrar_progreso(rutas_locales)
+
+        def al_progresar(indice, texto, fraccion):
+            etiqueta, barra = filas[indice]
+            etiqueta.config(text=texto)
+            barra['value'] = fraccion
+
+        def al_terminar(variantes_imagenes):
+            lista_urls_final = [variantes[subida_imagenes.VARIANTE_COMPLETA] for variantes in variantes_imagenes]
+            registrar(lista_urls_final, variantes_imagenes, datos_formulario)
+
+        def al_fallar(e):
+            boton_guardar.config(state=tk.NORMAL)
+            messagebox.showerror("Error de Subida", f"No se pudieron subir las imágenes: {e}", parent=ventana_reg)
+
+        subida_imagenes.subir_imagenes(bucket, rutas_locales, al_progresar, al_terminar, al_fallar)
             
-        try:
-            nombre = campos_info["Nombre"].get()
-            autor = campos_info["Autor"].get()
-            descripcion = campos_info["Descripción"].get()
-            precio_base = float(campos_info["Precio Base ($)"].get())
-            if not all([nombre, autor, descripcion]):
-                messagebox.showerror("Error", "Todos los campos de texto son obligatorios.", parent=ventana_reg)
-                return
-            datos_obra = {"nombre": nombre, "autor": autor, "fecha": campos_info["Fecha"].get(), "descripcion": descripcion, "image_urls": lista_urls_final, "historial_ofertas": [], "ofertas": {"precio_base": precio_base, "subasta_abierta": True}, "timestamp": firestore.SERVER_TIMESTAMP}
-            db.collection('obras_subasta').add(datos_obra)
-            messagebox.showinfo("Éxito", "Obra registrada.", parent=ventana_reg)
-            ventana_reg.destroy()
-            callback_refrescar()
-        except ValueError:
-             messagebox.showerror("Error", "El precio base debe ser un número.", parent=ventana_reg)
-        except Exception as e:
-            messagebox.showerror("Error", f"No se pudo guardar la obra: {e}", parent=ventana_reg)
-            
-    tk.Button(ventana_reg, text="Guardar Obra", font=("Arial", 14), bg="#a2f5a2", command=guardar_obra).pack(pady=20)
+    boton_guardar = tk.Button(ventana_reg, text="Guardar Obra", font=("Arial", 14), bg="#a2f5a2", command=guardar_obra)
+    boton_guardar.pack(pady=20)
 
 
 def abrir_ventana_edicion_obra(obra_id, obra_data, callback_refrescar):
@@ -316,7 +492,12 @@ def abrir_ventana_edicion_obra(obra_id, obra_data, callback_refrescar):
             messagebox.showerror("Error", "La obra debe tener al menos una URL.", parent=ventana_edit)
             return
         try:
-            nuevos_datos = {"nombre": campos_info["Nombre"].get(), "autor": campos_info["Autor"].get(), "fecha": campos_info["Fecha"].get(), "descripcion": campos_info["Descripción"].get(), "image_urls": nueva_lista_urls, "ofertas.precio_base": float(campos_info["Precio Base ($)"].get())}
+            nuevos_datos = {"nombre": campos_info["Nombre"].get(), "autor": campos_info["Autor"].get(), "fecha": campos_info["Fecha"].get(), "descripcion": campos_info["Descripción"].get(), "image_urls": nueva_lista_urls, "ofertas.precio_base": float(campos_info["Precio Base ($)"].get()), "actualizado": base_datos.SERVER_TIMESTAMP}
+            if 'variantes_imagenes' in obra_data:
+                # Las variantes siguen a su imagen si se reordenan o quitan URLs
+                por_url = dict(zip(existing_urls, obra_data['variantes_imagenes']))
+                variantes = [por_url.get(url, {}) for url in nueva_lista_urls]
+                nuevos_datos["variantes_imagenes"] = variantes if any(variantes) else base_datos.DELETE_FIELD
             db.collection('obras_subasta').document(obra_id).update(nuevos_datos)
             messagebox.showinfo("Éxito", "Obra actualizada.", parent=ventana_edit)
             ventana_edit.destroy()
@@ -328,29 +509,129 @@ def abrir_ventana_edicion_obra(obra_id, obra_data, callback_refrescar):
     tk.Button(ventana_edit, text="Guardar Cambios", font=("Arial", 14), bg="#a2f5a2", command=guardar_cambios).pack(pady=20)
 
 
-def eliminar_obra(obra_id, obra_data, callback_refrescar):
-    if messagebox.askyesno("Confirmar Eliminación", "¿Estás seguro de que quieres eliminar esta obra?"):
-        try:
-            if bucket:
-                image_urls = obra_data.get('image_urls', [])
-                for url in image_urls:
-                    if "firebasestorage.googleapis.com" in url:
-                        try:
-                            path_completo = urlparse(url).path
-                            path_en_bucket = unquote(path_completo.split('/o/')[-1])
-                            blob = bucket.blob(path_en_bucket)
-                            if blob.exists():
-                                blob.delete()
-                                print(f"Imagen {path_en_bucket} eliminada de Storage.")
-                        except Exception as e:
-                            print(f"No se pudo eliminar la imagen {url} de Storage: {e}")
-            db.collection('obras_subasta').document(obra_id).delete()
-            messagebox.showinfo("Éxito", "La obra ha sido eliminada.")
-            callback_refrescar()
-        except Exception as e:
-            messagebox.showerror("Error", f"No se pudo eliminar la obra: {e}")
+def abrir_ventana_progreso(titulo):
+    """Ventana con un texto y una barra de progreso; devuelve (ventana, actualizar(texto, fraccion))."""
+    ventana = tk.Toplevel()
+    ventana.title(titulo)
+    ventana.geometry("450x120")
+    ventana.configure(bg="#d0e7f9")
+    ventana.protocol("WM_DELETE_WINDOW", lambda: None)  # Se cierra sola al terminar
+    etiqueta = tk.Label(ventana, text="Preparando...", font=("Arial", 12), bg="#d0e7f9")
+    etiqueta.pack(pady=(20, 10))
+    barra = ttk.Progressbar(ventana, length=380, maximum=1.0)
+    barra.pack()
+
+    def actualizar(texto, fraccion):
+        etiqueta.config(text=texto)
+        barra['value'] = fraccion
+    return ventana, actualizar
+
+
+def eliminar_obras(obras, lista_obras):
+    """
+    Elimina las obras de 'obras' ({obra_id: obra_data}) tras una sola confirmación.
+    El trabajo corre en segundo plano: primero los documentos y sus ofertas, en lotes,
+    y después sus imágenes de Storage, también en lotes. Las imágenes se borran al final
+    para que ninguna obra visible apunte a una imagen ya borrada; si algo falla a mitad,
+    lo que quede en Storage lo recoge 'Limpiar Imágenes Huérfanas'.
+    """
+    if not obras:
+        return
+    pregunta = ("¿Estás seguro de que quieres eliminar esta obra?" if len(obras) == 1
+                else f"¿Estás seguro de que quieres eliminar {len(obras)} obras y todas sus ofertas?")
+    if not messagebox.askyesno("Confirmar Eliminación", pregunta):
+        return
+
+    ventana_progreso, actualizar = abrir_ventana_progreso("Eliminando Obras")
+
+    def al_progresar_obras(hechas, total):
+        despachador_tk.publicar(actualizar, f"Borrando obras ({hechas}/{total})...", hechas / total / 2)
+
+    def al_progresar_imagenes(borradas, total):
+        despachador_tk.publicar(actualizar, f"Borrando imágenes ({borradas}/{total})...", 0.5 + borradas / total / 2)
+
+    def trabajo():
+        repositorio.eliminar_obras(list(obras), al_progresar_obras)
+        fallidas = []
+        bucket = obtener_bucket()
+        if bucket:
+            nombres = [nombre for obra_data in obras.values()
+                       for nombre in subida_imagenes.nombres_blobs_de_obra(bucket, obra_data)]
+            fallidas = subida_imagenes.borrar_blobs(bucket, nombres, al_progresar_imagenes)
+        return fallidas
+
+    def al_terminar(fallidas):
+        ventana_progreso.destroy()
+        for obra_id in obras:
+            lista_obras.eliminar(obra_id)
+        if fallidas:
+            messagebox.showwarning("Eliminación Parcial", f"Se eliminaron las obras, pero {len(fallidas)} imágenes no se pudieron "
+                                   "borrar de Storage. Usa 'Limpiar Imágenes Huérfanas' para reintentarlo.")
+        else:
+            messagebox.showinfo("Éxito", "La obra ha sido eliminada." if len(obras) == 1 else f"Se eliminaron {len(obras)} obras.")
+
+    def al_fallar(e):
+        ventana_progreso.destroy()
+        messagebox.showerror("Error", f"No se pudieron eliminar las obras: {e}")
+        # Parte de las obras pudo borrarse antes del error; la lista se recarga para reflejarlo
+        refrescar_obras(lista_obras)
+
+    despachador_tk.ejecutar_en_segundo_plano(trabajo, al_terminar, al_fallar)
 
-def abrir_ventana_historial(historial, nombre_obra):
+
+def eliminar_obras_cerradas(lista_obras):
+    """Busca todas las obras con la subasta cerrada (no solo las cargadas en la lista) y las elimina."""
+    def al_terminar(documentos):
+        if not documentos:
+            messagebox.showinfo("Sin Obras", "No hay obras con la subasta cerrada.")
+            return
+        eliminar_obras({doc.id: doc.to_dict() for doc in documentos}, lista_obras)
+
+    despachador_tk.ejecutar_en_segundo_plano(
+        lambda: list(repositorio.consulta_obras_cerradas().stream()), al_terminar,
+        lambda e: messagebox.showerror("Error", f"No se pudieron buscar las obras cerradas: {e}"))
+
+
+def limpiar_imagenes_huerfanas():
+    """Compara las imágenes de Storage con las obras existentes y ofrece borrar las que nadie usa."""
+    def buscar():
+        bucket = obtener_bucket()
+        if not bucket:
+            return None, []
+        obras = (doc.to_dict() for doc in db.collection('obras_subasta').stream())
+        return bucket, subida_imagenes.blobs_huerfanos(bucket, obras)
+
+    def al_encontrar(resultado):
+        bucket, huerfanos = resultado
+        if not bucket:
+            messagebox.showerror("Error de Configuración", "Firebase Storage no está configurado.")
+            return
+        if not huerfanos:
+            messagebox.showinfo("Sin Huérfanas", "Todas las imágenes de Storage pertenecen a alguna obra.")
+            return
+        if not messagebox.askyesno("Imágenes Huérfanas", f"Hay {len(huerfanos)} imágenes que no usa ninguna obra. ¿Borrarlas?"):
+            return
+        ventana_progreso, actualizar = abrir_ventana_progreso("Limpiando Imágenes")
+
+        def al_progresar(borradas, total):
+            despachador_tk.publicar(actualizar, f"Borrando imágenes ({borradas}/{total})...", borradas / total)
+
+        def al_terminar(fallidas):
+            ventana_progreso.destroy()
+            messagebox.showinfo("Limpieza Terminada", f"Se borraron {len(huerfanos) - len(fallidas)} de {len(huerfanos)} imágenes.")
+
+        def al_fallar(e):
+            ventana_progreso.destroy()
+            messagebox.showerror("Error", f"No se pudieron borrar las imágenes: {e}")
+
+        despachador_tk.ejecutar_en_segundo_plano(lambda: subida_imagenes.borrar_blobs(bucket, huerfanos, al_progresar),
+                                                 al_terminar, al_fallar)
+
+    despachador_tk.ejecutar_en_segundo_plano(
+        buscar, al_encontrar, lambda e: messagebox.showerror("Error", f"No se pudieron buscar las imágenes huérfanas: {e}"))
+
+
+def abrir_ventana_historial(obra_id, nombre_obra):
     ventana_historial = tk.Toplevel()
     ventana_historial.title(f"Historial de Ofertas - {nombre_obra}")
     ventana_historial.geometry("500x400")
@@ -358,56 +639,65 @@ def abrir_ventana_historial(historial, nombre_obra):
     fuente_titulo = ("Arial", 14, "bold")
     fuente_item = ("Arial", 12)
     tk.Label(ventana_historial, text=f"Historial para: {nombre_obra}", font=fuente_titulo, bg="#e9f5ff").pack(pady=10)
-    canvas = tk.Canvas(ventana_historial, bg="#e9f5ff", highlightthickness=0)
-    scrollbar = tk.Scrollbar(ventana_historial, orient="vertical", command=canvas.yview)
-    scroll_frame = tk.Frame(canvas, bg="#e9f5ff")
-    scroll_frame.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
-    canvas.create_window((0, 0), window=scroll_frame, anchor="nw")
-    canvas.configure(yscrollcommand=scrollbar.set)
-    if not historial:
-        tk.Label(scroll_frame, text="No se han realizado ofertas.", font=fuente_item, bg="#e9f5ff").pack(padx=10, pady=10)
-    else:
-        for i, oferta in enumerate(reversed(historial)):
-            texto_oferta = f"{i+1}. {oferta.get('nombre', 'N/A')} ofreció: ${oferta.get('monto', 0):,}"
-            tk.Label(scroll_frame, text=texto_oferta, font=fuente_item, bg="#e9f5ff").pack(anchor="w", padx=10, pady=2)
-    canvas.pack(side="left", fill="both", expand=True)
-    scrollbar.pack(side="right", fill="y")
+
+    def crear_fila(parent):
+        return {'contenedor': tk.Label(parent, font=fuente_item, bg="#e9f5ff", anchor="w")}
+
+    def llenar_fila(fila, oferta_id, oferta, visible):
+        texto_oferta = f"{lista_ofertas.indice_de(oferta_id) + 1}. {oferta.get('nombre', 'N/A')} ofreció: ${oferta.get('monto', 0):,}"
+        fila['contenedor'].config(text=texto_oferta)
+
+    # Las ofertas viven en una subcolección y se cargan por páginas al hacer scroll
+    lista_ofertas = ListaVirtual(ventana_historial, ALTO_FILA_OFERTA, crear_fila, llenar_fila, bg="#e9f5ff", separacion=2)
+    lista_ofertas.pack()
+    lista_ofertas.usar_paginador(repositorio.paginador_ofertas(obra_id), "ofertas")
 
 
 # --- PESTAÑA DE GESTIÓN DE USUARIOS ---
 def setup_usuarios_tab(parent_frame):
-    canvas = tk.Canvas(parent_frame, bg="#d0e7f9", highlightthickness=0)
-    scrollbar = tk.Scrollbar(parent_frame, orient="vertical", command=canvas.yview)
-    scroll_frame = tk.Frame(canvas, bg="#d0e7f9")
-    scroll_frame.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
-    canvas.create_window((0, 0), window=scroll_frame, anchor="nw")
-    canvas.configure(yscrollcommand=scrollbar.set)
-    canvas.pack(side="left", fill="both", expand=True)
-    scrollbar.pack(side="right", fill="y")
-    refrescar_usuarios(scroll_frame)
-
-def refrescar_usuarios(scroll_frame):
-    for widget in scroll_frame.winfo_children():
-        widget.destroy()
-    try:
-        usuarios_ref = db.collection('usuarios').stream()
-        for user_doc in usuarios_ref:
-            crear_widget_usuario(scroll_frame, user_doc)
-    except Exception as e:
-        tk.Label(scroll_frame, text=f"Error al cargar usuarios: {e}", fg="red").pack()
+    lista_usuarios = ListaVirtual(parent_frame, ALTO_TARJETA_USUARIO, crear_widget_usuario,
+                                  lambda tarjeta, user_id, user_data, visible: actualizar_widget_usuario(lista_usuarios, tarjeta, user_data),
+                                  separacion=5)
+    lista_usuarios.pack()
+    refrescar_usuarios(lista_usuarios)
+
+def refrescar_usuarios(lista_usuarios):
+    lista_usuarios.usar_paginador(repositorio.paginador_usuarios(), "usuarios")
         
-def crear_widget_usuario(parent, user_doc):
-    user_data = user_doc.to_dict()
-    user_data['id'] = user_doc.id
+def crear_widget_usuario(parent):
     contenedor = tk.Frame(parent, bd=1, relief="solid", bg="#ffffff", padx=10, pady=10)
-    contenedor.pack(pady=5, padx=10, fill="x")
     info_frame = tk.Frame(contenedor, bg="white")
     info_frame.pack(side="left", expand=True, fill="x")
-    tk.Label(info_frame, text=f"Nombre: {user_data.get('nombre', 'N/A')}", font=("Arial", 14, "bold"), bg="white").pack(anchor="w")
-    tk.Label(info_frame, text=f"Correo: {user_data.get('correo', 'N/A')}", font=("Arial", 12), bg="white").pack(anchor="w")
-    tk.Label(info_frame, text=f"Rol: {user_data.get('rol', 'N/A').upper()}", font=("Arial", 12, "italic"), bg="white").pack(anchor="w")
-    tk.Button(contenedor, text="Editar", bg="#add8e6", font=("Arial", 12),
-              command=lambda data=user_data: abrir_ventana_edicion_usuario(data, lambda: refrescar_usuarios(parent))).pack(side="right")
+    label_nombre = tk.Label(info_frame, font=("Arial", 14, "bold"), bg="white")
+    label_nombre.pack(anchor="w")
+    label_correo = tk.Label(info_frame, font=("Arial", 12), bg="white")
+    label_correo.pack(anchor="w")
+    label_rol = tk.Label(info_frame, font=("Arial", 12, "italic"), bg="white")
+    label_rol.pack(anchor="w")
+    boton_editar = tk.Button(contenedor, text="Editar", bg="#add8e6", font=("Arial", 12))
+    boton_editar.pack(side="right")
+    return {'contenedor': contenedor, 'label_nombre': label_nombre, 'label_correo': label_correo,
+            'label_rol': label_rol, 'boton_editar': boton_editar}
+
+def actualizar_widget_usuario(lista_usuarios, tarjeta, user_data):
+    tarjeta['label_nombre'].config(text=f"Nombre: {user_data.get('nombre', 'N/A')}")
+    tarjeta['label_correo'].config(text=f"Correo: {user_data.get('correo', 'N/A')}")
+    tarjeta['label_rol'].config(text=f"Rol: {user_data.get('rol', 'N/A').upper()}")
+    tarjeta['boton_editar'].config(command=lambda data=user_data: abrir_ventana_edicion_usuario(data, lambda: aplicar_usuario(lista_usuarios, data['id'])))
+
+def aplicar_usuario(lista_usuarios, user_id):
+    """Relee en segundo plano un único usuario y actualiza solo su tarjeta."""
+    def al_leer(user_doc):
+        if not user_doc.exists:
+            lista_usuarios.eliminar(user_id)
+            return
+        user_data = user_doc.to_dict()
+        user_data['id'] = user_doc.id
+        lista_usuarios.actualizar(user_id, user_data)
+
+    despachador_tk.ejecutar_en_segundo_plano(
+        lambda: db.collection('usuarios').document(user_id).get(), al_leer,
+        lambda e: messagebox.showerror("Error", f"No se pudo actualizar el usuario en la lista: {e}"))
 
 def abrir_ventana_edicion_usuario(user_data, callback_refrescar):
     ventana_edicion = tk.Toplevel()
@@ -441,14 +731,24 @@ def abrir_ventana_edicion_usuario(user_data, callback_refrescar):
         if nueva_clave:
             datos_para_actualizar['clave'] = nueva_clave
         if messagebox.askyesno("Confirmar", "¿Guardar los cambios para este usuario?"):
-            ok, msg = actualizar_usuario(user_data.get('id'), datos_para_actualizar)
-            if ok:
-                messagebox.showinfo("Éxito", "Usuario actualizado.", parent=ventana_edicion)
-                ventana_edicion.destroy()
-                callback_refrescar()
-            else:
-                messagebox.showerror("Error", msg, parent=ventana_edicion)
-    tk.Button(ventana_edicion, text="Guardar Cambios", font=("Arial", 14), bg="#a2f5a2", command=guardar_cambios).pack(pady=20)
+            # Con contraseña nueva se calcula su hash, que es lento: se guarda fuera del hilo de Tk
+            boton_guardar.config(state=tk.DISABLED, text="Guardando...")
+            despachador_tk.ejecutar_en_segundo_plano(
+                lambda: actualizar_usuario(user_data.get('id'), datos_para_actualizar), al_guardar, al_fallar)
+    def al_guardar(resultado):
+        ok, msg = resultado
+        if ok:
+            messagebox.showinfo("Éxito", "Usuario actualizado.", parent=ventana_edicion)
+            ventana_edicion.destroy()
+            callback_refrescar()
+        else:
+            boton_guardar.config(state=tk.NORMAL, text="Guardar Cambios")
+            messagebox.showerror("Error", msg, parent=ventana_edicion)
+    def al_fallar(e):
+        boton_guardar.config(state=tk.NORMAL, text="Guardar Cambios")
+        messagebox.showerror("Error", f"No se pudo actualizar el usuario: {e}", parent=ventana_edicion)
+    boton_guardar = tk.Button(ventana_edicion, text="Guardar Cambios", font=("Arial", 14), bg="#a2f5a2", command=guardar_cambios)
+    boton_guardar.pack(pady=20)
 
 # --- PESTAÑA DE CONFIGURACIÓN DE SUBASTA ---
 def setup_configuracion_tab(parent_frame):
@@ -476,13 +776,24 @@ def setup_configuracion_tab(parent_frame):
             if fecha_fin_aware <= fecha_inicio_aware:
                 messagebox.showerror("Error de Lógica", "La fecha de fin debe ser posterior a la de inicio.")
                 return
-            config_ref = db.collection('configuracion').document('subasta')
-            config_ref.set({'fecha_inicio': fecha_inicio_aware, 'fecha_fin': fecha_fin_aware})
-            messagebox.showinfo("Éxito", "Configuración guardada.")
         except ValueError:
             messagebox.showerror("Error de Formato", f"Usa el formato: AAAA-MM-DD HH:MM")
-        except Exception as e:
+            return
+        boton_guardar.config(state="disabled")
+
+        def al_terminar(reabiertas):
+            boton_guardar.config(state="normal")
+            mensaje = "Configuración guardada."
+            if reabiertas:
+                mensaje += f" Se reabrieron {reabiertas} obras de la subasta anterior."
+            messagebox.showinfo("Éxito", mensaje)
+
+        def al_fallar(e):
+            boton_guardar.config(state="normal")
             messagebox.showerror("Error", f"No se pudo guardar la configuración: {e}")
+
+        despachador_tk.ejecutar_en_segundo_plano(
+            lambda: cierre_subasta.programar_subasta(fecha_inicio_aware, fecha_fin_aware), al_terminar, al_fallar)
     try:
         config_doc = db.collection('configuracion').document('subasta').get()
         if config_doc.exists:
@@ -494,4 +805,59 @@ def setup_configuracion_tab(parent_frame):
             entry_fin.insert(0, fecha_fin_local.strftime(formato_fecha))
     except Exception as e:
         print(f"No se pudo cargar config de subasta: {e}")
-    tk.Button(config_frame, text="Guardar Configuración", font=fuente_normal, bg="#a2f5a2", command=guardar_configuracion).grid(row=4, column=0, columnspan=2, pady=20)
\ No newline at end of file
+    boton_guardar = tk.Button(config_frame, text="Guardar Configuración", font=fuente_normal, bg="#a2f5a2", command=guardar_configuracion)
+    boton_guardar.grid(row=4, column=0, columnspan=2, pady=20)
+
+# --- PESTAÑA DE DIAGNÓSTICO ---
+def setup_diagnostico_tab(parent_frame, notebook):
+    """Muestra en vivo las métricas de metricas.py; solo se refresca mientras está seleccionada."""
+    tk.Label(parent_frame, text="Tiempos y contadores de esta sesión", font=("Arial", 16, "bold"), bg="#d0e7f9").pack(pady=10)
+    tk.Label(parent_frame, text=f"Los percentiles se calculan sobre las últimas {metricas.TAMANO_VENTANA} mediciones de cada métrica.",
+             font=("Arial", 10, "italic"), bg="#d0e7f9").pack()
+
+    columnas = ('conteo', 'p50', 'p95', 'p99', 'max', 'total')
+    tabla = ttk.Treeview(parent_frame, columns=columnas, height=20)
+    tabla.heading('#0', text="Métrica")
+    tabla.column('#0', width=320)
+    for columna, titulo in zip(columnas, ("Conteo", "p50 ms", "p95 ms", "p99 ms", "Máx. ms", "Total ms")):
+        tabla.heading(columna, text=titulo)
+        tabla.column(columna, width=110, anchor="e")
+    tabla.pack(expand=True, fill="both", padx=10, pady=10)
+
+    def refrescar():
+        if not tabla.winfo_exists():
+            return
+        if notebook.select() == str(parent_frame):
+            datos = metricas.instantanea()
+            filas = {nombre: (valor, "", "", "", "", "") for nombre, valor in datos['contadores'].items()}
+            for nombre, r in datos['tiempos'].items():
+                filas[nombre] = (r['conteo'], f"{r['p50_ms']:.1f}", f"{r['p95_ms']:.1f}", f"{r['p99_ms']:.1f}",
+                                 f"{r['max_ms']:.1f}", f"{r['suma_ms']:.0f}")
+            for indice, nombre in enumerate(sorted(filas)):
+                if tabla.exists(nombre):
+                    tabla.item(nombre, values=filas[nombre])
+                    tabla.move(nombre, '', indice)
+                else:
+                    tabla.insert('', indice, iid=nombre, text=nombre, values=filas[nombre])
+        despachador_tk.programar(INTERVALO_DIAGNOSTICO_MS, refrescar)
+
+    def exportar():
+        ruta = filedialog.asksaveasfilename(parent=parent_frame, defaultextension=".jsonl",
+                                            filetypes=[("JSON Lines", "*.jsonl"), ("Prometheus", "*.prom")])
+        if not ruta:
+            return
+        try:
+            metricas.exportar(ruta)
+            messagebox.showinfo("Métricas exportadas", f"Se guardaron en {ruta}", parent=parent_frame)
+        except OSError as e:
+            messagebox.showerror("Error", f"No se pudieron exportar las métricas: {e}", parent=parent_frame)
+
+    def reiniciar():
+        metricas.reiniciar()
+        tabla.delete(*tabla.get_children())
+
+    botones_frame = tk.Frame(parent_frame, bg="#d0e7f9")
+    botones_frame.pack(pady=(0, 10))
+    tk.Button(botones_frame, text="Exportar...", font=("Arial", 12), command=exportar).pack(side="left", padx=5)
+    tk.Button(botones_frame, text="Reiniciar", font=("Arial", 12), command=reiniciar).pack(side="left", padx=5)
+    refrescar()
@@ -1,22 +1,35 @@
 import tkinter as tk
 from tkinter import messagebox, ttk
-from datetime import datetime, timedelta, timezone
-from PIL import Image, ImageTk
-import requests
-from io import BytesIO
+import time
 import webbrowser
-import threading
 
-import firebase_admin
-from firebase_admin import firestore
-from google.cloud.firestore_v1.base_query import FieldFilter
-
-db = firestore.client()
+import base_datos
+import servicio_imagenes
+import despachador_tk
+import metricas
+from lista_virtual import ListaVirtual
+import repositorio
+import reloj_subasta
+import replica_catalogo
+import cierre_subasta
+import sesion
+from subasta import registrar_oferta, mejor_oferta_de, precio_actual_de
+
+db = base_datos.obtener_db()
+
+# Alto fijo de cada tarjeta en la lista virtual de la galería
+ALTO_TARJETA = 350
+MAX_CARACTERES_DESCRIPCION = 220
+ALTO_FILA_OFERTA = 26
+# Cajas en las que se muestran las imágenes; determinan qué variante se descarga
+TAMANO_IMAGEN_TARJETA = (250, 250)
+TAMANO_IMAGEN_GALERIA = (700, 500)
 
 # --- FUNCIONES DEL FLUJO DE PAGO ---
 
-def abrir_pantalla_pago(root, obras_a_pagar):
-    """Abre la ventana que muestra el resumen y el total a pagar."""
+def abrir_pantalla_pago(root, resumen):
+    """Abre la ventana que muestra el resumen y el total a pagar (un documento de ganadores, ver cierre_subasta.py)."""
+    obras_a_pagar = resumen.get('obras', [])
     if not obras_a_pagar:
         messagebox.showinfo("Nada que pagar", "Actualmente no eres el ganador en ninguna subasta.")
         return
@@ -28,12 +41,12 @@ def abrir_pantalla_pago(root, obras_a_pagar):
     fuente_titulo = ("Arial", 16, "bold")
     fuente_normal = ("Arial", 13)
 
-    total = sum(obra['ofertas']['historial_ofertas'][-1]['monto'] for obra in obras_a_pagar)
+    total = resumen.get('total', 0)
 
     tk.Label(ventana_pago, text="Resumen de Obras Ganadas", font=fuente_titulo, bg="#d0e7f9").pack(pady=10)
 
     for obra in obras_a_pagar:
-        monto = obra['ofertas']['historial_ofertas'][-1]['monto']
+        monto = obra['monto']
         tk.Label(ventana_pago, text=f"- {obra['nombre']}: ${monto:,}", font=fuente_normal, bg="#d0e7f9").pack(anchor="w", padx=20)
     
     ttk.Separator(ventana_pago, orient='horizontal').pack(fill='x', pady=10, padx=20)
@@ -90,26 +103,14 @@ def abrir_bancos(root):
 
 # --- OTRAS FUNCIONES AUXILIARES ---
 
-def cargar_imagen_async(url, label_imagen, tamano=(250, 250)):
-    """Descarga una imagen en un hilo separado para no bloquear la UI."""
-    def _trabajo_de_hilo():
-        try:
-            headers = {'User-Agent': 'Mozilla/5.0'}
-            response = requests.get(url, headers=headers, timeout=20)
-            response.raise_for_status()
-            img_data = BytesIO(response.content)
-            img = Image.open(img_data)
-            img.thumbnail(tamano, Image.Resampling.LANCZOS)
-            photo = ImageTk.PhotoImage(img)
-            label_imagen.config(image=photo, text="", width=0, height=0)
-            label_imagen.image = photo
-        except Exception as e:
-            print(f"Error al descargar imagen (hilo): {e}")
-            label_imagen.config(text="Img Error")
-    threading.Thread(target=_trabajo_de_hilo, daemon=True).start()
-
-def abrir_galeria_de_imagenes(nombre_obra, image_urls):
+def cargar_imagen_async(url, label_imagen, tamano=(250, 250), prioridad=servicio_imagenes.PRIORIDAD_FONDO):
+    """Carga una imagen a través del servicio compartido con caché en memoria y disco."""
+    servicio_imagenes.cargar_imagen_async(url, label_imagen, tamano, prioridad)
+
+def abrir_galeria_de_imagenes(obra_data):
     """Abre una ventana para mostrar todas las imágenes de una obra."""
+    nombre_obra = obra_data.get('nombre')
+    image_urls = obra_data.get('image_urls', [])
     ventana_galeria = tk.Toplevel()
     ventana_galeria.title(f"Imágenes de: {nombre_obra}")
     ventana_galeria.geometry("800x600")
@@ -125,48 +126,52 @@ def abrir_galeria_de_imagenes(nombre_obra, image_urls):
     if not image_urls:
         tk.Label(scroll_frame, text="No hay imágenes adicionales para esta obra.", font=("Arial", 14), bg="#e9f5ff").pack(padx=10, pady=10)
     else:
-        for url in image_urls:
+        for i in range(len(image_urls)):
             placeholder = tk.Label(scroll_frame, text="Cargando...", font=("Arial", 12), bg="#e0e0e0", width=50, height=20)
             placeholder.pack(padx=10, pady=10)
-            cargar_imagen_async(url, placeholder, (700, 500))
+            url = servicio_imagenes.elegir_variante(obra_data, i, TAMANO_IMAGEN_GALERIA)
+            cargar_imagen_async(url, placeholder, TAMANO_IMAGEN_GALERIA, servicio_imagenes.prioridad_por_posicion(i))
 
     canvas.pack(side="left", fill="both", expand=True)
     scrollbar.pack(side="right", fill="y")
 
 
-def abrir_ventana_historial_usuario(historial, nombre_obra):
-    """Abre una ventana para mostrar el historial de ofertas de una obra."""
+def abrir_ventana_historial_usuario(obra_id, nombre_obra):
+    """
+    Abre una ventana para mostrar el historial de ofertas de una obra. Las ofertas
+    se leen por páginas de su subcolección a medida que se hace scroll.
+    """
     ventana_historial = tk.Toplevel()
     ventana_historial.title(f"Historial de Ofertas - {nombre_obra}")
     ventana_historial.geometry("500x400")
     ventana_historial.configure(bg="#e9f5ff")
+    despachador_tk.instalar(ventana_historial)
     
     fuente_titulo = ("Arial", 16, "bold")
     fuente_item = ("Arial", 13)
 
     tk.Label(ventana_historial, text=f"Historial para: {nombre_obra}", font=fuente_titulo, bg="#e9f5ff").pack(pady=10)
 
-    canvas = tk.Canvas(ventana_historial, bg="#e9f5ff", highlightthickness=0)
-    scrollbar = tk.Scrollbar(ventana_historial, orient="vertical", command=canvas.yview)
-    scroll_frame = tk.Frame(canvas, bg="#e9f5ff")
-    scroll_frame.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
-    canvas.create_window((0, 0), window=scroll_frame, anchor="nw")
-    canvas.configure(yscrollcommand=scrollbar.set)
-    
-    if not historial:
-        tk.Label(scroll_frame, text="No se han realizado ofertas para esta obra.", font=fuente_item, bg="#e9f5ff").pack(padx=10, pady=10)
-    else:
-        for i, oferta in enumerate(reversed(historial)):
-            monto_formateado = f"${oferta.get('monto', 0):,}"
-            texto_oferta = f"{i+1}. {oferta.get('nombre', 'N/A')} ofreció: {monto_formateado}"
-            tk.Label(scroll_frame, text=texto_oferta, font=fuente_item, bg="#e9f5ff").pack(anchor="w", padx=10, pady=2)
+    def crear_fila(parent):
+        label = tk.Label(parent, font=fuente_item, bg="#e9f5ff", anchor="w")
+        return {'contenedor': label}
 
-    canvas.pack(side="left", fill="both", expand=True)
-    scrollbar.pack(side="right", fill="y")
+    def llenar_fila(fila, oferta_id, oferta, visible):
+        monto_formateado = f"${oferta.get('monto', 0):,}"
+        texto_oferta = f"{lista_ofertas.indice_de(oferta_id) + 1}. {oferta.get('nombre', 'N/A')} ofreció: {monto_formateado}"
+        fila['contenedor'].config(text=texto_oferta)
+
+    lista_ofertas = ListaVirtual(ventana_historial, ALTO_FILA_OFERTA, crear_fila, llenar_fila, bg="#e9f5ff", separacion=2)
+    lista_ofertas.pack()
+    lista_ofertas.usar_paginador(repositorio.paginador_ofertas(obra_id), "ofertas para esta obra")
 
 
-def crear_funcion_ofertar(id_obra, entrada, datos_usuario, callback_refrescar, precio_actual):
-    """Crea una función de oferta específica para una obra, validando el monto."""
+def crear_funcion_ofertar(id_obra, entrada, datos_usuario, precio_actual, boton=None):
+    """
+    Crea una función de oferta específica para una obra, validando el monto.
+    El precio mostrado solo sirve de filtro rápido: la comprobación definitiva
+    se hace en el servidor, dentro de la transacción de subasta.registrar_oferta.
+    """
     def funcion_real():
         monto_str = entrada.get()
         if not monto_str.isdigit() or int(monto_str) <= 0:
@@ -178,41 +183,44 @@ def crear_funcion_ofertar(id_obra, entrada, datos_usuario, callback_refrescar, p
         if monto_int <= precio_actual:
             messagebox.showerror("Oferta Baja", f"Tu oferta debe ser mayor al precio actual de ${precio_actual:,}.")
             return
-        
-        nueva_oferta = {
-            "nombre": datos_usuario.get('nombre'),
-            "monto": monto_int,
-            "timestamp": datetime.now()
-        }
-        
-        try:
-            obra_ref = db.collection('obras_subasta').document(id_obra)
-            obra_ref.update({'historial_ofertas': firestore.ArrayUnion([nueva_oferta])})
-            messagebox.showinfo("¡Oferta realizada!", "Tu oferta ha sido registrada.")
-            entrada.delete(0, tk.END)
-            callback_refrescar()
-        except Exception as e:
+
+        def al_terminar(resultado):
+            ok, msg = resultado
+            if boton is not None:
+                boton.config(state=tk.NORMAL)
+            if ok:
+                messagebox.showinfo("¡Oferta realizada!", msg)
+                entrada.delete(0, tk.END)
+                # No hace falta recargar: el listener de la galería recibirá el cambio
+            else:
+                messagebox.showerror("Oferta no registrada", msg)
+
+        def al_fallar(e):
+            if boton is not None:
+                boton.config(state=tk.NORMAL)
             messagebox.showerror("Error", f"No se pudo registrar la oferta: {e}")
+
+        # La transacción (con sus reintentos) corre fuera del hilo de la interfaz
+        if boton is not None:
+            boton.config(state=tk.DISABLED)
+        despachador_tk.ejecutar_en_segundo_plano(lambda: registrar_oferta(id_obra, datos_usuario, monto_int), al_terminar, al_fallar)
             
     return funcion_real
 
 
-def crear_widget_obra(parent, obra_id, obra_data, estado_subasta, datos_usuario, callback_refrescar):
-    """Crea y configura el widget para una sola obra."""
+@metricas.medir('ui.crear_widget_obra')
+def crear_widget_obra(parent):
+    """
+    Crea una tarjeta de obra vacía y devuelve un diccionario con sus partes.
+    La lista virtual la llena (y la recicla para otras obras) con actualizar_widget_obra.
+    """
     contenedor = tk.Frame(parent, bd=2, relief="groove", bg="#e9f5ff", padx=20, pady=20)
-    contenedor.pack(pady=10, padx=10, fill="x")
     contenedor.columnconfigure(1, weight=1)
 
     label_img = tk.Label(contenedor, text="Cargando...", width=30, height=15, bg="#e0e0e0")
     label_img.grid(row=0, column=0, rowspan=3, padx=20)
 
-    image_urls = obra_data.get('image_urls', [])
-    if image_urls:
-        cargar_imagen_async(image_urls[0], label_img, (250, 250))
-    
-    if len(image_urls) > 1:
-        tk.Button(contenedor, text=f"Ver más imágenes ({len(image_urls)})", font=("Arial", 11),
-                  command=lambda nom=obra_data.get('nombre'), urls=image_urls: abrir_galeria_de_imagenes(nom, urls)).grid(row=3, column=0, pady=5)
+    boton_imagenes = tk.Button(contenedor, font=("Arial", 11))
     
     info_frame = tk.Frame(contenedor, bg="#e9f5ff")
     info_frame.grid(row=0, column=1, rowspan=2, sticky="nsew", padx=10)
@@ -220,57 +228,130 @@ def crear_widget_obra(parent, obra_id, obra_data, estado_subasta, datos_usuario,
     fuente_titulo = ("Arial", 20, "bold")
     fuente_normal = ("Arial", 14)
     
-    tk.Label(info_frame, text=f"{obra_data.get('nombre', 'Desconocido')}", font=fuente_titulo, bg="#e9f5ff", justify="left").pack(anchor="w")
-    tk.Label(info_frame, text=f"por {obra_data.get('autor', 'Desconocido')} ({obra_data.get('fecha', 'N/A')})", font=("Arial", 14, "italic"), bg="#e9f5ff", justify="left").pack(anchor="w")
-    tk.Label(info_frame, text=f"{obra_data.get('descripcion', '')}", font=("Arial", 13), bg="#e9f5ff", wraplength=600, justify="left").pack(anchor="w", pady=15)
-
-    historial = obra_data.get("historial_ofertas", [])
-    precio_actual = obra_data.get('ofertas', {}).get('precio_base', 0)
-    if historial:
-        precio_actual = historial[-1]['monto']
+    label_nombre = tk.Label(info_frame, font=fuente_titulo, bg="#e9f5ff", justify="left")
+    label_nombre.pack(anchor="w")
+    label_autor = tk.Label(info_frame, font=("Arial", 14, "italic"), bg="#e9f5ff", justify="left")
+    label_autor.pack(anchor="w")
+    label_descripcion = tk.Label(info_frame, font=("Arial", 13), bg="#e9f5ff", wraplength=600, justify="left")
+    label_descripcion.pack(anchor="w", pady=15)
 
     tk.Label(info_frame, text="Precio Actual:", font=("Arial", 13, "bold"), bg="#e9f5ff").pack(anchor="w", pady=(10,0))
-    tk.Label(info_frame, text=f"${precio_actual:,}", font=("Arial", 18, "bold"), fg="#005a9c", bg="#e9f5ff").pack(anchor="w")
+    label_precio = tk.Label(info_frame, font=("Arial", 18, "bold"), fg="#005a9c", bg="#e9f5ff")
+    label_precio.pack(anchor="w")
     
     ofertas_frame = tk.Frame(contenedor, bg="#e9f5ff")
     ofertas_frame.grid(row=2, column=1, sticky="sew", padx=10, pady=10)
-    
-    texto_oferta_label = "Sé el primero en ofertar."
-    if historial:
-        ultima_oferta = historial[-1]
-        texto_oferta_label = f"Última oferta: {ultima_oferta['nombre']} por ${ultima_oferta['monto']:,}"
 
-    label_ultima_oferta = tk.Label(ofertas_frame, text=texto_oferta_label, font=fuente_normal, bg="#e9f5ff")
+    label_ultima_oferta = tk.Label(ofertas_frame, font=fuente_normal, bg="#e9f5ff")
     label_ultima_oferta.pack(side="left", anchor="w")
-    
-    estado_oferta_btn = tk.NORMAL if estado_subasta == "ACTIVA" else tk.DISABLED
 
-    entry_oferta = tk.Entry(ofertas_frame, font=fuente_normal, width=10, state=estado_oferta_btn)
+    entry_oferta = tk.Entry(ofertas_frame, font=fuente_normal, width=10)
     entry_oferta.pack(side="left", padx=10)
 
-    tk.Button(ofertas_frame, text="Ofertar", font=fuente_normal, bg="#a2f5a2", state=estado_oferta_btn,
-              command=crear_funcion_ofertar(obra_id, entry_oferta, datos_usuario, callback_refrescar, precio_actual)).pack(side="left")
+    boton_ofertar = tk.Button(ofertas_frame, text="Ofertar", font=fuente_normal, bg="#a2f5a2")
+    boton_ofertar.pack(side="left")
+
+    boton_historial = tk.Button(ofertas_frame, text="Ver Historial", font=("Arial", 12))
+    boton_historial.pack(side="left", padx=10)
+
+    tarjeta = {
+        'contenedor': contenedor, 'label_img': label_img, 'boton_imagenes': boton_imagenes,
+        'label_nombre': label_nombre, 'label_autor': label_autor, 'label_descripcion': label_descripcion,
+        'label_precio': label_precio, 'label_ultima_oferta': label_ultima_oferta,
+        'entry_oferta': entry_oferta, 'boton_ofertar': boton_ofertar, 'boton_historial': boton_historial,
+        'obra_id': None, 'url_imagen': None,
+    }
+    return tarjeta
+
+
+@metricas.medir('ui.actualizar_widget_obra')
+def actualizar_widget_obra(tarjeta, obra_id, obra_data, estado_subasta, datos_usuario, prioridad=servicio_imagenes.PRIORIDAD_FONDO):
+    """Vuelve a pintar los datos de una obra sobre un widget ya existente."""
+    if tarjeta['obra_id'] != obra_id:
+        # La tarjeta se está reciclando: no debe arrastrar la oferta escrita para otra obra
+        tarjeta['obra_id'] = obra_id
+        tarjeta['entry_oferta'].config(state=tk.NORMAL)
+        tarjeta['entry_oferta'].delete(0, tk.END)
+
+    image_urls = obra_data.get('image_urls', [])
+    # Se descarga la variante más pequeña que cubre la tarjeta, no la imagen original
+    url_imagen = servicio_imagenes.elegir_variante(obra_data, 0, TAMANO_IMAGEN_TARJETA)
+    # Solo se pide la imagen si cambió; la caché evita descargarla de nuevo
+    if url_imagen != tarjeta['url_imagen']:
+        tarjeta['url_imagen'] = url_imagen
+        servicio_imagenes.reiniciar_label(tarjeta['label_img'], "Cargando..." if url_imagen else "Sin imagen", 30, 15)
+        if url_imagen:
+            cargar_imagen_async(url_imagen, tarjeta['label_img'], TAMANO_IMAGEN_TARJETA, prioridad)
+
+    if len(image_urls) > 1:
+        tarjeta['boton_imagenes'].config(text=f"Ver más imágenes ({len(image_urls)})",
+                                         command=lambda datos=obra_data: abrir_galeria_de_imagenes(datos))
+        tarjeta['boton_imagenes'].grid(row=3, column=0, pady=5)
+    else:
+        tarjeta['boton_imagenes'].grid_remove()
+
+    tarjeta['label_nombre'].config(text=f"{obra_data.get('nombre', 'Desconocido')}")
+    tarjeta['label_autor'].config(text=f"por {obra_data.get('autor', 'Desconocido')} ({obra_data.get('fecha', 'N/A')})")
+    # Las tarjetas tienen alto fijo, así que las descripciones largas se recortan
+    descripcion = obra_data.get('descripcion', '')
+    if len(descripcion) > MAX_CARACTERES_DESCRIPCION:
+        descripcion = descripcion[:MAX_CARACTERES_DESCRIPCION].rstrip() + "…"
+    tarjeta['label_descripcion'].config(text=descripcion)
+
+    precio_actual = precio_actual_de(obra_data)
+    tarjeta['label_precio'].config(text=f"${precio_actual:,}")
+
+    texto_oferta_label = "Sé el primero en ofertar."
+    mejor_oferta = mejor_oferta_de(obra_data)
+    if mejor_oferta:
+        texto_oferta_label = f"Última oferta: {mejor_oferta['nombre']} por ${mejor_oferta['monto']:,}"
+    tarjeta['label_ultima_oferta'].config(text=texto_oferta_label)
+
+    estado_oferta_btn = tk.NORMAL if estado_subasta == reloj_subasta.ACTIVA else tk.DISABLED
+    tarjeta['entry_oferta'].config(state=estado_oferta_btn)
+    tarjeta['boton_ofertar'].config(state=estado_oferta_btn,
+                                    command=crear_funcion_ofertar(obra_id, tarjeta['entry_oferta'], datos_usuario, precio_actual, tarjeta['boton_ofertar']))
+    tarjeta['boton_historial'].config(command=lambda n=obra_data.get('nombre'): abrir_ventana_historial_usuario(obra_id, n))
 
-    tk.Button(ofertas_frame, text="Ver Historial", font=("Arial", 12),
-              command=lambda h=historial, n=obra_data.get('nombre'): abrir_ventana_historial_usuario(h, n)).pack(side="left", padx=10)
 
 # --- FUNCIÓN PRINCIPAL DE LA GALERÍA ---
 
 def abrir_galeria(root, datos_usuario):
-    """Abre la ventana principal de la galería, adaptándose al estado de la subasta."""
+    """
+    Abre la ventana principal de la galería, adaptándose al estado de la subasta.
+    Las obras se pintan desde la réplica local (ver replica_catalogo.py) y después
+    llegan solo los cambios: cada cambio en una obra actualiza solo su tarjeta.
+    Devuelve una función que cierra la ventana, p. ej. si la sesión deja de ser válida.
+    """
+    inicio_apertura = time.perf_counter()
     root.withdraw()
     
     ventana = tk.Toplevel(root)
     ventana.title("Galería de Arte - Rastro de Luz")
     ventana.geometry("1200x800")
     ventana.configure(bg="#d0e7f9")
+    despachador_tk.instalar(ventana)
 
-    def cerrar_sesion():
-        if hasattr(ventana, 'after_id'):
-            ventana.after_cancel(ventana.after_id)
+    listeners = []
+    cerrada = []
+    suscripcion_reloj = []
+
+    def cerrar_ventana():
+        if cerrada:
+            return
+        cerrada.append(True)
+        for suscripcion in suscripcion_reloj:
+            suscripcion.cancelar()
+        for listener in listeners:
+            listener.unsubscribe()
         root.deiconify()
         ventana.destroy()
-    ventana.protocol("WM_DELETE_WINDOW", cerrar_sesion)
+
+    # Cerrar la ventana conserva la sesión guardada; el botón la borra
+    def cerrar_sesion():
+        sesion.olvidar_sesion()
+        cerrar_ventana()
+    ventana.protocol("WM_DELETE_WINDOW", cerrar_ventana)
     
     tk.Label(ventana, text=f"Bienvenido, {datos_usuario.get('nombre', 'Usuario')}", font=("Arial", 22, "bold"), bg="#d0e7f9").pack(pady=10)
     tk.Button(ventana, text="Cerrar Sesión", font=("Arial", 13), command=cerrar_sesion).place(relx=0.98, rely=0.01, anchor="ne")
@@ -281,78 +362,137 @@ def abrir_galeria(root, datos_usuario):
     main_content_frame = tk.Frame(ventana, bg="#d0e7f9")
     main_content_frame.pack(expand=True, fill="both")
 
-    canvas = tk.Canvas(main_content_frame, bg="#d0e7f9", highlightthickness=0)
-    scrollbar = tk.Scrollbar(main_content_frame, orient="vertical", command=canvas.yview)
-    scroll_frame = tk.Frame(canvas, bg="#d0e7f9")
-    scroll_frame.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
-    canvas.create_window((0, 0), window=scroll_frame, anchor="nw")
-    canvas.configure(yscrollcommand=scrollbar.set)
-    canvas.pack(side="left", fill="both", expand=True)
-    scrollbar.pack(side="right", fill="y")
+    # Estado local de la galería, alimentado por los listeners y por el reloj compartido
+    estado = {'subasta': "", 'config': {}, 'resumen_ganador': None, 'abierta': False}
+
+    def llenar_tarjeta(tarjeta, obra_id, obra_data, visible):
+        prioridad = servicio_imagenes.PRIORIDAD_VISIBLE if visible else servicio_imagenes.PRIORIDAD_FONDO
+        actualizar_widget_obra(tarjeta, obra_id, obra_data, estado['subasta'], datos_usuario, prioridad)
+
+    # Solo se materializan las tarjetas cercanas a la vista, así que la lista puede tener
+    # el catálogo entero de la réplica
+    lista_obras = ListaVirtual(main_content_frame, ALTO_TARJETA, crear_widget_obra, llenar_tarjeta)
+    lista_obras.pack()
     
     boton_pago = tk.Button(main_content_frame, text="💳 Proceder al Pago de Obras Ganadas", font=("Arial", 16), bg="#add8e6")
     
-    def actualizar_cronometro(fecha_fin):
-        ahora = datetime.now(timezone.utc)
-        restante = fecha_fin - ahora
-        if restante.total_seconds() > 0:
-            dias = restante.days
-            horas, resto = divmod(int(restante.seconds), 3600)
-            minutos, segundos = divmod(resto, 60)
-            estado_label.config(text=f"La subasta cierra en: {dias}d {horas:02d}h {minutos:02d}m {segundos:02d}s", fg="red")
-            ventana.after_id = ventana.after(1000, lambda: actualizar_cronometro(fecha_fin))
+    # --- ESTADO DE LA SUBASTA (lo notifica el reloj compartido, ver reloj_subasta.py) ---
+
+    def al_tic(restante):
+        dias = restante.days
+        horas, resto = divmod(int(restante.seconds), 3600)
+        minutos, segundos = divmod(resto, 60)
+        estado_label.config(text=f"La subasta cierra en: {dias}d {horas:02d}h {minutos:02d}m {segundos:02d}s", fg="red")
+
+    def al_cambiar_estado(estado_actual, config):
+        """Actualiza solo lo que depende del estado: el rótulo, los botones de oferta y el de pago."""
+        if estado_actual == reloj_subasta.SIN_CONFIGURAR:
+            estado_label.config(text="La subasta no ha sido configurada.", fg="red")
+        elif estado_actual == reloj_subasta.PENDIENTE:
+            fecha_inicio = config.get('fecha_inicio')
+            estado_label.config(text=f"La subasta comenzará el {fecha_inicio.astimezone().strftime('%Y-%m-%d a las %H:%M')}", fg="blue")
+        elif estado_actual == reloj_subasta.CERRADA:
+            estado_label.config(text="La subasta ha finalizado. ¡Revisa si eres uno de los ganadores!", fg="black")
+
+        anterior = estado['subasta']
+        if config and config != estado['config']:
+            # Para la próxima apertura, aunque sea sin red
+            despachador_tk.ejecutar_en_segundo_plano(lambda: replica_catalogo.obtener_replica().guardar_configuracion(config))
+        estado['config'] = config
+        if estado_actual != anterior:
+            estado['subasta'] = estado_actual
+            lista_obras.refrescar()
+        if estado_actual == reloj_subasta.CERRADA:
+            escuchar_resumen_ganador()
+            if anterior == "":
+                # La subasta ya estaba cerrada al abrir la galería: si nadie la cerró, se cierra ahora
+                cerrar_subasta_si_falta()
+        actualizar_boton_pago()
+
+    def cerrar_subasta_si_falta():
+        """Lanza el cierre (ver cierre_subasta.py) si nadie lo hizo; la transacción evita que se repita."""
+        if cierre_subasta.cierre_pendiente(estado['config'], reloj_subasta.obtener_reloj().ahora()):
+            despachador_tk.ejecutar_en_segundo_plano(cierre_subasta.cerrar_subasta, al_fallar=lambda e: print(f"No se pudo cerrar la subasta: {e}"))
+
+    # --- RESULTADOS (un solo documento por usuario, escrito por el cierre) ---
+
+    def escuchar_resumen_ganador():
+        if estado['resumen_ganador'] is not None or cerrada:
+            return
+        estado['resumen_ganador'] = {}
+        listeners.append(db.collection('ganadores').document(datos_usuario.get('id')).on_snapshot(al_cambiar_resumen_ganador))
+
+    def aplicar_resumen_ganador(resumen):
+        estado['resumen_ganador'] = resumen
+        actualizar_boton_pago()
+
+    def actualizar_boton_pago():
+        resumen = estado['resumen_ganador']
+        if estado['subasta'] == reloj_subasta.CERRADA and cierre_subasta.resumen_vigente(resumen, estado['config']):
+            boton_pago.pack(side="bottom", pady=20, before=lista_obras.canvas)
+            boton_pago.config(command=lambda: abrir_pantalla_pago(ventana, resumen))
         else:
-            cargar_configuracion_y_obras()
+            boton_pago.pack_forget()
 
-    def cargar_configuracion_y_obras():
-        for widget in scroll_frame.winfo_children():
-            widget.destroy()
+    def aplicar_cambios_obras(cambios):
+        """Aplica en la UI solo los documentos agregados, modificados o eliminados."""
+        if cerrada:
+            return
+        lista_obras.aplicar_cambios(cambios, repositorio.clave_orden_obra)
+        if not estado['abierta'] and lista_obras:
+            marcar_abierta()
 
-        obras_ganadas = []
-        
-        try:
-            config_doc = db.collection('configuracion').document('subasta').get()
-            if not config_doc.exists:
-                estado_label.config(text="La subasta no ha sido configurada.", fg="red")
-                return
-
-            config_data = config_doc.to_dict()
-            fecha_inicio = config_data.get('fecha_inicio')
-            fecha_fin = config_data.get('fecha_fin')
-            ahora = datetime.now(timezone.utc)
-            
-            estado_actual = ""
-            if ahora < fecha_inicio:
-                estado_actual = "PENDIENTE"
-                estado_label.config(text=f"La subasta comenzará el {fecha_inicio.astimezone().strftime('%Y-%m-%d a las %H:%M')}", fg="blue")
-            elif fecha_inicio <= ahora < fecha_fin:
-                estado_actual = "ACTIVA"
-                actualizar_cronometro(fecha_fin)
-            else:
-                estado_actual = "CERRADA"
-                estado_label.config(text="La subasta ha finalizado. ¡Revisa si eres uno de los ganadores!", fg="black")
-
-            obras_ref = db.collection('obras_subasta').order_by('timestamp', direction=firestore.Query.DESCENDING).stream()
-            for obra_doc in obras_ref:
-                obra_id = obra_doc.id
-                obra_data = obra_doc.to_dict()
-                crear_widget_obra(scroll_frame, obra_id, obra_data, estado_actual, datos_usuario, lambda: cargar_configuracion_y_obras())
-
-                historial = obra_data.get("historial_ofertas", [])
-                if estado_actual == "CERRADA" and historial:
-                    ganador = historial[-1]['nombre']
-                    if ganador == datos_usuario.get('nombre'):
-                        obra_ganada = obra_data.copy()
-                        obra_ganada['ofertas']['historial_ofertas'] = [historial[-1]]
-                        obras_ganadas.append(obra_ganada)
-            
-            if estado_actual == "CERRADA" and obras_ganadas:
-                boton_pago.pack(side="bottom", pady=20)
-                boton_pago.config(command=lambda: abrir_pantalla_pago(ventana, obras_ganadas))
-            else:
-                boton_pago.pack_forget()
+    def marcar_abierta():
+        # Desde que se pidió la galería hasta que hay tarjetas armadas (de la réplica o de la red)
+        estado['abierta'] = True
+        metricas.observar('galeria.apertura', (time.perf_counter() - inicio_apertura) * 1000)
+
+    # --- RÉPLICA LOCAL (ver replica_catalogo.py) ---
+    # Primero se pinta lo guardado en disco, sin esperar a la red; luego llegan solo los cambios
+
+    def leer_replica():
+        replica = replica_catalogo.obtener_replica()
+        return replica, replica.obras(), replica.configuracion(), replica.marcas() is not None
+
+    def al_leer_replica(resultado):
+        if cerrada:
+            return
+        replica, obras, config, vigente = resultado
+        lista_obras.establecer(obras)
+        if obras:
+            marcar_abierta()
+        reloj_subasta.obtener_reloj().precargar(config)
+        if vigente:
+            escuchar_cambios(replica)
+        else:
+            # Primera apertura o réplica vencida: se descarga todo y después se escucha
+            despachador_tk.ejecutar_en_segundo_plano(lambda: replica_catalogo.descargar_todo(replica, al_recibir_cambios),
+                                                     lambda _: escuchar_cambios(replica), al_fallar_descarga)
+
+    def escuchar_cambios(replica):
+        if not cerrada:
+            listeners.extend(replica_catalogo.escuchar(replica, al_recibir_cambios))
+
+    def al_fallar_descarga(e):
+        if not cerrada:
+            messagebox.showerror("Error", f"No se pudieron cargar las obras: {e}", parent=ventana)
+
+    def al_fallar_replica(e):
+        messagebox.showerror("Error", f"No se pudo abrir el catálogo guardado: {e}", parent=ventana)
+
+    # --- LISTENERS (se ejecutan en hilos de Firestore y delegan en el despachador) ---
+
+    def al_cambiar_resumen_ganador(doc_snapshots, cambios, read_time):
+        for doc in doc_snapshots:
+            despachador_tk.publicar(aplicar_resumen_ganador, doc.to_dict() if doc.exists else {})
 
-        except Exception as e:
-            messagebox.showerror("Error", f"No se pudo cargar la configuración de la subasta: {e}", parent=ventana)
+    def al_recibir_cambios(cambios):
+        # Ya están guardados en la réplica; en la UI se aplican desde el hilo de Tk
+        despachador_tk.publicar(aplicar_cambios_obras, cambios)
 
-    cargar_configuracion_y_obras()
\ No newline at end of file
+    try:
+        suscripcion_reloj.append(reloj_subasta.obtener_reloj().suscribir(al_cambiar_estado, al_tic, cerrar_subasta_si_falta))
+    except Exception as e:
+        messagebox.showerror("Error", f"No se pudo cargar la configuración de la subasta: {e}", parent=ventana)
+    despachador_tk.ejecutar_en_segundo_plano(leer_replica, al_leer_replica, al_fallar_replica)
+    return cerrar_ventana
@@ -0,0 +1,70 @@
+from io import BytesIO
+
+import requests
+import firebase_admin
+from firebase_admin import credentials, storage
+
+import base_datos
+import subida_imagenes
+
+# --- INICIALIZACIÓN DE FIREBASE ---
+try:
+    if not firebase_admin._apps:
+        cred = credentials.Certificate('serviceAccountKey.json')
+        firebase_admin.initialize_app(cred, {'storageBucket': 'rastro-de-luz-d69a5.firebasestorage.app'})
+    db = base_datos.obtener_db()
+    bucket = storage.bucket()
+    print("✅ Conexión con Firebase (Firestore y Storage) exitosa.")
+except Exception as e:
+    print(f"❌ Error al conectar con Firebase: {e}")
+    exit()
+
+# --- GENERACIÓN DE VARIANTES PARA OBRAS EXISTENTES ---
+# Completa 'variantes_imagenes' en las obras registradas antes de que existieran:
+# - Imágenes de Wikimedia: el propio servidor de miniaturas genera cada tamaño, así
+#   que solo se reescribe la URL (no se descarga ni se sube nada).
+# - Imágenes de Firebase Storage: se descargan, se generan las variantes con
+#   subida_imagenes y se suben junto a la original.
+# Las demás URLs se dejan sin variantes y las galerías siguen usando la original.
+
+
+def variantes_storage(url):
+    """Descarga una imagen de Firebase Storage, genera sus variantes y las sube; None si no es de Storage."""
+    if "firebasestorage.googleapis.com" not in url and "storage.googleapis.com" not in url:
+        return None
+    respuesta = requests.get(url, headers=subida_imagenes.HEADERS, timeout=60)
+    respuesta.raise_for_status()
+    variantes = subida_imagenes.generar_variantes(BytesIO(respuesta.content))
+    return subida_imagenes.subir_variantes(bucket, variantes)
+
+
+def generar_para_obra(obra_data):
+    """Devuelve la lista de variantes alineada con image_urls, o None si no hay nada que generar."""
+    existentes = obra_data.get('variantes_imagenes', [])
+    resultado = []
+    hubo_cambios = False
+    for i, url in enumerate(obra_data.get('image_urls', [])):
+        if i < len(existentes) and existentes[i]:
+            resultado.append(existentes[i])
+            continue
+        variantes = subida_imagenes.variantes_wikimedia(url) or variantes_storage(url) or {}
+        hubo_cambios = hubo_cambios or bool(variantes)
+        resultado.append(variantes)
+    return resultado if hubo_cambios else None
+
+
+print("Buscando obras sin variantes de imagen...")
+actualizadas = 0
+for obra_doc in db.collection('obras_subasta').stream():
+    obra_data = obra_doc.to_dict()
+    try:
+        variantes_imagenes = generar_para_obra(obra_data)
+        if variantes_imagenes is None:
+            continue
+        obra_doc.reference.update({'variantes_imagenes': variantes_imagenes, 'actualizado': base_datos.SERVER_TIMESTAMP})
+        actualizadas += 1
+        print(f"✔️ Obra '{obra_data.get('nombre')}': variantes generadas.")
+    except Exception as e:
+        print(f"❌ No se pudieron generar las variantes de la obra {obra_doc.id}: {e}")
+
+print(f"\n✅ Proceso finalizado: {actualizadas} obras actualizadas.")
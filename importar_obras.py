@@ -0,0 +1,214 @@
+"""
+Importa un catálogo de obras desde un archivo CSV o JSONL:
+
+    python importar_obras.py catalogo.jsonl [--sin-imagenes] [--max-ops-por-segundo N]
+
+Cada obra tiene nombre, autor, fecha, descripcion, precio_base e image_urls (en CSV,
+separadas por '|'); opcionalmente un 'id'. Las imágenes pueden ser URLs o rutas locales.
+
+El ID de cada documento se deriva de la obra (o se toma de 'id'), así que volver a
+importar el mismo archivo actualiza las obras en lugar de duplicarlas, sin tocar sus
+ofertas ni su fecha de registro. Con RASTRO_BASE_DATOS=sqlite:<ruta> se importa a la
+base local (ver base_datos.py).
+"""
+import argparse
+import csv
+import hashlib
+import json
+import sys
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+import firebase_admin
+from firebase_admin import credentials, storage
+
+import base_datos
+
+# --- INICIALIZACIÓN DE FIREBASE ---
+# Antes de importar repositorio, que crea el cliente de la base de datos al importarse.
+# Con base local no se usa Firebase: tampoco Storage, así que solo se generan las
+# variantes de Wikimedia, que no requieren subir nada.
+try:
+    if not base_datos.es_local() and not firebase_admin._apps:
+        cred = credentials.Certificate('serviceAccountKey.json')
+        firebase_admin.initialize_app(cred, {'storageBucket': 'rastro-de-luz-d69a5.firebasestorage.app'})
+except Exception as e:
+    print(f"❌ Error al conectar con Firebase: {e}")
+    sys.exit(1)
+
+import repositorio  # noqa: E402
+import subida_imagenes  # noqa: E402
+
+# Obras que se leen, procesan y escriben juntas; acota la memoria sin importar el tamaño del archivo
+OBRAS_POR_TANDA = repositorio.MAX_OPERACIONES_POR_LOTE
+# Imágenes que se descargan, redimensionan y suben a la vez
+TRABAJADORES_IMAGENES = 16
+SEPARADOR_URLS_CSV = "|"
+
+
+# --- LECTURA DEL CATÁLOGO ---
+
+def leer_catalogo(ruta):
+    """Recorre el archivo obra por obra, sin cargarlo entero en memoria."""
+    with open(ruta, encoding="utf-8", newline="") as archivo:
+        if ruta.lower().endswith(".csv"):
+            for fila in csv.DictReader(archivo):
+                fila['image_urls'] = [url.strip() for url in (fila.get('image_urls') or '').split(SEPARADOR_URLS_CSV) if url.strip()]
+                yield fila
+        else:
+            for numero, linea in enumerate(archivo, start=1):
+                if linea.strip():
+                    try:
+                        yield json.loads(linea)
+                    except json.JSONDecodeError as e:
+                        raise ValueError(f"Línea {numero} no es JSON válido: {e}")
+
+
+def _normalizar(texto):
+    texto = unicodedata.normalize("NFKD", texto or "").encode("ascii", "ignore").decode("ascii")
+    return " ".join(texto.lower().split())
+
+
+def id_obra(entrada):
+    """ID determinista: el indicado en el catálogo o un hash del autor y el nombre."""
+    if entrada.get('id'):
+        return str(entrada['id'])
+    clave = f"{_normalizar(entrada.get('autor'))}|{_normalizar(entrada.get('nombre'))}"
+    return "obra-" + hashlib.sha256(clave.encode("utf-8")).hexdigest()[:20]
+
+
+def datos_obra(entrada):
+    """Campos de catálogo de la obra, validados."""
+    for campo in ('nombre', 'autor', 'descripcion'):
+        if not entrada.get(campo):
+            raise ValueError(f"Falta el campo '{campo}'.")
+    if not entrada.get('image_urls'):
+        raise ValueError("La obra no tiene imágenes.")
+    # Se acepta también el formato antiguo de cargar_obras.py, con el precio dentro de 'ofertas'
+    precio_base = entrada.get('precio_base', entrada.get('ofertas', {}).get('precio_base'))
+    return {
+        "nombre": entrada['nombre'], "autor": entrada['autor'], "fecha": entrada.get('fecha', ''),
+        "descripcion": entrada['descripcion'], "image_urls": list(entrada['image_urls']),
+        "ofertas": {"precio_base": float(precio_base)},
+    }
+
+
+# --- IMÁGENES ---
+
+def variantes_de(bucket, origen):
+    """Wikimedia se resuelve reescribiendo URLs; el resto se descarga, se redimensiona y se sube."""
+    variantes = subida_imagenes.variantes_wikimedia(origen) if origen.startswith("http") else None
+    if variantes is None and bucket is not None:
+        variantes = subida_imagenes.ingerir_imagen(bucket, origen)
+    return variantes or {}
+
+
+def procesar_imagenes(ejecutor, bucket, obras):
+    """Resuelve en paralelo las imágenes de una tanda; devuelve los errores por ID de obra."""
+    futuros = {}
+    for obra_id, datos in obras.items():
+        futuros[obra_id] = [ejecutor.submit(variantes_de, bucket, origen) for origen in datos['image_urls']]
+
+    errores = {}
+    for obra_id, pendientes in futuros.items():
+        try:
+            variantes_imagenes = [futuro.result() for futuro in pendientes]
+        except Exception as e:
+            errores[obra_id] = e
+            continue
+        datos = obras[obra_id]
+        if any(variantes_imagenes):
+            datos['variantes_imagenes'] = variantes_imagenes
+            # Las imágenes propias se muestran desde Storage; las de Wikimedia conservan su URL
+            datos['image_urls'] = [v.get(subida_imagenes.VARIANTE_COMPLETA, origen)
+                                   for v, origen in zip(variantes_imagenes, datos['image_urls'])]
+    return errores
+
+
+# --- IMPORTACIÓN ---
+
+def escribir_tanda(db, escritor, obras):
+    """Crea las obras nuevas y actualiza las existentes sin pisar sus ofertas ni su fecha."""
+    coleccion = db.collection('obras_subasta')
+    referencias = [coleccion.document(obra_id) for obra_id in obras]
+    existentes = {snapshot.id for snapshot in db.get_all(referencias) if snapshot.exists}
+    for referencia in referencias:
+        datos = obras[referencia.id]
+        if referencia.id not in existentes:
+            datos['ofertas']['subasta_abierta'] = True
+            datos['timestamp'] = base_datos.SERVER_TIMESTAMP
+        datos['actualizado'] = base_datos.SERVER_TIMESTAMP
+        escritor.set(referencia, datos, merge=True)
+    return len(referencias) - len(existentes)
+
+
+def importar(ruta, con_imagenes=True, max_operaciones_por_segundo=None, bucket=None):
+    db = base_datos.obtener_db()
+    escritor = repositorio.EscritorPorLotes(db, max_operaciones_por_segundo=max_operaciones_por_segundo)
+    totales = {'leidas': 0, 'nuevas': 0, 'actualizadas': 0, 'con_error': 0}
+    inicio = time.monotonic()
+
+    def procesar_tanda(tanda):
+        if con_imagenes:
+            for obra_id, error in procesar_imagenes(ejecutor, bucket, tanda).items():
+                print(f"❌ Obra {obra_id}: no se pudieron procesar sus imágenes: {error}")
+                del tanda[obra_id]
+                totales['con_error'] += 1
+        if tanda:
+            nuevas = escribir_tanda(db, escritor, tanda)
+            totales['nuevas'] += nuevas
+            totales['actualizadas'] += len(tanda) - nuevas
+        escritor.flush()
+        ritmo = totales['leidas'] / max(time.monotonic() - inicio, 1e-6)
+        print(f"  {totales['leidas']} obras procesadas ({ritmo:.0f}/s)")
+
+    with ThreadPoolExecutor(max_workers=TRABAJADORES_IMAGENES, thread_name_prefix="importar-imagen") as ejecutor:
+        tanda = {}
+        for numero, entrada in enumerate(leer_catalogo(ruta), start=1):
+            totales['leidas'] += 1
+            try:
+                tanda[id_obra(entrada)] = datos_obra(entrada)
+            except (ValueError, TypeError) as e:
+                print(f"❌ Obra {numero} del catálogo ignorada: {e}")
+                totales['con_error'] += 1
+            if len(tanda) >= OBRAS_POR_TANDA:
+                procesar_tanda(tanda)
+                tanda = {}
+        if tanda:
+            procesar_tanda(tanda)
+    escritor.close()
+
+    print(f"\n✅ Importación finalizada en {time.monotonic() - inicio:.1f} s: {totales['nuevas']} nuevas, "
+          f"{totales['actualizadas']} actualizadas, {totales['con_error']} con error.")
+    return totales
+
+
+def conectar(con_imagenes):
+    """Devuelve el bucket de Storage, o None si no se suben imágenes o la base es local."""
+    if base_datos.es_local() or not con_imagenes:
+        return None
+    return storage.bucket()
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("catalogo", help="Archivo .csv o .jsonl con las obras")
+    parser.add_argument("--sin-imagenes", action="store_true",
+                        help="Guarda las URLs tal cual, sin generar variantes ni subir nada a Storage")
+    parser.add_argument("--max-ops-por-segundo", type=int, default=None,
+                        help="Tope de escrituras por segundo (por defecto, la regla 500/50/5)")
+    args = parser.parse_args(argumentos)
+
+    con_imagenes = not args.sin_imagenes
+    try:
+        bucket = conectar(con_imagenes)
+        print("✅ Conexión con la base de datos exitosa.")
+    except Exception as e:
+        print(f"❌ Error al conectar con Firebase Storage: {e}")
+        sys.exit(1)
+    return importar(args.catalogo, con_imagenes, args.max_ops_por_segundo, bucket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+import tkinter as tk
+
+import despachador_tk
+
+
+class ListaVirtual:
+    """
+    Lista desplazable que solo materializa las filas que están en pantalla (o cerca)
+    y recicla sus widgets al hacer scroll. Todas las filas tienen la misma altura,
+    así la posición de cada elemento se calcula sin tener que dibujarlo.
+
+    - crear_fila(parent) construye una fila vacía y devuelve un dict con al menos 'contenedor'.
+    - llenar_fila(fila, clave, datos, visible) pinta un elemento sobre una fila (nueva o reciclada).
+    - al_acercarse_al_final(), opcional, se llama cuando la vista llega cerca del último
+      elemento; sirve para pedir la página siguiente de una consulta paginada.
+    - al_cambiar_seleccion(seleccionadas), opcional, se llama al marcar o desmarcar
+      elementos; la selección vive en la lista porque las filas se reciclan.
+    """
+
+    def __init__(self, parent, alto_fila, crear_fila, llenar_fila, bg="#d0e7f9", separacion=10, margen=10, filas_extra=2,
+                 al_acercarse_al_final=None, al_cambiar_seleccion=None):
+        self.alto_fila = alto_fila
+        self.paso = alto_fila + separacion
+        self.margen = margen
+        self.filas_extra = filas_extra
+        self.crear_fila = crear_fila
+        self.llenar_fila = llenar_fila
+        self.al_acercarse_al_final = al_acercarse_al_final
+        self.al_cambiar_seleccion = al_cambiar_seleccion
+
+        self.canvas = tk.Canvas(parent, bg=bg, highlightthickness=0, yscrollincrement=max(1, self.paso // 4))
+        self.scrollbar = tk.Scrollbar(parent, orient="vertical", command=self._desplazar)
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        self.canvas.bind("<Configure>", lambda e: self.redibujar())
+        self._enlazar_rueda(self.canvas)
+
+        self.claves = []
+        self.datos = {}
+        self._indices = {}
+        self._redibujo_pendiente = False
+        self._filas = {}    # clave -> (fila, id de la ventana en el canvas)
+        self._libres = []   # filas sin elemento asignado, listas para reciclar
+        self._mensaje = None
+        self.paginador = None
+        self._cargando = False
+        self.seleccionadas = set()
+
+    def pack(self):
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+
+    # --- MODIFICACIÓN DE LOS ELEMENTOS ---
+
+    def __contains__(self, clave):
+        return clave in self.datos
+
+    def __len__(self):
+        return len(self.claves)
+
+    def indice_de(self, clave):
+        if self._indices is None:
+            self._reindexar()
+        return self._indices[clave]
+
+    def establecer(self, elementos):
+        """Reemplaza todos los elementos por la lista de pares (clave, datos)."""
+        self.claves = [clave for clave, _ in elementos]
+        self.datos = dict(elementos)
+        self._indices = None
+        self._cambiar_seleccion(set())
+        for clave in list(self._filas):
+            self._liberar(clave)
+        self._programar_redibujo()
+
+    def insertar(self, clave, datos, indice=None):
+        """Inserta un elemento, o lo mueve y actualiza si ya existía."""
+        if clave in self.datos:
+            self.claves.remove(clave)
+        indice = len(self.claves) if indice is None else min(indice, len(self.claves))
+        self.claves.insert(indice, clave)
+        self.datos[clave] = datos
+        self._indices = None
+        if clave in self._filas:
+            self._rellenar(clave)
+        self._programar_redibujo()
+
+    def actualizar(self, clave, datos):
+        """Cambia los datos de un elemento; solo se repinta si su fila está materializada."""
+        self.datos[clave] = datos
+        if clave in self._filas:
+            self._rellenar(clave)
+
+    def eliminar(self, clave):
+        if clave not in self.datos:
+            return
+        self.claves.remove(clave)
+        del self.datos[clave]
+        self._indices = None
+        if clave in self.seleccionadas:
+            self._cambiar_seleccion(self.seleccionadas - {clave})
+        if clave in self._filas:
+            self._liberar(clave)
+        self._programar_redibujo()
+
+    def aplicar_cambios(self, cambios, clave_orden):
+        """
+        Aplica cambios (tipo, clave, datos) con los tipos de los listeners de Firestore:
+        'REMOVED' quita el elemento y los demás lo actualizan en su lugar, o lo insertan donde
+        le toca si es nuevo o cambió su clave_orden(clave, datos). La lista va de mayor a menor.
+        """
+        for tipo, clave, datos in cambios:
+            if tipo == 'REMOVED':
+                self.eliminar(clave)
+                continue
+            orden = clave_orden(clave, datos)
+            if clave in self.datos and clave_orden(clave, self.datos[clave]) == orden:
+                self.actualizar(clave, datos)
+                continue
+            self.eliminar(clave)
+            bajo, alto = 0, len(self.claves)
+            while bajo < alto:
+                medio = (bajo + alto) // 2
+                otra = self.claves[medio]
+                if clave_orden(otra, self.datos[otra]) > orden:
+                    bajo = medio + 1
+                else:
+                    alto = medio
+            self.insertar(clave, datos, bajo)
+
+    def refrescar(self):
+        """Vuelve a pintar las filas materializadas (p. ej. tras un cambio de estado global)."""
+        for clave in self._filas:
+            self._rellenar(clave)
+
+    # --- SELECCIÓN ---
+
+    def seleccionar(self, clave, marcada=True):
+        if clave in self.datos:
+            self._cambiar_seleccion(self.seleccionadas | {clave} if marcada else self.seleccionadas - {clave})
+
+    def seleccionar_todas(self):
+        """Marca todos los elementos cargados (en una lista paginada, solo las páginas ya pedidas)."""
+        self._cambiar_seleccion(set(self.claves))
+        self.refrescar()
+
+    def limpiar_seleccion(self):
+        self._cambiar_seleccion(set())
+        self.refrescar()
+
+    def _cambiar_seleccion(self, seleccionadas):
+        if seleccionadas == self.seleccionadas:
+            return
+        self.seleccionadas = seleccionadas
+        if self.al_cambiar_seleccion:
+            self.al_cambiar_seleccion(seleccionadas)
+
+    def mostrar_mensaje(self, texto, color="black"):
+        """Muestra un texto sobre la lista (errores o lista vacía); None lo oculta."""
+        if self._mensaje is not None:
+            self.canvas.delete(self._mensaje)
+            self._mensaje = None
+        if texto:
+            self._mensaje = self.canvas.create_text(self.margen, self.margen, text=texto, fill=color, anchor="nw", font=("Arial", 13))
+
+    # --- CARGA PAGINADA ---
+
+    def usar_paginador(self, paginador, descripcion, convertir=None):
+        """
+        Vacía la lista y la alimenta desde 'paginador' (ver repositorio.Paginador):
+        carga la primera página y pide las siguientes al acercarse al final.
+        'convertir(doc)' devuelve el par (clave, datos) de cada documento.
+        """
+        self.paginador = paginador
+        self._descripcion = descripcion
+        self._convertir = convertir or _convertir_documento
+        self._cargando = False
+        self.al_acercarse_al_final = self.cargar_pagina
+        self.mostrar_mensaje(None)
+        self.establecer([])
+        self.cargar_pagina()
+
+    def cargar_pagina(self):
+        """Pide en segundo plano la siguiente página; solo hay una petición en curso."""
+        paginador = self.paginador
+        if self._cargando or paginador.agotado:
+            return
+        self._cargando = True
+
+        def al_terminar(resultado):
+            if paginador is not self.paginador:
+                return  # La lista se refrescó mientras tanto; esta página ya no aplica
+            self._cargando = False
+            _, documentos = resultado
+            for doc in documentos:
+                clave, datos = self._convertir(doc)
+                if clave not in self:
+                    self.insertar(clave, datos)
+            if not self and paginador.agotado:
+                self.mostrar_mensaje(f"No hay {self._descripcion} para mostrar.")
+
+        def al_fallar(e):
+            if paginador is self.paginador:
+                self._cargando = False
+                self.mostrar_mensaje(f"Error al cargar {self._descripcion}: {e}", "red")
+
+        despachador_tk.ejecutar_en_segundo_plano(paginador.siguiente_pagina, al_terminar, al_fallar)
+
+    # --- MATERIALIZACIÓN DE FILAS ---
+
+    def _reindexar(self):
+        self._indices = {clave: i for i, clave in enumerate(self.claves)}
+
+    def _programar_redibujo(self):
+        # Muchos cambios seguidos (p. ej. la primera carga) se resuelven en un solo redibujo
+        if not self._redibujo_pendiente:
+            self._redibujo_pendiente = True
+            self.canvas.after_idle(self.redibujar)
+
+    def _rango_visible(self):
+        arriba = self.canvas.canvasy(0)
+        abajo = arriba + self.canvas.winfo_height()
+        return int(arriba // self.paso), int(abajo // self.paso)
+
+    def _rellenar(self, clave):
+        fila, _ = self._filas[clave]
+        primero, ultimo = self._rango_visible()
+        self.llenar_fila(fila, clave, self.datos[clave], primero <= self.indice_de(clave) <= ultimo)
+
+    def _liberar(self, clave):
+        fila, id_ventana = self._filas.pop(clave)
+        # Se saca de la vista en lugar de destruirla, para reutilizarla después
+        self.canvas.coords(id_ventana, 0, -2 * self.paso)
+        self._libres.append((fila, id_ventana))
+
+    def redibujar(self):
+        self._redibujo_pendiente = False
+        ancho = max(self.canvas.winfo_width() - 2 * self.margen, 1)
+        self.canvas.configure(scrollregion=(0, 0, ancho, len(self.claves) * self.paso + self.margen))
+
+        primero_visible, ultimo_visible = self._rango_visible()
+        primero = max(0, primero_visible - self.filas_extra)
+        ultimo = min(len(self.claves) - 1, ultimo_visible + self.filas_extra)
+        necesarias = set(self.claves[primero:ultimo + 1])
+
+        for clave in [clave for clave in self._filas if clave not in necesarias]:
+            self._liberar(clave)
+
+        for indice in range(primero, ultimo + 1):
+            clave = self.claves[indice]
+            if clave in self._filas:
+                fila, id_ventana = self._filas[clave]
+            else:
+                if self._libres:
+                    fila, id_ventana = self._libres.pop()
+                else:
+                    fila = self.crear_fila(self.canvas)
+                    self._enlazar_rueda(fila['contenedor'])
+                    id_ventana = self.canvas.create_window(0, 0, window=fila['contenedor'], anchor="nw")
+                self._filas[clave] = (fila, id_ventana)
+                self.llenar_fila(fila, clave, self.datos[clave], primero_visible <= indice <= ultimo_visible)
+            self.canvas.coords(id_ventana, self.margen, self.margen + indice * self.paso)
+            self.canvas.itemconfigure(id_ventana, width=ancho, height=self.alto_fila)
+
+        if self.al_acercarse_al_final and ultimo_visible >= len(self.claves) - 1 - self.filas_extra:
+            self.al_acercarse_al_final()
+
+    # --- SCROLL ---
+
+    def _desplazar(self, *args):
+        self.canvas.yview(*args)
+        self.redibujar()
+
+    def _al_girar_rueda(self, event):
+        if event.num == 4:
+            pasos = -1
+        elif event.num == 5:
+            pasos = 1
+        else:
+            pasos = -1 if event.delta > 0 else 1
+        self.canvas.yview_scroll(pasos, "units")
+        self.redibujar()
+
+    def _enlazar_rueda(self, widget):
+        # Las filas tapan el canvas, así que la rueda se enlaza también en cada widget de la fila
+        for evento in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            widget.bind(evento, self._al_girar_rueda, add="+")
+        for hijo in widget.winfo_children():
+            self._enlazar_rueda(hijo)
+
+
+def _convertir_documento(doc):
+    datos = doc.to_dict()
+    datos.setdefault('id', doc.id)
+    return doc.id, datos
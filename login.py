@@ -1,28 +1,72 @@
 import tkinter as tk
 from tkinter import messagebox
-import firebase_admin
-from firebase_admin import credentials
-
-# --- MÓDULOS DE LA APLICACIÓN ---
-# Se importarán después de inicializar Firebase para evitar errores.
-
-# --- INICIALIZACIÓN DE FIREBASE ---
-try:
-    if not firebase_admin._apps:
-        cred = credentials.Certificate('serviceAccountKey.json')
-        firebase_admin.initialize_app(cred, {
-            # Asegúrate de que esta línea coincida exactamente
-            'storageBucket': 'rastro-de-luz-d69a5.firebasestorage.app'
-        })
-    print("✅ Conexión con Firebase (Firestore y Storage) exitosa.")
-except Exception as e:  
-    messagebox.showerror("Error Crítico", f"No se pudo conectar a Firebase: {e}")
-    exit()
-
-# Ahora que Firebase está inicializado, importamos nuestros módulos
-from auth import registrar_usuario, verificar_usuario
-from galeria_admin import abrir_panel_admin
-from galeria_app import abrir_galeria
+import os
+import threading
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import base_datos
+import despachador_tk
+import sesion
+
+# --- CARGA EN SEGUNDO PLANO ---
+# La ventana de selección de rol se pinta sin esperar a Firebase ni a las galerías (PIL,
+# requests, el cliente de Firestore...): todo eso se carga en un hilo mientras el usuario
+# elige. Las acciones que lo necesitan esperan a la carga fuera del hilo de Tk.
+_carga = Future()
+
+
+def _conectar_e_importar():
+    # Con un backend local (RASTRO_BASE_DATOS=memoria o sqlite:<ruta>) Firestore no se usa,
+    # pero Firebase se inicializa igual si hay credenciales, para poder subir imágenes a Storage.
+    if base_datos.es_local() and not os.path.exists('serviceAccountKey.json'):
+        print(f"Usando la base de datos local, sin Firebase: {os.environ.get(base_datos.VARIABLE_ENTORNO)}")
+    else:
+        import firebase_admin
+        from firebase_admin import credentials
+        if not firebase_admin._apps:
+            cred = credentials.Certificate('serviceAccountKey.json')
+            firebase_admin.initialize_app(cred, {
+                # Asegúrate de que esta línea coincida exactamente
+                'storageBucket': 'rastro-de-luz-d69a5.firebasestorage.app'
+            })
+        print("✅ Conexión con Firebase (Firestore y Storage) exitosa.")
+        # La conexión se abre mientras se importan las galerías y el usuario elige su rol,
+        # así la primera consulta de la galería no espera al canal ni al token de acceso
+        threading.Thread(target=base_datos.precalentar, name="precalentar-firestore", daemon=True).start()
+
+    # Estos módulos crean el cliente de la base de datos al importarse: van después de Firebase
+    import auth
+    from galeria_admin import abrir_panel_admin
+    from galeria_app import abrir_galeria
+    return SimpleNamespace(auth=auth, abrir_panel_admin=abrir_panel_admin, abrir_galeria=abrir_galeria)
+
+
+def _cargar():
+    try:
+        _carga.set_result(_conectar_e_importar())
+    except BaseException as e:
+        _carga.set_exception(e)
+
+
+def iniciar_carga():
+    """Arranca la carga en segundo plano (solo una vez)."""
+    if not _carga.running() and not _carga.done():
+        _carga.set_running_or_notify_cancel()
+        threading.Thread(target=_cargar, name="carga-inicial", daemon=True).start()
+
+
+def modulos():
+    """Espera a que termine la carga y devuelve los módulos; no llamar desde el hilo de Tk."""
+    return _carga.result()
+
+
+def cuando_cargue(funcion):
+    """Ejecuta 'funcion(modulos)' en el hilo de Tk en cuanto termine la carga (si tuvo éxito)."""
+    def al_terminar(futuro):
+        if futuro.exception() is None:
+            despachador_tk.publicar(funcion, futuro.result())
+    _carga.add_done_callback(al_terminar)
 
 # Código secreto para el acceso de administrador
 CODIGO_ADMIN = "050806"
@@ -60,9 +104,31 @@ def mostrar_formulario(root, rol, accion):
     entrada_contraseña = tk.Entry(frame_campos, font=fuente, width=30, show="*")
     entrada_contraseña.grid(row=2, column=1, padx=5, pady=5)
 
+    recordar_sesion = tk.BooleanVar(value=True)
+    if accion != "registro":
+        tk.Checkbutton(frame_campos, text="Mantener la sesión iniciada", variable=recordar_sesion,
+                       font=("Arial", 11), bg="#d0e7f9").grid(row=3, column=1, sticky="w", padx=5)
+
+    # El hash de la contraseña tarda cientos de milisegundos a propósito: registro y login
+    # corren en el pool de trabajo y el formulario queda bloqueado hasta la respuesta
+    def en_espera(activa):
+        estado = tk.DISABLED if activa else tk.NORMAL
+        boton_accion.config(state=estado, text="Verificando..." if activa else texto_boton)
+        ventana_formulario.config(cursor="watch" if activa else "")
+
+    def al_fallar(e):
+        en_espera(False)
+        messagebox.showerror("Error", f"Ocurrió un error inesperado: {e}", parent=ventana_formulario)
+
     def procesar_registro():
-        ok, msg = registrar_usuario(
-            entrada_nombre.get(), entrada_correo.get(), entrada_contraseña.get(), rol=rol)
+        en_espera(True)
+        nombre, correo, clave = entrada_nombre.get(), entrada_correo.get(), entrada_contraseña.get()
+        despachador_tk.ejecutar_en_segundo_plano(lambda: modulos().auth.registrar_usuario(nombre, correo, clave, rol=rol),
+                                                 al_registrar, al_fallar)
+
+    def al_registrar(resultado):
+        en_espera(False)
+        ok, msg = resultado
         if ok:
             messagebox.showinfo("Éxito", "Usuario registrado. Ahora puedes iniciar sesión.", parent=ventana_formulario)
             al_cerrar()
@@ -70,29 +136,87 @@ def mostrar_formulario(root, rol, accion):
             messagebox.showerror("Error", msg, parent=ventana_formulario)
 
     def procesar_login():
-        datos_usuario, msg = verificar_usuario(entrada_correo.get(), entrada_contraseña.get())
+        en_espera(True)
+        correo, clave = entrada_correo.get(), entrada_contraseña.get()
+        despachador_tk.ejecutar_en_segundo_plano(lambda: modulos().auth.verificar_usuario(correo, clave), al_verificar, al_fallar)
+
+    def al_verificar(resultado):
+        en_espera(False)
+        datos_usuario, msg = resultado
         if datos_usuario:
             if datos_usuario.get('rol') != rol:
                 messagebox.showerror("Acceso Denegado", f"Tus credenciales son correctas, pero no tienes permisos de '{rol}'.", parent=ventana_formulario)
                 return
             
-            ventana_formulario.destroy() 
-            if rol == 'admin':
-                abrir_panel_admin(root, datos_usuario)
+            if recordar_sesion.get():
+                sesion.guardar_sesion(datos_usuario)
             else:
-                abrir_galeria(root, datos_usuario)
+                sesion.olvidar_sesion()
+            ventana_formulario.destroy()
+            abrir_ventana_de_rol(root, datos_usuario)
         else:
             messagebox.showerror("Error", msg, parent=ventana_formulario)
 
     if accion == "registro":
-        tk.Button(ventana_formulario, text="Registrarse", font=("Arial", 13), bg="#a2f5a2", width=20, command=procesar_registro).pack(pady=10)
+        texto_boton = "Registrarse"
+        boton_accion = tk.Button(ventana_formulario, text=texto_boton, font=("Arial", 13), bg="#a2f5a2", width=20, command=procesar_registro)
     else:
-        tk.Button(ventana_formulario, text="Ingresar", font=("Arial", 13), bg="#99ccff", width=20, command=procesar_login).pack(pady=10)
+        texto_boton = "Ingresar"
+        boton_accion = tk.Button(ventana_formulario, text=texto_boton, font=("Arial", 13), bg="#99ccff", width=20, command=procesar_login)
+    boton_accion.pack(pady=10)
 
     tk.Button(ventana_formulario, text="‹ Volver", font=("Arial", 11),
               relief="flat", fg="blue", bg="#d0e7f9", cursor="hand2", command=al_cerrar).pack(pady=15)
 
 
+def abrir_ventana_de_rol(root, datos_usuario):
+    """
+    Abre el panel de administración o la galería según el rol; devuelve la función que la cierra.
+    Solo se llama con la carga terminada (tras verificar al usuario o desde cuando_cargue).
+    """
+    if datos_usuario.get('rol') == 'admin':
+        return modulos().abrir_panel_admin(root, datos_usuario)
+    return modulos().abrir_galeria(root, datos_usuario)
+
+
+def retomar_sesion(root):
+    """
+    Si hay una sesión guardada, abre directamente la galería del usuario, sin consultar
+    Firestore ni recalcular el hash de la contraseña. La sesión se comprueba después en
+    segundo plano; si ya no vale (cambió la contraseña o el rol), se cierra la ventana.
+    El panel de administración no se abre hasta que la comprobación termina.
+    """
+    datos_sesion = sesion.cargar_sesion()
+    if datos_sesion is None:
+        return False
+    cuando_cargue(lambda _: abrir_y_comprobar(root, datos_sesion))
+    return True
+
+
+def abrir_y_comprobar(root, datos_sesion):
+    # Una sesión de administrador da acceso a borrar obras y editar usuarios: no se confía
+    # en el archivo local hasta que el servidor confirme el usuario y su rol
+    es_admin = datos_sesion.get('rol') == 'admin'
+    cerrar_ventana = None if es_admin else abrir_ventana_de_rol(root, datos_sesion)
+
+    def al_comprobar(resultado):
+        datos_usuario, msg = resultado
+        if datos_usuario is None:
+            sesion.olvidar_sesion(datos_sesion['id'])
+            if cerrar_ventana:
+                cerrar_ventana()
+            messagebox.showwarning("Sesión finalizada", msg, parent=root)
+        elif es_admin:
+            abrir_ventana_de_rol(root, datos_usuario)
+
+    def al_fallar(e):
+        # Sin conexión no se puede comprobar: se mantiene la sesión y se comprobará al reabrir.
+        # El administrador se queda en la pantalla inicial y puede iniciar sesión a mano
+        print(f"No se pudo comprobar la sesión guardada: {e}")
+
+    despachador_tk.ejecutar_en_segundo_plano(lambda: modulos().auth.comprobar_sesion(datos_sesion), al_comprobar, al_fallar)
+
+
 def mostrar_opciones_login(root, rol):
     """Muestra los botones 'Iniciar Sesión' y 'Registrarse'."""
     root.withdraw()
@@ -156,6 +280,8 @@ def iniciar_app_escritorio():
     root.title("Bienvenido a Rastro de Luz")
     root.geometry("500x300")
     root.configure(bg="#d0e7f9")
+    despachador_tk.instalar(root)
+    iniciar_carga()
     fuente = ("Arial", 14)
 
     tk.Label(root, text="🎨 Rastro de Luz", font=("Arial", 24, "bold"), bg="#d0e7f9").pack(pady=30)
@@ -163,6 +289,16 @@ def iniciar_app_escritorio():
               command=lambda: mostrar_opciones_login(root, "usuario")).pack(pady=10)
     tk.Button(root, text="Acceso Administración", font=fuente, width=25, height=2,
               command=lambda: validar_admin(root)).pack(pady=10)
+    retomar_sesion(root)
+
+    def al_fallar_carga(futuro):
+        if futuro.exception() is not None:
+            despachador_tk.publicar(error_critico, futuro.exception())
+
+    def error_critico(e):
+        messagebox.showerror("Error Crítico", f"No se pudo conectar a Firebase: {e}", parent=root)
+        root.destroy()
+    _carga.add_done_callback(al_fallar_carga)
     root.mainloop()
 
 
@@ -0,0 +1,144 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import ContextDecorator
+from datetime import datetime, timezone
+
+# --- MÉTRICAS DE RENDIMIENTO ---
+# Contadores y tiempos de los caminos calientes (lecturas de Firestore, imágenes, armado de
+# tarjetas, login), en memoria y con costo mínimo: cada tiempo va a un búfer circular, así
+# que los percentiles reflejan las últimas TAMANO_VENTANA mediciones y la memoria no crece.
+# Los muestra la pestaña oculta de diagnóstico del panel de administración (Ctrl+Shift+D)
+# y, con RASTRO_METRICAS=<ruta>, se exportan a un archivo cada INTERVALO_EXPORTACION_S:
+#   *.prom  formato de texto de Prometheus (se reescribe entero)
+#   otro    JSONL, una línea con todas las métricas por exportación
+
+VARIABLE_ENTORNO = "RASTRO_METRICAS"
+TAMANO_VENTANA = 2048
+INTERVALO_EXPORTACION_S = 60
+PREFIJO_PROMETHEUS = "rastro_"
+
+_lock = threading.Lock()
+_contadores = {}
+_histogramas = {}
+
+
+class _Histograma:
+    def __init__(self):
+        self.muestras = deque(maxlen=TAMANO_VENTANA)
+        self.conteo = 0
+        self.suma = 0.0
+
+    def observar(self, valor):
+        self.muestras.append(valor)
+        self.conteo += 1
+        self.suma += valor
+
+    def resumen(self):
+        ordenadas = sorted(self.muestras)
+        percentil = lambda p: ordenadas[min(len(ordenadas) - 1, int(p * len(ordenadas)))] if ordenadas else 0.0
+        return {'conteo': self.conteo, 'suma_ms': self.suma, 'p50_ms': percentil(0.50),
+                'p95_ms': percentil(0.95), 'p99_ms': percentil(0.99), 'max_ms': ordenadas[-1] if ordenadas else 0.0}
+
+
+def contar(nombre, cantidad=1):
+    with _lock:
+        _contadores[nombre] = _contadores.get(nombre, 0) + cantidad
+
+
+def observar(nombre, milisegundos):
+    with _lock:
+        histograma = _histogramas.get(nombre)
+        if histograma is None:
+            histograma = _histogramas[nombre] = _Histograma()
+        histograma.observar(milisegundos)
+
+
+class medir(ContextDecorator):
+    """Mide en milisegundos lo que tarda un bloque ('with medir(...)') o una función (@medir(...))."""
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+
+    def _recreate_cm(self):
+        # Como decorador, ContextDecorator usa esta instancia en cada llamada; se devuelve
+        # una nueva para que las llamadas concurrentes no se pisen el tiempo de inicio
+        return medir(self.nombre)
+
+    def __enter__(self):
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observar(self.nombre, (time.perf_counter() - self._inicio) * 1000)
+        return False
+
+
+def instantanea():
+    """Devuelve {'contadores': {nombre: valor}, 'tiempos': {nombre: resumen}}, ordenados por nombre."""
+    with _lock:
+        return {
+            'contadores': dict(sorted(_contadores.items())),
+            'tiempos': {nombre: h.resumen() for nombre, h in sorted(_histogramas.items())},
+        }
+
+
+def reiniciar():
+    with _lock:
+        _contadores.clear()
+        _histogramas.clear()
+
+
+# --- EXPORTACIÓN ---
+
+def _nombre_prometheus(nombre):
+    return PREFIJO_PROMETHEUS + "".join(c if c.isalnum() else "_" for c in nombre)
+
+
+def formato_prometheus(datos):
+    lineas = []
+    for nombre, valor in datos['contadores'].items():
+        metrica = _nombre_prometheus(nombre) + "_total"
+        lineas += [f"# TYPE {metrica} counter", f"{metrica} {valor}"]
+    for nombre, resumen in datos['tiempos'].items():
+        metrica = _nombre_prometheus(nombre) + "_ms"
+        lineas.append(f"# TYPE {metrica} summary")
+        for cuantil, campo in (("0.5", 'p50_ms'), ("0.95", 'p95_ms'), ("0.99", 'p99_ms')):
+            lineas.append(f'{metrica}{{quantile="{cuantil}"}} {resumen[campo]:.3f}')
+        lineas += [f"{metrica}_sum {resumen['suma_ms']:.3f}", f"{metrica}_count {resumen['conteo']}"]
+    return "\n".join(lineas) + "\n"
+
+
+def exportar(ruta):
+    """Guarda las métricas actuales en 'ruta': Prometheus si termina en .prom, JSONL si no."""
+    datos = instantanea()
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    os.makedirs(directorio, exist_ok=True)
+    if ruta.endswith(".prom"):
+        # Se escribe aparte y se reemplaza, para que quien lo recolecte nunca lea un archivo a medias
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            archivo.write(formato_prometheus(datos))
+        os.replace(temporal, ruta)
+    else:
+        datos['fecha'] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        with open(ruta, "a", encoding="utf-8") as archivo:
+            archivo.write(json.dumps(datos) + "\n")
+
+
+def _exportar_periodicamente(ruta):
+    while True:
+        time.sleep(INTERVALO_EXPORTACION_S)
+        try:
+            exportar(ruta)
+        except OSError as e:
+            print(f"No se pudieron exportar las métricas: {e}")
+
+
+_ruta_exportacion = os.environ.get(VARIABLE_ENTORNO)
+if _ruta_exportacion:
+    threading.Thread(target=_exportar_periodicamente, args=(_ruta_exportacion,), name="exportar-metricas", daemon=True).start()
+    atexit.register(exportar, _ruta_exportacion)
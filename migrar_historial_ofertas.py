@@ -0,0 +1,69 @@
+import firebase_admin
+from firebase_admin import credentials
+import base_datos
+
+# --- INICIALIZACIÓN DE FIREBASE ---
+# Con RASTRO_BASE_DATOS=sqlite:<ruta> los datos van a la base local en lugar de a Firestore
+try:
+    if not base_datos.es_local() and not firebase_admin._apps:
+        cred = credentials.Certificate('serviceAccountKey.json')
+        firebase_admin.initialize_app(cred)
+    db = base_datos.obtener_db()
+    print("✅ Conexión con la base de datos exitosa.")
+except Exception as e:
+    print(f"❌ Error al conectar con Firebase: {e}")
+    exit()
+
+# --- MIGRACIÓN DEL HISTORIAL DE OFERTAS ---
+# Las obras antiguas guardan sus ofertas en el arreglo 'historial_ofertas'. Este script
+# las copia a la subcolección obras_subasta/{id}/ofertas, escribe en la obra el resumen
+# (precio_actual, mejor_oferta, num_ofertas) y borra el arreglo.
+# Los IDs de las ofertas copiadas son fijos (legacy-0, legacy-1, ...), así que volver
+# a ejecutar el script tras un fallo no duplica nada.
+
+# Límite de escrituras de un lote de Firestore
+MAX_ESCRITURAS_POR_LOTE = 500
+
+
+def migrar_obra(obra_doc):
+    """Migra una obra en uno o varios lotes; el arreglo se borra en el último."""
+    obra_ref = obra_doc.reference
+    obra_data = obra_doc.to_dict()
+    historial = obra_data.get('historial_ofertas', [])
+
+    lote = db.batch()
+    escrituras = 0
+    for i, oferta in enumerate(historial):
+        lote.set(obra_ref.collection('ofertas').document(f"legacy-{i}"), oferta)
+        escrituras += 1
+        if escrituras == MAX_ESCRITURAS_POR_LOTE:
+            lote.commit()
+            lote = db.batch()
+            escrituras = 0
+
+    resumen = {'historial_ofertas': base_datos.DELETE_FIELD, 'num_ofertas': len(historial),
+               'actualizado': base_datos.SERVER_TIMESTAMP}
+    if historial:
+        # subasta crea su cliente al importarse, así que se importa con Firebase ya iniciado
+        from subasta import mejor_oferta_de
+        mejor_oferta = mejor_oferta_de(obra_data)
+        resumen['mejor_oferta'] = mejor_oferta
+        resumen['precio_actual'] = mejor_oferta.get('monto', 0)
+    lote.update(obra_ref, resumen)
+    lote.commit()
+    return len(historial)
+
+
+print("Buscando obras con historial en el documento...")
+migradas = 0
+for obra_doc in db.collection('obras_subasta').stream():
+    if 'historial_ofertas' not in (obra_doc.to_dict() or {}):
+        continue
+    try:
+        num_ofertas = migrar_obra(obra_doc)
+        migradas += 1
+        print(f"✔️ Obra '{obra_doc.get('nombre')}': {num_ofertas} ofertas migradas.")
+    except Exception as e:
+        print(f"❌ No se pudo migrar la obra {obra_doc.id}: {e}")
+
+print(f"\n✅ Migración finalizada: {migradas} obras actualizadas.")
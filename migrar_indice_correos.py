@@ -0,0 +1,53 @@
+import firebase_admin
+from firebase_admin import credentials
+import base_datos
+
+# --- INICIALIZACIÓN DE FIREBASE ---
+# Con RASTRO_BASE_DATOS=sqlite:<ruta> los datos van a la base local en lugar de a Firestore
+try:
+    if not base_datos.es_local() and not firebase_admin._apps:
+        cred = credentials.Certificate('serviceAccountKey.json')
+        firebase_admin.initialize_app(cred)
+    db = base_datos.obtener_db()
+    print("✅ Conexión con la base de datos exitosa.")
+except Exception as e:
+    print(f"❌ Error al conectar con Firebase: {e}")
+    exit()
+
+import auth  # noqa: E402  Crea su cliente al importarse, con Firebase ya iniciado
+import repositorio  # noqa: E402
+
+# --- MIGRACIÓN AL ÍNDICE DE CORREOS ---
+# Crea usuarios_por_correo/{correo} para los usuarios registrados antes del índice (ver
+# auth.py) y normaliza su correo. Sin este script se indexan igual, uno a uno, la primera
+# vez que inician sesión. Si dos usuarios comparten correo (el registro anterior no lo
+# impedía), el índice apunta al más antiguo y los demás se listan para revisarlos a mano.
+# Volver a ejecutarlo no cambia nada que ya esté indexado. Al terminar marca el índice como
+# completo, y desde entonces auth.py deja de buscar con la consulta los correos que no encuentra.
+
+print("Indexando usuarios por correo...")
+escritor = repositorio.EscritorPorLotes(db)
+vistos = {}
+indexados = 0
+duplicados = []
+for usuario_doc in db.collection('usuarios').order_by('fecha_registro').stream():
+    correo_guardado = (usuario_doc.to_dict() or {}).get('correo')
+    correo = auth.normalizar_correo(correo_guardado)
+    if not correo:
+        continue
+    if correo in vistos:
+        duplicados.append((correo, usuario_doc.id, vistos[correo]))
+        continue
+    vistos[correo] = usuario_doc.id
+    indice_ref = auth.referencia_indice_correo(correo)
+    if not indice_ref.get().exists:
+        escritor.set(indice_ref, {'usuario_id': usuario_doc.id})
+        indexados += 1
+    if correo_guardado != correo:
+        escritor.update(usuario_doc.reference, {'correo': correo})
+escritor.close()
+db.collection('configuracion').document('indice_correos').set({'completo': True, 'fecha': base_datos.SERVER_TIMESTAMP})
+
+for correo, usuario_id, indexado_id in duplicados:
+    print(f"⚠️ El usuario {usuario_id} repite el correo '{correo}' del usuario {indexado_id}; no se indexó.")
+print(f"\n✅ Migración finalizada: {indexados} usuarios indexados, {len(duplicados)} correos duplicados.")
@@ -0,0 +1,172 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import base_datos
+import despachador_tk
+
+db = base_datos.obtener_db()
+
+# --- RELOJ COMPARTIDO DE LA SUBASTA ---
+# Un solo reloj por proceso para todas las ventanas: escucha configuracion/subasta una
+# vez, lleva la hora del servidor y avisa a los suscriptores cuando la subasta cambia
+# de estado (PENDIENTE -> ACTIVA -> CERRADA), en lugar de que cada ventana sondee su
+# propio after() y recargue todo al llegar la hora.
+#
+# La hora local puede ir adelantada o atrasada; el desfase se estima con el read_time
+# de cada snapshot (hora del servidor) frente a la hora local al recibirlo. Subestima
+# en la latencia de entrega, que es mucho menor que el segundo que muestra el cronómetro.
+
+PENDIENTE = "PENDIENTE"
+ACTIVA = "ACTIVA"
+CERRADA = "CERRADA"
+SIN_CONFIGURAR = ""
+
+# Las esperas largas se parten en tramos, por si el equipo se suspende entretanto
+ESPERA_MAXIMA_MS = 3600 * 1000
+# Las lecturas que dependen del cierre se reparten al azar en esta ventana, para que
+# todos los clientes no consulten Firestore en el mismo instante
+DISPERSION_CIERRE_S = 20
+
+
+def calcular_estado(config_data, ahora):
+    """Devuelve PENDIENTE, ACTIVA o CERRADA según las fechas configuradas (SIN_CONFIGURAR si no hay)."""
+    if not config_data:
+        return SIN_CONFIGURAR
+    if ahora < config_data.get('fecha_inicio'):
+        return PENDIENTE
+    if ahora < config_data.get('fecha_fin'):
+        return ACTIVA
+    return CERRADA
+
+
+class Suscripcion:
+    def __init__(self, reloj, al_cambiar_estado, al_tic, al_cerrar):
+        self._reloj = reloj
+        self.al_cambiar_estado = al_cambiar_estado
+        self.al_tic = al_tic
+        self.al_cerrar = al_cerrar
+
+    def cancelar(self):
+        self._reloj._desuscribir(self)
+
+
+class RelojSubasta:
+    """
+    Todos los callbacks se ejecutan en el hilo de Tk:
+    - al_cambiar_estado(estado, config) al suscribirse y cada vez que cambia el estado o las fechas.
+    - al_tic(restante), opcional, una vez por segundo mientras la subasta está ACTIVA.
+    - al_cerrar(), opcional, cuando la subasta se cierra estando el cliente conectado, tras
+      una espera aleatoria de hasta DISPERSION_CIERRE_S; es el lugar para releer datos del cierre.
+    """
+
+    def __init__(self):
+        self.config = {}
+        self.estado = None          # None hasta recibir la configuración
+        self.desfase = timedelta(0)
+        self._suscripciones = []
+        self._listener = None
+        self._id_programado = None
+
+    def ahora(self):
+        """Hora del servidor estimada."""
+        return datetime.now(timezone.utc) + self.desfase
+
+    def suscribir(self, al_cambiar_estado, al_tic=None, al_cerrar=None):
+        suscripcion = Suscripcion(self, al_cambiar_estado, al_tic, al_cerrar)
+        self._suscripciones.append(suscripcion)
+        if self._listener is None:
+            self._listener = db.collection('configuracion').document('subasta').on_snapshot(self._al_cambiar_config)
+        elif self.estado is not None:
+            al_cambiar_estado(self.estado, self.config)
+            if al_tic and self.estado == ACTIVA:
+                al_tic(self._restante())
+        return suscripcion
+
+    def precargar(self, config_data):
+        """
+        Usa una configuración guardada (la de la réplica local) hasta que llegue la del
+        servidor, para mostrar el estado de la subasta sin esperar a la red. Llamar tras suscribir.
+        """
+        if self._listener is not None and self.estado is None and config_data:
+            self._aplicar_config(config_data, None)
+
+    def _desuscribir(self, suscripcion):
+        if suscripcion in self._suscripciones:
+            self._suscripciones.remove(suscripcion)
+        if not self._suscripciones and self._listener is not None:
+            # Sin ventanas abiertas no se escucha nada; la próxima suscripción vuelve a leer
+            self._listener.unsubscribe()
+            self._listener = None
+            self._cancelar_programado()
+            self.config = {}
+            self.estado = None
+
+    # --- CONFIGURACIÓN (llega desde el hilo del listener) ---
+
+    def _al_cambiar_config(self, doc_snapshots, cambios, read_time):
+        desfase = read_time - datetime.now(timezone.utc) if read_time else None
+        for doc in doc_snapshots:
+            despachador_tk.publicar(self._aplicar_config, doc.to_dict() if doc.exists else {}, desfase)
+
+    def _aplicar_config(self, config_data, desfase):
+        if self._listener is None:
+            return  # Llegó después de la última desuscripción
+        if desfase is not None:
+            self.desfase = desfase
+        cambio_fechas = config_data != self.config
+        self.config = config_data
+        self._actualizar(forzar_aviso=cambio_fechas)
+
+    # --- TRANSICIONES ---
+
+    def _restante(self):
+        return max(self.config['fecha_fin'] - self.ahora(), timedelta(0))
+
+    def _cancelar_programado(self):
+        if self._id_programado is not None:
+            despachador_tk.cancelar(self._id_programado)
+            self._id_programado = None
+
+    def _actualizar(self, forzar_aviso=False):
+        """Recalcula el estado, avisa si cambió y programa el próximo despertar."""
+        self._cancelar_programado()
+        anterior = self.estado
+        self.estado = calcular_estado(self.config, self.ahora())
+
+        if self.estado != anterior or forzar_aviso:
+            for suscripcion in list(self._suscripciones):
+                suscripcion.al_cambiar_estado(self.estado, self.config)
+            if anterior == ACTIVA and self.estado == CERRADA:
+                self._programar_cierre()
+
+        if self.estado == PENDIENTE:
+            espera_ms = (self.config['fecha_inicio'] - self.ahora()).total_seconds() * 1000
+        elif self.estado == ACTIVA:
+            restante = self._restante()
+            for suscripcion in list(self._suscripciones):
+                if suscripcion.al_tic:
+                    suscripcion.al_tic(restante)
+            espera_ms = restante.total_seconds() * 1000
+            if any(suscripcion.al_tic for suscripcion in self._suscripciones):
+                # Se despierta justo cuando cambia el segundo que muestra el cronómetro
+                espera_ms = min(espera_ms, restante.microseconds / 1000 or 1000)
+        else:
+            return
+        self._id_programado = despachador_tk.programar(int(min(max(espera_ms, 0), ESPERA_MAXIMA_MS)) + 1, self._actualizar)
+
+    def _programar_cierre(self):
+        for suscripcion in list(self._suscripciones):
+            if suscripcion.al_cerrar:
+                espera_ms = int(random.uniform(0, DISPERSION_CIERRE_S) * 1000)
+                despachador_tk.programar(espera_ms, lambda s=suscripcion: s.al_cerrar() if s in self._suscripciones else None)
+
+
+_reloj = None
+
+
+def obtener_reloj():
+    """Devuelve el reloj compartido del proceso. Debe usarse desde el hilo de Tk."""
+    global _reloj
+    if _reloj is None:
+        _reloj = RelojSubasta()
+    return _reloj
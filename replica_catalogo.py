@@ -0,0 +1,252 @@
+import os
+import pickle
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+import base_datos
+import metricas
+import repositorio
+
+# --- RÉPLICA LOCAL DEL CATÁLOGO ---
+# Copia en SQLite de las obras (con su resumen de ofertas) y de configuracion/subasta. Las
+# galerías se pintan desde aquí al abrirse, sin esperar a la red, y se ponen al día después:
+#   - la primera vez, o si la réplica venció, se descarga el catálogo entero por páginas;
+#   - las demás, solo las obras con 'actualizado' posterior a la marca y las lápidas de las
+#     borradas (ver repositorio.py), así que reabrir una galería cuesta casi cero lecturas.
+# La marca es el read_time del último resultado aplicado: ese resultado ya refleja todo lo
+# confirmado hasta entonces, y lo que se confirme después tendrá un 'actualizado' mayor.
+#
+# Se guarda en RASTRO_REPLICA (por defecto en la caché del usuario). Con RASTRO_REPLICA
+# vacía, o con la base en memoria, la réplica solo existe mientras dura el proceso.
+
+VARIABLE_ENTORNO = "RASTRO_REPLICA"
+RUTA_REPLICA = os.environ.get(VARIABLE_ENTORNO, os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+    'rastro-de-luz', 'replica_catalogo.sqlite'))
+# Cambia si cambia lo que se guarda; una réplica de otra versión se descarta
+VERSION_REPLICA = 1
+TAMANO_PAGINA_DESCARGA = 300
+# Holgura para el desfase entre relojes al decidir si las lápidas pendientes ya se borraron
+MARGEN_RETENCION = timedelta(days=1)
+# Marca de un catálogo vacío: toda obra que se escriba después tendrá un 'actualizado' mayor
+MARCA_INICIAL = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class ReplicaCatalogo:
+    """
+    Réplica en un archivo SQLite; se puede usar desde cualquier hilo. Las escrituras
+    devuelven los cambios que realmente hicieron, como tuplas (tipo, obra_id, obra_data)
+    con tipo 'ADDED', 'MODIFIED' o 'REMOVED', el formato de los listeners de las galerías.
+    """
+
+    def __init__(self, ruta, origen):
+        self._lock = threading.Lock()
+        if ruta != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        self._sqlite = sqlite3.connect(ruta, check_same_thread=False)
+        with self._lock, self._sqlite:
+            self._sqlite.execute("CREATE TABLE IF NOT EXISTS obras (id TEXT PRIMARY KEY, datos BLOB NOT NULL)")
+            self._sqlite.execute("CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor BLOB)")
+            if self._meta('origen') != origen or self._meta('version') != VERSION_REPLICA:
+                # Réplica de otra base (otro proyecto u otro archivo local) o de otra versión
+                self._vaciar()
+                self._guardar_meta(origen=origen, version=VERSION_REPLICA)
+
+    def _meta(self, clave):
+        fila = self._sqlite.execute("SELECT valor FROM meta WHERE clave = ?", (clave,)).fetchone()
+        return pickle.loads(fila[0]) if fila else None
+
+    def _guardar_meta(self, **valores):
+        self._sqlite.executemany("INSERT OR REPLACE INTO meta (clave, valor) VALUES (?, ?)",
+                                 [(clave, pickle.dumps(valor)) for clave, valor in valores.items()])
+
+    def _vaciar(self):
+        self._sqlite.execute("DELETE FROM obras")
+        self._sqlite.execute("DELETE FROM meta WHERE clave NOT IN ('origen', 'version')")
+
+    # --- LECTURA ---
+
+    @metricas.medir('replica.lectura')
+    def obras(self):
+        """Pares (obra_id, obra_data) en el orden de las galerías (ver repositorio.clave_orden_obra)."""
+        with self._lock:
+            filas = self._sqlite.execute("SELECT id, datos FROM obras").fetchall()
+        try:
+            obras = [(obra_id, pickle.loads(datos)) for obra_id, datos in filas]
+        except Exception as e:
+            # P. ej. guardada con otra versión de la librería de Firestore: se vuelve a descargar
+            print(f"ADVERTENCIA: No se pudo leer la réplica local, se descartará: {e}")
+            with self._lock, self._sqlite:
+                self._vaciar()
+            return []
+        obras.sort(key=lambda par: repositorio.clave_orden_obra(*par), reverse=True)
+        return obras
+
+    def ids(self):
+        with self._lock:
+            return {obra_id for (obra_id,) in self._sqlite.execute("SELECT id FROM obras")}
+
+    def configuracion(self):
+        """La última configuracion/subasta conocida, o None."""
+        with self._lock:
+            return self._meta('configuracion')
+
+    def marcas(self):
+        """
+        (marca de obras, marca de lápidas), o None si hace falta una descarga completa: la
+        réplica nunca se completó o lleva tanto sin sincronizarse que pudo perder lápidas.
+        """
+        with self._lock:
+            marca_obras, marca_lapidas, sincronizada = (self._meta(clave) for clave in ('marca_obras', 'marca_lapidas', 'sincronizada'))
+        if marca_obras is None or marca_lapidas is None or sincronizada is None:
+            return None
+        if sincronizada < datetime.now(timezone.utc) - timedelta(days=repositorio.DIAS_RETENCION_LAPIDAS) + MARGEN_RETENCION:
+            return None
+        return marca_obras, marca_lapidas
+
+    # --- ESCRITURA ---
+
+    def guardar_configuracion(self, config_data):
+        with self._lock, self._sqlite:
+            self._guardar_meta(configuracion=config_data)
+
+    def aplicar(self, obras=(), lapidas=(), **marcas):
+        """
+        Guarda en una sola transacción las 'obras' (pares (obra_id, obra_data), con None si
+        se borró), las 'lapidas' (pares (obra_id, fecha de borrado)) y las marcas indicadas.
+        Una lápida solo quita la obra si es posterior a su última escritura, porque pudo
+        volver a crearse con el mismo ID (importar_obras usa IDs deterministas).
+        """
+        aplicados = []
+        with self._lock, self._sqlite:
+            for obra_id, obra_data in obras:
+                fila = self._sqlite.execute("SELECT 1 FROM obras WHERE id = ?", (obra_id,)).fetchone()
+                if obra_data is not None:
+                    self._sqlite.execute("INSERT OR REPLACE INTO obras (id, datos) VALUES (?, ?)", (obra_id, pickle.dumps(obra_data)))
+                    aplicados.append(('MODIFIED' if fila else 'ADDED', obra_id, obra_data))
+                elif fila:
+                    self._sqlite.execute("DELETE FROM obras WHERE id = ?", (obra_id,))
+                    aplicados.append(('REMOVED', obra_id, None))
+            for obra_id, fecha_borrado in lapidas:
+                fila = self._sqlite.execute("SELECT datos FROM obras WHERE id = ?", (obra_id,)).fetchone()
+                if fila is None:
+                    continue
+                actualizado = pickle.loads(fila[0]).get('actualizado')
+                if actualizado is None or fecha_borrado is None or actualizado <= fecha_borrado:
+                    self._sqlite.execute("DELETE FROM obras WHERE id = ?", (obra_id,))
+                    aplicados.append(('REMOVED', obra_id, None))
+            self._guardar_meta(**marcas)
+        metricas.contar('replica.cambios_aplicados', len(aplicados))
+        return aplicados
+
+    def vaciar(self):
+        with self._lock, self._sqlite:
+            self._vaciar()
+
+
+_replica = None
+_lock_replica = threading.Lock()
+
+
+def obtener_replica():
+    """Devuelve la réplica compartida del proceso, abriéndola la primera vez. Lee el disco: llamar fuera del hilo de Tk."""
+    global _replica
+    with _lock_replica:
+        if _replica is None:
+            origen = base_datos.identificador()
+            ruta = RUTA_REPLICA if origen and RUTA_REPLICA else ":memory:"
+            try:
+                _replica = ReplicaCatalogo(ruta, origen)
+            except (OSError, sqlite3.Error) as e:
+                print(f"ADVERTENCIA: No se pudo abrir la réplica local en {ruta} ({e}); se usará una en memoria.")
+                _replica = ReplicaCatalogo(":memory:", origen)
+        return _replica
+
+
+# --- SINCRONIZACIÓN ---
+# 'al_recibir_cambios(cambios)' se llama desde el hilo de trabajo o del listener con los
+# cambios que se aplicaron a la réplica, ya guardados; las galerías los publican en Tk.
+
+def _avisar(al_recibir_cambios, cambios):
+    if cambios and al_recibir_cambios:
+        al_recibir_cambios(cambios)
+
+
+def descargar_todo(replica, al_recibir_cambios=None):
+    """
+    Descarga el catálogo entero por páginas y deja la réplica igual que Firestore, quitando
+    las obras que ya no existen. Es lo que se hace la primera vez o con la réplica vencida.
+    """
+    inicio = datetime.now(timezone.utc)
+    paginador = repositorio.Paginador(repositorio.consulta_obras(), TAMANO_PAGINA_DESCARGA)
+    sobrantes = replica.ids()
+    marca = None
+    with metricas.medir('replica.descarga_completa'):
+        while not paginador.agotado:
+            _, documentos = paginador.siguiente_pagina()
+            if documentos and marca is None:
+                # Lo que cambie mientras se leen las demás páginas tendrá un 'actualizado' mayor
+                marca = documentos[0].read_time
+            sobrantes.difference_update(doc.id for doc in documentos)
+            _avisar(al_recibir_cambios, replica.aplicar(obras=[(doc.id, doc.to_dict()) for doc in documentos]))
+        marca = marca or MARCA_INICIAL
+        _avisar(al_recibir_cambios, replica.aplicar(obras=[(obra_id, None) for obra_id in sobrantes],
+                                                    marca_obras=marca, marca_lapidas=marca, sincronizada=inicio))
+    metricas.contar('replica.descargas_completas')
+
+
+def _leer_desde(consulta, marca, aplicar_pagina):
+    """Recorre por páginas una consulta de cambios posteriores a 'marca'; devuelve la marca nueva."""
+    paginador = repositorio.Paginador(consulta, TAMANO_PAGINA_DESCARGA)
+    nueva_marca = marca
+    while not paginador.agotado:
+        _, documentos = paginador.siguiente_pagina()
+        if documentos and nueva_marca is marca:
+            nueva_marca = documentos[0].read_time
+        aplicar_pagina(documentos)
+    return nueva_marca
+
+
+def sincronizar(replica, al_recibir_cambios=None):
+    """
+    Pone la réplica al día con consultas sueltas, sin dejar listeners: solo los cambios
+    desde las marcas, o una descarga completa si la réplica no está vigente.
+    """
+    marcas = replica.marcas()
+    if marcas is None:
+        descargar_todo(replica, al_recibir_cambios)
+        return
+    inicio = datetime.now(timezone.utc)
+    with metricas.medir('replica.sincronizacion'):
+        marca_obras = _leer_desde(repositorio.consulta_obras_actualizadas(marcas[0]), marcas[0], lambda documentos: _avisar(
+            al_recibir_cambios, replica.aplicar(obras=[(doc.id, doc.to_dict()) for doc in documentos])))
+        marca_lapidas = _leer_desde(repositorio.consulta_obras_eliminadas(marcas[1]), marcas[1], lambda documentos: _avisar(
+            al_recibir_cambios, replica.aplicar(lapidas=[(doc.id, doc.get('actualizado')) for doc in documentos])))
+        replica.aplicar(marca_obras=marca_obras, marca_lapidas=marca_lapidas, sincronizada=inicio)
+
+
+def escuchar(replica, al_recibir_cambios):
+    """
+    Mantiene al día una réplica vigente con dos listeners que parten de sus marcas: el
+    primer snapshot de cada uno trae lo que cambió desde la última vez y los siguientes,
+    los cambios en vivo. Cada snapshot se guarda, y avanza su marca, antes de avisar.
+    Devuelve los listeners, para cancelarlos con unsubscribe().
+    """
+    marca_obras, marca_lapidas = replica.marcas()
+
+    def al_cambiar_obras(doc_snapshots, cambios, read_time):
+        metricas.contar('firestore.lecturas_listener', len(cambios))
+        obras = [(cambio.document.id, None if cambio.type.name == 'REMOVED' else cambio.document.to_dict())
+                 for cambio in cambios]
+        _avisar(al_recibir_cambios, replica.aplicar(obras=obras, marca_obras=read_time))
+
+    def al_cambiar_lapidas(doc_snapshots, cambios, read_time):
+        metricas.contar('firestore.lecturas_listener', len(cambios))
+        # Una lápida que desaparece es una que se purgó por vieja: no dice nada de su obra
+        lapidas = [(cambio.document.id, cambio.document.get('actualizado'))
+                   for cambio in cambios if cambio.type.name != 'REMOVED']
+        _avisar(al_recibir_cambios, replica.aplicar(lapidas=lapidas, marca_lapidas=read_time, sincronizada=read_time))
+
+    return [repositorio.consulta_obras_actualizadas(marca_obras).on_snapshot(al_cambiar_obras),
+            repositorio.consulta_obras_eliminadas(marca_lapidas).on_snapshot(al_cambiar_lapidas)]
@@ -0,0 +1,250 @@
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import base_datos
+import metricas
+
+db = base_datos.obtener_db()
+
+# --- TAMAÑOS DE PÁGINA ---
+# Lo que se lee al abrir una lista depende de estos valores, no del tamaño de la colección.
+TAMANO_PAGINA_USUARIOS = 50
+TAMANO_PAGINA_OFERTAS = 30
+
+# --- ESCRITURAS MASIVAS ---
+# Máximo de operaciones de un lote de Firestore
+MAX_OPERACIONES_POR_LOTE = 500
+# Regla 500/50/5 de Firestore: empezar en 500 operaciones por segundo y subir un 50%
+# cada 5 minutos, para que el servidor reparta la carga sin rechazar escrituras
+OPERACIONES_POR_SEGUNDO_INICIALES = 500
+INCREMENTO_OPERACIONES = 1.5
+SEGUNDOS_ENTRE_INCREMENTOS = 5 * 60
+MAX_REINTENTOS_LOTE = 6
+
+
+class Paginador:
+    """
+    Recorre una consulta ordenada por páginas, usando el último documento
+    de cada página como cursor (start_after) para pedir la siguiente.
+    """
+
+    def __init__(self, consulta, tamano_pagina):
+        self.consulta = consulta
+        self.tamano_pagina = tamano_pagina
+        self.ultimo_doc = None
+        self.agotado = False
+        self._lock = threading.Lock()
+
+    def siguiente_pagina(self):
+        """
+        Devuelve (cursor_anterior, documentos) de la página siguiente. El cursor
+        anterior es el último documento de la página previa (None en la primera).
+        """
+        with self._lock:
+            if self.agotado:
+                return self.ultimo_doc, []
+            consulta = self.consulta
+            if self.ultimo_doc is not None:
+                consulta = consulta.start_after(self.ultimo_doc)
+            with metricas.medir('firestore.pagina'):
+                documentos = list(consulta.limit(self.tamano_pagina).stream())
+            metricas.contar('firestore.documentos_leidos', len(documentos))
+
+            cursor_anterior = self.ultimo_doc
+            if len(documentos) < self.tamano_pagina:
+                self.agotado = True
+            if documentos:
+                self.ultimo_doc = documentos[-1]
+            return cursor_anterior, documentos
+
+
+# --- OBRAS ---
+# Toda escritura en una obra pone 'actualizado' = SERVER_TIMESTAMP, y al borrarla queda una
+# lápida en obras_eliminadas/{id}: así la réplica local (ver replica_catalogo.py) pide solo
+# lo que cambió desde su última sincronización. Firestore no permite consultar por el
+# update_time de los documentos, por eso el campo propio.
+COLECCION_LAPIDAS = 'obras_eliminadas'
+# Las lápidas más viejas se borran al eliminar obras; una réplica sin sincronizar desde
+# antes ya no puede enterarse de esas bajas y se vuelve a descargar entera
+DIAS_RETENCION_LAPIDAS = 30
+
+
+def consulta_obras():
+    """Obras de la más nueva a la más antigua, el orden en que las muestran las galerías."""
+    return db.collection('obras_subasta').order_by('timestamp', direction=base_datos.DESCENDING)
+
+
+def clave_orden_obra(obra_id, obra_data):
+    """
+    Clave del orden de consulta_obras (de mayor a menor); las obras que aún no tienen
+    fecha del servidor van primero.
+    """
+    fecha = obra_data.get('timestamp')
+    if fecha is None:
+        return (True, datetime.min.replace(tzinfo=timezone.utc), obra_id)
+    return (False, fecha, obra_id)
+
+
+def consulta_obras_actualizadas(desde):
+    """Obras escritas después de 'desde' (hora del servidor), de la más vieja a la más nueva."""
+    return (db.collection('obras_subasta')
+            .where(filter=base_datos.FieldFilter('actualizado', '>', desde))
+            .order_by('actualizado'))
+
+
+def consulta_obras_eliminadas(desde):
+    """Lápidas de las obras borradas después de 'desde'."""
+    return (db.collection(COLECCION_LAPIDAS)
+            .where(filter=base_datos.FieldFilter('actualizado', '>', desde))
+            .order_by('actualizado'))
+
+
+def consulta_obras_cerradas():
+    """Obras cuya subasta ya terminó, p. ej. para vaciar el catálogo de una subasta pasada."""
+    return db.collection('obras_subasta').where(filter=base_datos.FieldFilter('ofertas.subasta_abierta', '==', False))
+
+
+def eliminar_obras(obra_ids, al_progresar=None):
+    """
+    Borra las obras indicadas con EscritorPorLotes. Firestore no borra las subcolecciones
+    junto con el documento, así que antes se borra cada una de sus ofertas: si el proceso
+    se corta, la obra sigue existiendo y puede volver a borrarse. No toca Storage.
+    Cada obra deja su lápida para las réplicas locales, y de paso se borran las lápidas
+    de más de DIAS_RETENCION_LAPIDAS. 'al_progresar(hechas, total)' se llama tras encolar cada obra.
+    """
+    escritor = EscritorPorLotes(db)
+    for hechas, obra_id in enumerate(obra_ids, start=1):
+        obra_ref = db.collection('obras_subasta').document(obra_id)
+        for oferta_ref in obra_ref.collection('ofertas').list_documents():
+            escritor.delete(oferta_ref)
+        escritor.delete(obra_ref)
+        escritor.set(db.collection(COLECCION_LAPIDAS).document(obra_id), {'actualizado': base_datos.SERVER_TIMESTAMP})
+        if al_progresar:
+            al_progresar(hechas, len(obra_ids))
+
+    limite = datetime.now(timezone.utc) - timedelta(days=DIAS_RETENCION_LAPIDAS)
+    vencidas = db.collection(COLECCION_LAPIDAS).where(filter=base_datos.FieldFilter('actualizado', '<', limite))
+    for lapida in vencidas.stream():
+        escritor.delete(lapida.reference)
+    escritor.close()
+    return escritor.operaciones_confirmadas
+
+
+# --- OFERTAS ---
+# Cada oferta es un documento de obras_subasta/{id}/ofertas. La obra solo guarda
+# un resumen (precio_actual, mejor_oferta, num_ofertas), así que cargar la galería
+# no descarga el historial completo de cada obra.
+
+def coleccion_ofertas(obra_id):
+    return db.collection('obras_subasta').document(obra_id).collection('ofertas')
+
+
+def paginador_ofertas(obra_id, tamano_pagina=TAMANO_PAGINA_OFERTAS):
+    """
+    Historial de una obra de la oferta más alta a la más baja. Como cada oferta debe
+    superar a la anterior, coincide con el orden de la más reciente a la más antigua.
+    Usa el índice compuesto (monto, timestamp) declarado en firestore.indexes.json.
+    """
+    consulta = (coleccion_ofertas(obra_id)
+                .order_by('monto', direction=base_datos.DESCENDING)
+                .order_by('timestamp', direction=base_datos.DESCENDING))
+    return Paginador(consulta, tamano_pagina)
+
+
+# --- USUARIOS ---
+
+def paginador_usuarios(tamano_pagina=TAMANO_PAGINA_USUARIOS):
+    consulta = db.collection('usuarios').order_by('fecha_registro')
+    return Paginador(consulta, tamano_pagina)
+
+
+# --- ESCRITURA POR LOTES ---
+
+class EscritorPorLotes:
+    """
+    Agrupa escrituras en lotes de hasta MAX_OPERACIONES_POR_LOTE, limita el ritmo según
+    la regla 500/50/5 y reintenta con espera los lotes que fallan por errores pasajeros.
+    Cada lote es atómico y sus operaciones (set/delete) son idempotentes, así que repetir
+    uno entero es seguro. Funciona igual con cualquier backend de base_datos.
+    """
+
+    def __init__(self, db=None, tamano_lote=MAX_OPERACIONES_POR_LOTE, max_operaciones_por_segundo=None):
+        self.db = db or base_datos.obtener_db()
+        self.tamano_lote = min(tamano_lote, MAX_OPERACIONES_POR_LOTE)
+        self.max_operaciones_por_segundo = max_operaciones_por_segundo
+        self.operaciones_confirmadas = 0
+        self.lotes_reintentados = 0
+        self._pendientes = []
+        self._inicio = None
+        self._disponibles = 0.0
+        self._ultima_recarga = None
+
+    def set(self, referencia, datos, merge=False):
+        self._agregar(('set', referencia, datos, merge))
+
+    def update(self, referencia, datos):
+        self._agregar(('update', referencia, datos, None))
+
+    def delete(self, referencia):
+        self._agregar(('delete', referencia, None, None))
+
+    def _agregar(self, operacion):
+        self._pendientes.append(operacion)
+        if len(self._pendientes) >= self.tamano_lote:
+            self.flush()
+
+    def _ritmo_actual(self):
+        transcurrido = time.monotonic() - self._inicio
+        ritmo = OPERACIONES_POR_SEGUNDO_INICIALES * INCREMENTO_OPERACIONES ** int(transcurrido // SEGUNDOS_ENTRE_INCREMENTOS)
+        if self.max_operaciones_por_segundo:
+            ritmo = min(ritmo, self.max_operaciones_por_segundo)
+        return ritmo
+
+    def _esperar_turno(self, cantidad):
+        """Cubeta de fichas: espera hasta que el ritmo permita enviar 'cantidad' operaciones."""
+        ahora = time.monotonic()
+        if self._inicio is None:
+            self._inicio = self._ultima_recarga = ahora
+            self._disponibles = float(self._ritmo_actual())
+        ritmo = self._ritmo_actual()
+        self._disponibles = min(ritmo, self._disponibles + (ahora - self._ultima_recarga) * ritmo)
+        self._ultima_recarga = ahora
+        if self._disponibles < cantidad:
+            time.sleep((cantidad - self._disponibles) / ritmo)
+            self._ultima_recarga = time.monotonic()
+            self._disponibles = cantidad
+        self._disponibles -= cantidad
+
+    def flush(self):
+        """Envía las operaciones pendientes como un lote."""
+        if not self._pendientes:
+            return
+        operaciones, self._pendientes = self._pendientes, []
+        self._esperar_turno(len(operaciones))
+
+        for intento in range(MAX_REINTENTOS_LOTE):
+            lote = self.db.batch()
+            for tipo, referencia, datos, merge in operaciones:
+                if tipo == 'set':
+                    lote.set(referencia, datos, merge=merge)
+                elif tipo == 'update':
+                    lote.update(referencia, datos)
+                else:
+                    lote.delete(referencia)
+            try:
+                with metricas.medir('firestore.lote'):
+                    lote.commit()
+                self.operaciones_confirmadas += len(operaciones)
+                metricas.contar('firestore.documentos_escritos', len(operaciones))
+                return
+            except base_datos.ERRORES_TRANSITORIOS:
+                if intento == MAX_REINTENTOS_LOTE - 1:
+                    raise
+                self.lotes_reintentados += 1
+                metricas.contar('firestore.lotes_reintentados')
+                time.sleep(random.uniform(0, min(30, 0.5 * 2 ** intento)))
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,487 @@
+import os
+import json
+import hashlib
+import itertools
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from io import BytesIO
+
+import requests
+from requests.adapters import HTTPAdapter
+from PIL import Image, ImageTk
+
+import despachador_tk
+import metricas
+from subida_imagenes import VARIANTE_COMPLETA
+
+# --- CONFIGURACIÓN DE LA CACHÉ ---
+
+# Límite de memoria para las miniaturas ya decodificadas (en bytes)
+MAX_BYTES_MEMORIA = 64 * 1024 * 1024
+# Límite del directorio de caché en disco (en bytes)
+MAX_BYTES_DISCO = 512 * 1024 * 1024
+# Tiempo durante el cual una imagen en disco se usa sin revalidar (en segundos)
+SEGUNDOS_FRESCURA = 24 * 60 * 60
+
+DIRECTORIO_CACHE = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+    'rastro-de-luz', 'imagenes')
+
+HEADERS = {'User-Agent': 'Mozilla/5.0'}
+
+# --- CONFIGURACIÓN DE LAS DESCARGAS ---
+
+# Número fijo de hilos de descarga, sin importar el tamaño del catálogo
+NUM_TRABAJADORES = 6
+# Cuanto menor el número, antes se atiende la petición
+PRIORIDAD_VISIBLE = 0
+PRIORIDAD_FONDO = 1
+# Cuántas tarjetas se consideran visibles al abrir una galería
+TARJETAS_VISIBLES = 4
+
+# --- CONFIGURACIÓN DE LA DECODIFICACIÓN ---
+
+# Los JPEG se decodifican a una escala de al menos este múltiplo del tamaño final
+MARGEN_DRAFT = 2.0
+# A partir de este número de píxeles de origen se muestra antes una vista previa
+PIXELES_MINIMOS_PREVIA = 1_000_000
+
+
+class CacheMiniaturas:
+    """
+    Caché LRU en memoria de miniaturas decodificadas, acotada por bytes.
+    La clave es (url, tamano), ya que una misma imagen se muestra a varios tamaños.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes_usados = 0
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _peso(img):
+        return img.width * img.height * len(img.getbands())
+
+    def obtener(self, clave):
+        with self._lock:
+            img = self._entradas.get(clave)
+            if img is not None:
+                self._entradas.move_to_end(clave)
+            return img
+
+    def guardar(self, clave, img):
+        peso = self._peso(img)
+        if peso > self.max_bytes:
+            return
+        with self._lock:
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self.bytes_usados -= self._peso(anterior)
+            self._entradas[clave] = img
+            self.bytes_usados += peso
+            # Expulsa las entradas menos usadas hasta volver al límite
+            while self.bytes_usados > self.max_bytes:
+                _, expulsada = self._entradas.popitem(last=False)
+                self.bytes_usados -= self._peso(expulsada)
+
+
+class CacheDisco:
+    """
+    Caché persistente de los bytes originales, indexada por URL.
+    Guarda ETag/Last-Modified para revalidar con peticiones condicionales.
+    """
+
+    def __init__(self, directorio, max_bytes):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._escrituras = 0
+        os.makedirs(self.directorio, exist_ok=True)
+
+    def _rutas(self, url):
+        nombre = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.directorio, nombre)
+        return base + '.img', base + '.json'
+
+    def leer(self, url):
+        """Devuelve (contenido, metadatos) o (None, None) si la URL no está en disco."""
+        ruta_img, ruta_meta = self._rutas(url)
+        try:
+            with open(ruta_meta, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(ruta_img, 'rb') as f:
+                contenido = f.read()
+            return contenido, meta
+        except (OSError, ValueError):
+            return None, None
+
+    def escribir(self, url, contenido, meta):
+        ruta_img, ruta_meta = self._rutas(url)
+        with self._lock:
+            # Escritura atómica: primero a un temporal y luego se reemplaza
+            for ruta, datos, modo in ((ruta_img, contenido, 'wb'), (ruta_meta, meta, 'w')):
+                temporal = f"{ruta}.{threading.get_ident()}.tmp"
+                if modo == 'wb':
+                    with open(temporal, modo) as f:
+                        f.write(datos)
+                else:
+                    with open(temporal, modo, encoding='utf-8') as f:
+                        json.dump(datos, f)
+                os.replace(temporal, ruta)
+            self._escrituras += 1
+            # Recorrer el directorio es costoso; solo se poda cada cierto número de escrituras
+            podar = self._escrituras % 50 == 1
+        if podar:
+            self._podar()
+
+    def marcar_validada(self, url, meta):
+        _, ruta_meta = self._rutas(url)
+        meta['validado_en'] = time.time()
+        with self._lock:
+            temporal = f"{ruta_meta}.{threading.get_ident()}.tmp"
+            with open(temporal, 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            os.replace(temporal, ruta_meta)
+
+    def _podar(self):
+        """Elimina los archivos más antiguos si el directorio supera el límite."""
+        with self._lock:
+            archivos = []
+            total = 0
+            for entrada in os.scandir(self.directorio):
+                if entrada.name.endswith('.img'):
+                    estado = entrada.stat()
+                    archivos.append((estado.st_mtime, estado.st_size, entrada.path))
+                    total += estado.st_size
+            if total <= self.max_bytes:
+                return
+            for _, tamano, ruta in sorted(archivos):
+                for ruta_borrar in (ruta, ruta[:-4] + '.json'):
+                    try:
+                        os.remove(ruta_borrar)
+                    except OSError:
+                        pass
+                total -= tamano
+                if total <= self.max_bytes:
+                    break
+
+
+cache_memoria = CacheMiniaturas(MAX_BYTES_MEMORIA)
+try:
+    cache_disco = CacheDisco(DIRECTORIO_CACHE, MAX_BYTES_DISCO)
+except OSError as e:
+    print(f"ADVERTENCIA: Caché de imágenes en disco deshabilitada. Error: {e}")
+    cache_disco = None
+
+# URLs ya revalidadas en esta sesión: no se vuelven a consultar en la red
+_urls_validadas = set()
+
+# Sesión compartida: reutiliza conexiones (keep-alive) con un pool acotado por host
+sesion = requests.Session()
+sesion.headers.update(HEADERS)
+_adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=NUM_TRABAJADORES)
+sesion.mount('https://', _adaptador)
+sesion.mount('http://', _adaptador)
+
+# Descargas en curso por URL, para que peticiones simultáneas compartan una sola
+_descargas_en_curso = {}
+_lock_descargas = threading.Lock()
+
+
+# --- DESCARGA Y DECODIFICACIÓN ---
+
+def obtener_bytes(url):
+    """
+    Devuelve los bytes de la imagen, usando la caché en disco cuando es posible.
+    Si otra petición ya está descargando la misma URL, espera su resultado.
+    """
+    with _lock_descargas:
+        futuro = _descargas_en_curso.get(url)
+        propia = futuro is None
+        if propia:
+            futuro = Future()
+            _descargas_en_curso[url] = futuro
+    if not propia:
+        return futuro.result()
+
+    try:
+        contenido = _descargar_bytes(url)
+        futuro.set_result(contenido)
+        return contenido
+    except BaseException as e:
+        futuro.set_exception(e)
+        raise
+    finally:
+        with _lock_descargas:
+            _descargas_en_curso.pop(url, None)
+
+
+def _descargar_bytes(url):
+    """
+    Solo va a la red si la URL no se ha visto o si su copia ya no está fresca,
+    y en ese caso hace una petición condicional (If-None-Match / If-Modified-Since).
+    """
+    contenido, meta = (None, None)
+    if cache_disco:
+        contenido, meta = cache_disco.leer(url)
+
+    if contenido is not None:
+        fresca = time.time() - meta.get('validado_en', 0) < SEGUNDOS_FRESCURA
+        if url in _urls_validadas or fresca:
+            metricas.contar('imagen.cache_disco')
+            return contenido
+
+    headers = {}
+    if contenido is not None:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    with metricas.medir('imagen.descarga'):
+        response = sesion.get(url, headers=headers, timeout=20)
+    if response.status_code == 304 and contenido is not None:
+        metricas.contar('imagen.revalidada')
+        try:
+            cache_disco.marcar_validada(url, meta)
+        except OSError as e:
+            print(f"No se pudo actualizar la caché de disco: {e}")
+        _urls_validadas.add(url)
+        return contenido
+
+    response.raise_for_status()
+    contenido = response.content
+    metricas.contar('imagen.descargada')
+    metricas.contar('imagen.bytes_descargados', len(contenido))
+    if cache_disco:
+        try:
+            cache_disco.escribir(url, contenido, {
+                'url': url,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'validado_en': time.time(),
+            })
+        except OSError as e:
+            print(f"No se pudo guardar la imagen en la caché de disco: {e}")
+    _urls_validadas.add(url)
+    return contenido
+
+
+@metricas.medir('imagen.decodificacion')
+def decodificar_miniatura(contenido, tamano, rapida=False):
+    """
+    Decodifica la imagen directamente a un tamaño cercano a 'tamano' y la reduce.
+    En los JPEG, draft() hace que libjpeg escale al decodificar (1/2, 1/4 u 1/8), así que
+    nunca se reserva ni se recorre la imagen completa. Con rapida=True se decodifica a la
+    escala más cercana al tamaño final y se reduce con un filtro barato (vista previa);
+    si no, se deja un margen para que LANCZOS conserve la nitidez.
+    """
+    img = Image.open(BytesIO(contenido))
+    if rapida:
+        img.draft(None, tuple(tamano))
+        img.thumbnail(tamano, Image.Resampling.BILINEAR, reducing_gap=None)
+    else:
+        img.draft(None, (int(tamano[0] * MARGEN_DRAFT), int(tamano[1] * MARGEN_DRAFT)))
+        # reducing_gap aplica además reduce() (promedio por bloques) antes del LANCZOS
+        img.thumbnail(tamano, Image.Resampling.LANCZOS, reducing_gap=MARGEN_DRAFT)
+    return _preparar_para_tk(img)
+
+
+def _conviene_previa(contenido):
+    """Solo compensa una vista previa en JPEG grandes, cuya decodificación final se nota."""
+    try:
+        img = Image.open(BytesIO(contenido))  # Solo lee la cabecera
+    except Exception:
+        return False
+    return img.format == 'JPEG' and img.width * img.height >= PIXELES_MINIMOS_PREVIA
+
+
+def obtener_miniatura(url, tamano, al_previsualizar=None):
+    """
+    Devuelve la imagen ya reducida a 'tamano', pasando por las dos cachés.
+    Si se da 'al_previsualizar(img)', antes recibe una versión rápida de menor calidad
+    (solo en JPEG grandes). La vista previa no se guarda en la caché.
+    """
+    clave = (url, tuple(tamano))
+    img = cache_memoria.obtener(clave)
+    if img is not None:
+        metricas.contar('imagen.cache_memoria')
+        return img
+    contenido = obtener_bytes(url)
+    if al_previsualizar and _conviene_previa(contenido):
+        al_previsualizar(decodificar_miniatura(contenido, tamano, rapida=True))
+    img = decodificar_miniatura(contenido, tamano)
+    cache_memoria.guardar(clave, img)
+    return img
+
+
+def _preparar_para_tk(img):
+    """
+    Deja la imagen en un modo que PhotoImage copia sin conversiones,
+    para que en el hilo de Tk solo quede crear el PhotoImage.
+    """
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'transparency' in img.info or img.mode in ('LA', 'PA') else 'RGB')
+    img.load()
+    return img
+
+
+class PlanificadorDescargas:
+    """
+    Pool fijo de hilos que atiende las peticiones de miniaturas por prioridad.
+    Las peticiones repetidas de la misma miniatura se agrupan en un solo trabajo.
+    """
+
+    def __init__(self, num_trabajadores):
+        self.num_trabajadores = num_trabajadores
+        self._cola = queue.PriorityQueue()
+        self._pendientes = {}
+        self._secuencia = itertools.count()
+        self._lock = threading.Lock()
+        self._hilos = []
+
+    def _arrancar(self):
+        # Los hilos se crean la primera vez que hay trabajo
+        while len(self._hilos) < self.num_trabajadores:
+            hilo = threading.Thread(target=self._trabajar, daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+
+    def solicitar(self, url, tamano, al_terminar, prioridad=PRIORIDAD_FONDO, al_previsualizar=None):
+        """
+        Encola la miniatura; 'al_terminar(img, error)' se llama desde un hilo trabajador.
+        'al_previsualizar(img)', opcional, recibe antes la vista previa si la hay.
+        """
+        clave = (url, tuple(tamano))
+        with self._lock:
+            self._arrancar()
+            pendiente = self._pendientes.get(clave)
+            if pendiente is not None:
+                pendiente['callbacks'].append(al_terminar)
+                if al_previsualizar:
+                    pendiente['previas'].append(al_previsualizar)
+                # Si ahora es más urgente, se vuelve a encolar; el duplicado se ignora al salir
+                if prioridad < pendiente['prioridad'] and not pendiente['tomada']:
+                    pendiente['prioridad'] = prioridad
+                    self._cola.put((prioridad, next(self._secuencia), clave))
+                return
+            self._pendientes[clave] = {'callbacks': [al_terminar], 'previas': [al_previsualizar] if al_previsualizar else [],
+                                       'prioridad': prioridad, 'tomada': False}
+            self._cola.put((prioridad, next(self._secuencia), clave))
+
+    def _trabajar(self):
+        while True:
+            _, _, clave = self._cola.get()
+            with self._lock:
+                pendiente = self._pendientes.get(clave)
+                if pendiente is None or pendiente['tomada']:
+                    continue
+                pendiente['tomada'] = True
+                quiere_previa = bool(pendiente['previas'])
+
+            # La vista previa solo se decodifica si alguien la pidió
+            entregar_previa = (lambda previa, clave=clave: self._entregar_previa(clave, previa)) if quiere_previa else None
+            img, error = None, None
+            try:
+                img = obtener_miniatura(*clave, al_previsualizar=entregar_previa)
+            except Exception as e:
+                error = e
+
+            with self._lock:
+                callbacks = self._pendientes.pop(clave)['callbacks']
+            for al_terminar in callbacks:
+                try:
+                    al_terminar(img, error)
+                except Exception as e:
+                    print(f"Error al entregar imagen: {e}")
+
+    def _entregar_previa(self, clave, img):
+        with self._lock:
+            pendiente = self._pendientes.get(clave)
+            previas = list(pendiente['previas']) if pendiente else []
+        for al_previsualizar in previas:
+            try:
+                al_previsualizar(img)
+            except Exception as e:
+                print(f"Error al entregar vista previa: {e}")
+
+
+planificador = PlanificadorDescargas(NUM_TRABAJADORES)
+
+
+def elegir_variante(obra_data, indice, tamano):
+    """
+    URL de la imagen 'indice' de una obra en la variante más pequeña que cubre 'tamano'
+    (ver subida_imagenes y generar_variantes.py). Si la obra no tiene variantes para esa
+    imagen, se usa la URL original.
+    """
+    image_urls = obra_data.get('image_urls', [])
+    original = image_urls[indice] if indice < len(image_urls) else None
+    todas = obra_data.get('variantes_imagenes', [])
+    variantes = todas[indice] if indice < len(todas) else None
+    if not variantes:
+        return original
+
+    lado_necesario = max(tamano)
+    for lado, url in sorted((int(nombre), url) for nombre, url in variantes.items() if nombre.isdigit()):
+        if lado >= lado_necesario:
+            return url
+    return variantes.get(VARIANTE_COMPLETA, original)
+
+
+def prioridad_por_posicion(indice):
+    """Las primeras tarjetas de una lista son las que el usuario ve al abrirla."""
+    return PRIORIDAD_VISIBLE if indice < TARJETAS_VISIBLES else PRIORIDAD_FONDO
+
+
+def _mostrar_en_label(label_imagen, img, clave=None):
+    """Se ejecuta en el hilo de Tk: crea el PhotoImage y lo asigna al label."""
+    # Si el label se recicló para otra imagen mientras se descargaba, el resultado ya no aplica
+    if clave is not None and getattr(label_imagen, 'clave_imagen', None) != clave:
+        return
+    photo = ImageTk.PhotoImage(img)
+    label_imagen.config(image=photo, text="", width=0, height=0)
+    label_imagen.image = photo
+
+
+def _mostrar_error(label_imagen, clave=None):
+    if clave is not None and getattr(label_imagen, 'clave_imagen', None) != clave:
+        return
+    label_imagen.config(text="Img Error")
+
+
+def reiniciar_label(label_imagen, texto, width, height):
+    """Deja el label sin imagen (p. ej. al reciclar la tarjeta para otra obra)."""
+    label_imagen.clave_imagen = None
+    label_imagen.config(image="", text=texto, width=width, height=height)
+    label_imagen.image = None
+
+
+def cargar_imagen_async(url, label_imagen, tamano=(250, 250), prioridad=PRIORIDAD_FONDO):
+    """Pide la imagen al planificador de descargas para no bloquear la UI."""
+    despachador_tk.instalar(label_imagen)
+    clave = (url, tuple(tamano))
+    label_imagen.clave_imagen = clave
+    # Si la miniatura ya está en memoria se muestra al instante, sin pasar por la cola
+    img = cache_memoria.obtener(clave)
+    if img is not None:
+        _mostrar_en_label(label_imagen, img)
+        return
+
+    def _al_terminar(img, error):
+        # Corre en un hilo trabajador: la actualización del widget se delega al despachador
+        if error is not None:
+            print(f"Error al descargar imagen (hilo): {error}")
+            metricas.contar('imagen.errores')
+            despachador_tk.publicar(_mostrar_error, label_imagen, clave)
+        else:
+            despachador_tk.publicar(_mostrar_en_label, label_imagen, img, clave)
+
+    def _al_previsualizar(img):
+        # La versión definitiva reemplazará a esta en cuanto esté lista
+        despachador_tk.publicar(_mostrar_en_label, label_imagen, img, clave)
+    planificador.solicitar(url, tamano, _al_terminar, prioridad, _al_previsualizar)
@@ -0,0 +1,121 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+
+# --- SESIÓN GUARDADA ---
+# Al iniciar sesión se guarda en el directorio de configuración un token firmado con los
+# datos del usuario y una fecha de caducidad. Al reabrir la aplicación se entra con él
+# directamente, sin consultar Firestore ni recalcular el hash de la contraseña; la sesión
+# se comprueba después en segundo plano contra el usuario (ver auth.comprobar_sesion).
+#
+# La clave de la firma no se guarda junto al token sino en el llavero del sistema (paquete
+# opcional keyring): quien pueda editar el archivo de sesión no puede volver a firmarlo.
+# Sin llavero disponible no se guardan sesiones y hay que iniciar sesión cada vez.
+
+DIRECTORIO_CONFIG = os.environ.get('RASTRO_DIR_CONFIG') or os.path.join(
+    os.environ.get('XDG_CONFIG_HOME', os.path.join(os.path.expanduser('~'), '.config')),
+    'rastro-de-luz')
+ARCHIVO_SESION = os.path.join(DIRECTORIO_CONFIG, 'sesion')
+# Entrada del llavero con la clave de firma propia de cada equipo, creada al guardar la primera sesión
+SERVICIO_LLAVERO = 'rastro-de-luz'
+NOMBRE_CLAVE_LLAVERO = 'clave_sesion'
+
+DURACION_SESION_S = 14 * 24 * 60 * 60
+
+# Lo único que se guarda del usuario; nunca el hash de la contraseña
+CAMPOS_SESION = ('id', 'nombre', 'correo', 'rol', 'version_sesion')
+
+
+def _escribir_privado(ruta, contenido):
+    """Escribe el archivo de forma atómica y legible solo por el usuario actual."""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    descriptor = os.open(temporal, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, 'w', encoding='utf-8') as archivo:
+        archivo.write(contenido)
+    os.replace(temporal, ruta)
+
+
+def _clave_firma(crear=False):
+    """Devuelve la clave de firma del llavero (creándola con 'crear'), o None si no hay llavero."""
+    try:
+        import keyring
+    except ImportError:
+        return None
+    try:
+        guardada = keyring.get_password(SERVICIO_LLAVERO, NOMBRE_CLAVE_LLAVERO)
+        try:
+            return bytes.fromhex(guardada)
+        except (TypeError, ValueError):
+            if not crear:
+                return None
+        clave = secrets.token_bytes(32)
+        keyring.set_password(SERVICIO_LLAVERO, NOMBRE_CLAVE_LLAVERO, clave.hex())
+        return clave
+    except Exception as e:
+        # keyring está instalado pero el sistema no tiene un llavero utilizable
+        print(f"No se pudo usar el llavero del sistema: {e}")
+        return None
+
+
+def _firmar(clave, carga):
+    return hmac.new(clave, carga.encode('ascii'), hashlib.sha256).hexdigest()
+
+
+def guardar_sesion(datos_usuario):
+    """Guarda la sesión del usuario para retomarla al reabrir la aplicación."""
+    datos = {campo: datos_usuario.get(campo) for campo in CAMPOS_SESION}
+    datos['version_sesion'] = datos['version_sesion'] or 0
+    datos['expira'] = int(time.time()) + DURACION_SESION_S
+    carga = base64.urlsafe_b64encode(json.dumps(datos).encode('utf-8')).decode('ascii')
+    clave = _clave_firma(crear=True)
+    if clave is None:
+        print("No se guardó la sesión: no hay un llavero del sistema disponible (paquete keyring).")
+        return
+    try:
+        _escribir_privado(ARCHIVO_SESION, f"{carga}.{_firmar(clave, carga)}")
+    except OSError as e:
+        print(f"No se pudo guardar la sesión: {e}")
+
+
+def cargar_sesion():
+    """
+    Devuelve los datos del usuario de la sesión guardada, o None si no hay ninguna,
+    caducó o su firma no es válida. Solo lee archivos locales.
+    """
+    try:
+        with open(ARCHIVO_SESION, encoding='utf-8') as archivo:
+            carga, firma = archivo.read().strip().rsplit('.', 1)
+    except (OSError, ValueError):
+        return None
+    clave = _clave_firma()
+    if clave is None or not hmac.compare_digest(firma, _firmar(clave, carga)):
+        olvidar_sesion()
+        return None
+    try:
+        datos = json.loads(base64.urlsafe_b64decode(carga.encode('ascii')))
+    except ValueError:
+        olvidar_sesion()
+        return None
+    if datos.pop('expira', 0) < time.time():
+        olvidar_sesion()
+        return None
+    return datos
+
+
+def olvidar_sesion(usuario_id=None):
+    """Borra la sesión guardada; con 'usuario_id', solo si es la de ese usuario."""
+    if usuario_id is not None:
+        datos = cargar_sesion()
+        if datos is None or datos.get('id') != usuario_id:
+            return
+    try:
+        os.remove(ARCHIVO_SESION)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"No se pudo borrar la sesión guardada: {e}")
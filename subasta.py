@@ -0,0 +1,111 @@
+import random
+import time
+from datetime import datetime, timezone
+
+import base_datos
+import metricas
+
+db = base_datos.obtener_db()
+
+# --- POLÍTICA DE REINTENTOS ---
+# Cuando muchos postores ofertan por la misma obra a la vez, Firestore aborta las
+# transacciones que chocan. Se reintenta con espera exponencial y jitter completo
+# para que los postores no vuelvan a chocar todos en el mismo instante.
+MAX_INTENTOS = 8
+ESPERA_BASE_S = 0.05
+ESPERA_MAX_S = 2.0
+
+
+class OfertaRechazada(Exception):
+    """La oferta no es válida frente al estado actual de la obra en el servidor."""
+
+
+def mejor_oferta_de(obra_data):
+    """
+    Devuelve la oferta ganadora vigente de una obra, o None si no tiene ofertas.
+    Las obras aún no migradas (ver migrar_historial_ofertas.py) no tienen
+    'mejor_oferta', así que se busca en su antiguo arreglo de historial. El historial
+    no impedía ofertas del mismo monto: el empate lo gana la de menor usuario_id (las
+    que no tienen usuario_id quedan detrás), siempre la misma en cada lectura.
+    """
+    if obra_data.get('mejor_oferta'):
+        return obra_data['mejor_oferta']
+    historial = obra_data.get('historial_ofertas', [])
+    if historial:
+        return min(historial, key=lambda oferta: (-oferta.get('monto', 0), oferta.get('usuario_id') is None,
+                                                  oferta.get('usuario_id') or ''))
+    return None
+
+
+def precio_actual_de(obra_data):
+    """Precio que una nueva oferta debe superar."""
+    if obra_data.get('precio_actual') is not None:
+        return obra_data['precio_actual']
+    mejor = mejor_oferta_de(obra_data)
+    if mejor:
+        return mejor['monto']
+    return obra_data.get('ofertas', {}).get('precio_base', 0)
+
+
+@base_datos.transactional
+def _ofertar_en_transaccion(transaccion, obra_ref, oferta):
+    # Se relee la obra dentro de la transacción: el precio que vio el usuario puede estar viejo
+    snapshot = obra_ref.get(transaction=transaccion)
+    if not snapshot.exists:
+        raise OfertaRechazada("La obra ya no existe.")
+    obra_data = snapshot.to_dict()
+    if not obra_data.get('ofertas', {}).get('subasta_abierta', True):
+        raise OfertaRechazada("La subasta de esta obra está cerrada.")
+
+    precio_actual = precio_actual_de(obra_data)
+    if oferta['monto'] <= precio_actual:
+        raise OfertaRechazada(f"Tu oferta debe ser mayor al precio actual de ${precio_actual:,}.")
+
+    # La oferta va a la subcolección; la obra solo guarda el resumen
+    transaccion.create(obra_ref.collection('ofertas').document(), oferta)
+    transaccion.update(obra_ref, {
+        'precio_actual': oferta['monto'],
+        'mejor_oferta': oferta,
+        'num_ofertas': base_datos.Increment(1),
+        'actualizado': base_datos.SERVER_TIMESTAMP,
+    })
+
+
+def _es_conflicto(error):
+    """Indica si el error se debe a contención con otras transacciones."""
+    if isinstance(error, base_datos.ERRORES_DE_CONFLICTO):
+        return True
+    # Al agotar sus intentos, la librería lanza ValueError encadenado al Aborted original
+    return isinstance(error, ValueError) and isinstance(error.__cause__, base_datos.ERRORES_DE_CONFLICTO)
+
+
+@metricas.medir('firestore.oferta')
+def registrar_oferta(obra_id, datos_usuario, monto):
+    """
+    Registra una oferta de forma atómica: dentro de una transacción se comprueba
+    que supere el precio vigente, se crea en la subcolección 'ofertas' de la obra
+    y se actualiza el resumen (precio actual, mejor oferta y número de ofertas).
+    Devuelve (True, mensaje) si se aceptó o (False, mensaje) si no.
+    """
+    oferta = {
+        "usuario_id": datos_usuario.get('id'),
+        "nombre": datos_usuario.get('nombre'),
+        "monto": monto,
+        "timestamp": datetime.now(timezone.utc)
+    }
+    obra_ref = db.collection('obras_subasta').document(obra_id)
+
+    for intento in range(MAX_INTENTOS):
+        try:
+            # Un solo intento por transacción: los reintentos los controla este bucle, con espera
+            _ofertar_en_transaccion(db.transaction(max_attempts=1), obra_ref, oferta)
+            return True, "Tu oferta ha sido registrada."
+        except OfertaRechazada as e:
+            return False, str(e)
+        except Exception as e:
+            if not _es_conflicto(e):
+                return False, f"No se pudo registrar la oferta: {e}"
+            metricas.contar('firestore.ofertas_en_conflicto')
+            time.sleep(random.uniform(0, min(ESPERA_MAX_S, ESPERA_BASE_S * 2 ** intento)))
+
+    return False, "Hay muchas ofertas simultáneas por esta obra. Inténtalo de nuevo."
@@ -0,0 +1,335 @@
+import hashlib
+import os
+import re
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+from urllib.parse import unquote, urlparse
+
+import requests
+from PIL import Image, ImageFile, ImageOps, features
+
+import despachador_tk
+
+# --- VARIANTES QUE SE GENERAN DE CADA IMAGEN ---
+# Las galerías muestran las obras a 150, 250 y 700 px; subir solo el original obligaba
+# a descargar varios megas para pintar una miniatura. Cada variante cabe en un cuadrado
+# del lado indicado; 'completa' es la imagen entera, recomprimida para la web.
+VARIANTE_COMPLETA = "completa"
+LADO_MAXIMO_COMPLETA = 2048
+LADOS_VARIANTES = {VARIANTE_COMPLETA: LADO_MAXIMO_COMPLETA, "700": 700, "250": 250, "150": 150}
+
+# WebP pesa bastante menos que JPEG a igual calidad; si Pillow no lo soporta se usa JPEG
+FORMATO = "WEBP" if features.check("webp") else "JPEG"
+EXTENSION = ".webp" if FORMATO == "WEBP" else ".jpg"
+TIPO_CONTENIDO = "image/webp" if FORMATO == "WEBP" else "image/jpeg"
+CALIDAD = 82
+
+# --- CONFIGURACIÓN DE LA SUBIDA ---
+
+# Archivos que se procesan y suben a la vez
+MAX_SUBIDAS_SIMULTANEAS = 4
+# A partir de este tamaño la subida es reanudable, por fragmentos (múltiplo de 256 KB)
+UMBRAL_REANUDABLE = 5 * 1024 * 1024
+TAMANO_FRAGMENTO = 1024 * 1024
+# Los nombres son únicos, así que el contenido de cada URL nunca cambia
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Pool propio: las subidas largas no deben ocupar los hilos de las consultas
+_ejecutor = ThreadPoolExecutor(max_workers=MAX_SUBIDAS_SIMULTANEAS, thread_name_prefix="rastro-subida")
+
+
+def generar_variantes(origen):
+    """Devuelve {variante: bytes} con la imagen recomprimida a cada tamaño ('origen' es una ruta o un archivo abierto)."""
+    with Image.open(origen) as original:
+        # Respeta la orientación de las fotos de cámara y descarta metadatos
+        img = ImageOps.exif_transpose(original)
+        tiene_alfa = "A" in img.getbands() or "transparency" in img.info
+        if tiene_alfa and FORMATO == "WEBP":
+            img = img.convert("RGBA")
+        elif tiene_alfa:
+            # JPEG no admite transparencia: se aplana sobre fondo blanco
+            con_alfa = img.convert("RGBA")
+            img = Image.new("RGB", con_alfa.size, "white")
+            img.paste(con_alfa, mask=con_alfa.getchannel("A"))
+        else:
+            img = img.convert("RGB")
+
+        variantes = {}
+        # De mayor a menor: cada reducción parte de la anterior, que ya es más pequeña
+        for nombre, lado in sorted(LADOS_VARIANTES.items(), key=lambda item: -item[1]):
+            if max(img.size) > lado:
+                img = img.copy()
+                img.thumbnail((lado, lado), Image.Resampling.LANCZOS)
+            salida = BytesIO()
+            if FORMATO == "WEBP":
+                img.save(salida, FORMATO, quality=CALIDAD, method=4)
+            else:
+                img.save(salida, FORMATO, quality=CALIDAD, optimize=True, progressive=True)
+            variantes[nombre] = salida.getvalue()
+        return variantes
+
+
+class _LectorConProgreso:
+    """Envuelve los bytes a subir e informa cuántos ha leído ya la librería de Storage."""
+
+    def __init__(self, contenido, al_leer):
+        self._buffer = BytesIO(contenido)
+        self._al_leer = al_leer
+
+    def read(self, tamano=-1):
+        datos = self._buffer.read(tamano)
+        if datos:
+            self._al_leer(len(datos))
+        return datos
+
+    def seek(self, posicion, desde=0):
+        return self._buffer.seek(posicion, desde)
+
+    def tell(self):
+        return self._buffer.tell()
+
+
+def _subir_blob(bucket, nombre, contenido, al_leer):
+    blob = bucket.blob(nombre)
+    blob.cache_control = CACHE_CONTROL
+    if len(contenido) > UMBRAL_REANUDABLE:
+        # Subida reanudable: si se corta, se reintenta desde el último fragmento confirmado
+        blob.chunk_size = TAMANO_FRAGMENTO
+    # if_generation_match=0 hace la subida idempotente, así que la librería la reintenta sola;
+    # predefined_acl evita la petición extra de make_public()
+    blob.upload_from_file(_LectorConProgreso(contenido, al_leer), size=len(contenido), content_type=TIPO_CONTENIDO,
+                          predefined_acl="publicRead", if_generation_match=0, rewind=True)
+    return blob.public_url
+
+
+def _nombre_blob(base, nombre_variante):
+    if nombre_variante == VARIANTE_COMPLETA:
+        return f"{base}{EXTENSION}"
+    return f"{base}_{nombre_variante}{EXTENSION}"
+
+
+def subir_variantes(bucket, variantes, al_leer=None, nombres_subidos=None, base=None):
+    """
+    Sube el resultado de generar_variantes() y devuelve {variante: url pública}.
+    Es bloqueante; 'al_leer(bytes)' informa el avance y 'nombres_subidos' acumula los blobs creados.
+    'base' fija el nombre de los blobs (por defecto uno aleatorio bajo obras/).
+    """
+    base = base or f"obras/{uuid.uuid4()}"
+    urls = {}
+    for nombre_variante, contenido in variantes.items():
+        nombre_blob = _nombre_blob(base, nombre_variante)
+        urls[nombre_variante] = _subir_blob(bucket, nombre_blob, contenido, al_leer or (lambda cantidad: None))
+        if nombres_subidos is not None:
+            nombres_subidos.append(nombre_blob)
+    return urls
+
+
+def _subir_archivo(bucket, ruta, indice, al_progresar, nombres_subidos):
+    nombre_archivo = os.path.basename(ruta)
+    if al_progresar:
+        despachador_tk.publicar(al_progresar, indice, f"Procesando {nombre_archivo}...", 0.0)
+    variantes = generar_variantes(ruta)
+
+    total = sum(len(contenido) for contenido in variantes.values())
+    enviados = [0]
+
+    def al_leer(cantidad):
+        enviados[0] += cantidad
+        if al_progresar:
+            despachador_tk.publicar(al_progresar, indice, f"Subiendo {nombre_archivo}...", min(enviados[0] / total, 1.0))
+
+    urls = subir_variantes(bucket, variantes, al_leer, nombres_subidos)
+    if al_progresar:
+        despachador_tk.publicar(al_progresar, indice, f"{nombre_archivo} listo.", 1.0)
+    return urls
+
+
+def subir_imagenes(bucket, rutas, al_progresar=None, al_terminar=None, al_fallar=None):
+    """
+    Genera las variantes de cada archivo y las sube a Storage fuera del hilo de Tk,
+    con un máximo de MAX_SUBIDAS_SIMULTANEAS archivos a la vez. Todos los callbacks
+    se ejecutan en el hilo de Tk:
+    - al_progresar(indice, texto, fraccion) informa el avance de cada archivo.
+    - al_terminar(variantes) recibe, en el orden de 'rutas', un dict {variante: url} por archivo.
+    - al_fallar(error) se llama si algún archivo falla; lo ya subido se borra.
+    """
+    if not rutas:
+        if al_terminar:
+            despachador_tk.publicar(al_terminar, [])
+        return
+
+    nombres_subidos = []
+    resultados = [None] * len(rutas)
+    pendientes = [len(rutas)]
+    errores = []
+    lock = threading.Lock()
+
+    def al_completar_archivo(indice, futuro):
+        with lock:
+            try:
+                resultados[indice] = futuro.result()
+            except Exception as e:
+                errores.append(e)
+            pendientes[0] -= 1
+            if pendientes[0]:
+                return
+        if errores:
+            borrar_blobs(bucket, nombres_subidos)
+            if al_fallar:
+                despachador_tk.publicar(al_fallar, errores[0])
+        elif al_terminar:
+            despachador_tk.publicar(al_terminar, resultados)
+
+    for indice, ruta in enumerate(rutas):
+        futuro = _ejecutor.submit(_subir_archivo, bucket, ruta, indice, al_progresar, nombres_subidos)
+        futuro.add_done_callback(lambda f, i=indice: al_completar_archivo(i, f))
+
+
+def urls_de_obra(obra_data):
+    """Todas las URLs de imagen de una obra: las principales y las de sus variantes."""
+    urls = list(obra_data.get('image_urls', []))
+    for variantes in obra_data.get('variantes_imagenes', []):
+        urls.extend(url for url in variantes.values() if url not in urls)
+    return urls
+
+
+# --- BORRADO Y LIMPIEZA DE IMÁGENES ---
+
+# Peticiones que admite un lote de la API de Storage
+MAX_BORRADOS_POR_LOTE = 100
+# Prefijo bajo el que se suben todas las imágenes de obras
+PREFIJO_OBRAS = "obras/"
+# Un blob más reciente que esto puede ser de una obra cuyo registro aún no terminó
+ANTIGUEDAD_MINIMA_HUERFANO = timedelta(hours=24)
+
+
+def nombre_blob_de_url(bucket, url):
+    """Nombre del blob de 'bucket' al que apunta una URL, o None si la imagen no está en él."""
+    partes = urlparse(url)
+    if partes.netloc == "firebasestorage.googleapis.com":
+        # https://firebasestorage.googleapis.com/v0/b/<bucket>/o/<nombre codificado>
+        prefijo = f"/v0/b/{bucket.name}/o/"
+    elif partes.netloc == "storage.googleapis.com":
+        # https://storage.googleapis.com/<bucket>/<nombre> (la public_url de los blobs subidos)
+        prefijo = f"/{bucket.name}/"
+    else:
+        return None
+    if not partes.path.startswith(prefijo):
+        return None
+    return unquote(partes.path[len(prefijo):])
+
+
+def nombres_blobs_de_obra(bucket, obra_data):
+    """Blobs de 'bucket' que usa una obra, incluidas las variantes de cada imagen."""
+    nombres = (nombre_blob_de_url(bucket, url) for url in urls_de_obra(obra_data))
+    return [nombre for nombre in nombres if nombre]
+
+
+def borrar_blobs(bucket, nombres, al_progresar=None):
+    """
+    Borra blobs agrupando hasta MAX_BORRADOS_POR_LOTE en cada petición a Storage. Los
+    que ya no existen se ignoran. Es bloqueante; 'al_progresar(borrados, total)' se
+    llama tras cada lote. Devuelve los nombres que no se pudieron borrar.
+    """
+    nombres = list(nombres)
+    fallidos = []
+    for inicio in range(0, len(nombres), MAX_BORRADOS_POR_LOTE):
+        tanda = nombres[inicio:inicio + MAX_BORRADOS_POR_LOTE]
+        try:
+            # Un 404 de un blob que ya no existe no debe hacer fallar al resto del lote
+            with bucket.client.batch(raise_exception=False):
+                for nombre in tanda:
+                    bucket.delete_blob(nombre)
+        except Exception as e:
+            print(f"No se pudieron borrar {len(tanda)} imágenes de Storage: {e}")
+            fallidos.extend(tanda)
+        if al_progresar:
+            al_progresar(inicio + len(tanda), len(nombres))
+    return fallidos
+
+
+def blobs_huerfanos(bucket, obras):
+    """
+    Recorre el prefijo obras/ y devuelve los blobs que no usa ninguna de 'obras' (un
+    iterable de datos de obra, que debe cubrir la colección completa). Se dejan fuera
+    los blobs recientes, que pueden ser de una subida en curso.
+    """
+    en_uso = set()
+    for obra_data in obras:
+        en_uso.update(nombres_blobs_de_obra(bucket, obra_data))
+    limite = datetime.now(timezone.utc) - ANTIGUEDAD_MINIMA_HUERFANO
+    return [blob.name for blob in bucket.list_blobs(prefix=PREFIJO_OBRAS)
+            if blob.name not in en_uso and blob.time_created and blob.time_created < limite]
+
+
+# --- INGESTA DE IMÁGENES EXISTENTES ---
+# La usan generar_variantes.py y importar_obras.py para obtener las variantes de una
+# imagen que no se subió desde el panel de administración.
+
+HEADERS = {'User-Agent': 'Mozilla/5.0'}
+
+# .../wikipedia/commons/thumb/e/ec/Archivo.jpg/800px-Archivo.jpg
+PATRON_MINIATURA_WIKIMEDIA = re.compile(r'^(https://upload\.wikimedia\.org/wikipedia/[^/]+/thumb/[0-9a-f]/[0-9a-f]{2}/[^/]+)/(\d+)px-([^/]+)$')
+# .../wikipedia/commons/e/ec/Archivo.jpg
+PATRON_ORIGINAL_WIKIMEDIA = re.compile(r'^(https://upload\.wikimedia\.org/wikipedia/[^/]+)/([0-9a-f]/[0-9a-f]{2})/([^/]+\.(?:jpe?g|png|webp))$', re.IGNORECASE)
+
+
+def _ancho_remoto(url):
+    """Ancho de una imagen remota leyendo solo los primeros fragmentos, hasta su cabecera."""
+    parser = ImageFile.Parser()
+    with requests.get(url, headers=HEADERS, timeout=60, stream=True) as respuesta:
+        respuesta.raise_for_status()
+        for fragmento in respuesta.iter_content(16 * 1024):
+            parser.feed(fragmento)
+            if parser.image is not None:
+                return parser.image.width
+    raise ValueError(f"No se pudo leer el tamaño de {url}")
+
+
+def variantes_wikimedia(url):
+    """
+    Variantes de una imagen de Wikimedia por reescritura de URL, o None si no lo es: el
+    propio servidor de miniaturas genera cada tamaño, así que no se descarga ni se sube
+    nada. Wikimedia no amplía imágenes, así que solo se piden anchos menores que el disponible.
+    """
+    coincidencia = PATRON_MINIATURA_WIKIMEDIA.match(url)
+    if coincidencia:
+        base, ancho, archivo = coincidencia.groups()
+        ancho_disponible = int(ancho)
+        plantilla = f"{base}/{{}}px-{archivo}"
+    else:
+        coincidencia = PATRON_ORIGINAL_WIKIMEDIA.match(url)
+        if not coincidencia:
+            return None
+        raiz, ruta_hash, archivo = coincidencia.groups()
+        ancho_disponible = _ancho_remoto(url)
+        plantilla = f"{raiz}/thumb/{ruta_hash}/{archivo}/{{}}px-{archivo}"
+
+    variantes = {VARIANTE_COMPLETA: url}
+    for nombre, lado in LADOS_VARIANTES.items():
+        if nombre != VARIANTE_COMPLETA and lado < ancho_disponible:
+            variantes[nombre] = plantilla.format(lado)
+    return variantes
+
+
+def ingerir_imagen(bucket, origen):
+    """
+    Descarga (o lee, si 'origen' es una ruta local) una imagen, genera sus variantes y
+    las sube. Los blobs se nombran a partir del origen, así que ingerir dos veces la misma
+    imagen reutiliza lo ya subido en lugar de duplicarlo. Devuelve {variante: url}.
+    """
+    base = f"obras/importadas/{hashlib.sha256(origen.encode('utf-8')).hexdigest()[:32]}"
+    # Las variantes se suben de mayor a menor: si existe la más pequeña, la ingesta anterior terminó
+    if bucket.blob(_nombre_blob(base, min(LADOS_VARIANTES, key=LADOS_VARIANTES.get))).exists():
+        return {nombre: bucket.blob(_nombre_blob(base, nombre)).public_url for nombre in LADOS_VARIANTES}
+
+    if os.path.exists(origen):
+        variantes = generar_variantes(origen)
+    else:
+        respuesta = requests.get(origen, headers=HEADERS, timeout=60)
+        respuesta.raise_for_status()
+        variantes = generar_variantes(BytesIO(respuesta.content))
+    return subir_variantes(bucket, variantes, base=base)
@@ -0,0 +1,24 @@
+"""
+Configuración común de las pruebas que importan los módulos de la aplicación: todos crean
+su cliente al importarse, así que corren contra un único backend en memoria por proceso.
+Importar este módulo antes que ellos.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import base_datos
+
+base_datos.configurar('memoria')
+
+
+def vaciar_base_datos():
+    """Deja vacía la base en memoria y a cero sus estadísticas; devuelve el cliente."""
+    db = base_datos.obtener_db()
+    with db._lock:
+        db._colecciones.clear()
+        for clave in db.estadisticas:
+            db.estadisticas[clave] = 0
+    db.latencia_s = 0.0
+    return db
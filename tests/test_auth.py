@@ -0,0 +1,99 @@
+import threading
+import unittest
+
+import apoyo
+
+import auth
+
+
+class PruebaIndiceCorreos(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Un hash barato: las pruebas no miden el coste del hash
+        cls.metodo_hash = auth.METODO_HASH
+        auth.configurar_hash("pbkdf2:sha256:1000")
+
+    @classmethod
+    def tearDownClass(cls):
+        auth.configurar_hash(cls.metodo_hash)
+
+    def setUp(self):
+        self.db = apoyo.vaciar_base_datos()
+        auth._indice_completo = None
+
+    def usuarios(self):
+        return {doc.id: doc.to_dict() for doc in self.db.collection('usuarios').stream()}
+
+    def indice(self):
+        return {doc.id: doc.to_dict()['usuario_id'] for doc in self.db.collection('usuarios_por_correo').stream()}
+
+    def test_registro_duplicado_con_otras_mayusculas_o_espacios(self):
+        self.assertEqual(auth.registrar_usuario('Ana', ' Ana@Correo.com ', 'clave'), (True, "Registro exitoso."))
+        for correo in ('ana@correo.com', 'ANA@CORREO.COM', '  ana@correo.com\t'):
+            self.assertEqual(auth.registrar_usuario('Otra', correo, 'clave'), (False, "El correo electrónico ya está registrado."))
+        self.assertEqual([u['correo'] for u in self.usuarios().values()], ['ana@correo.com'])
+        self.assertEqual(list(self.indice()), ['ana@correo.com'])
+        self.assertIsNotNone(auth.verificar_usuario(' ANA@correo.com', 'clave')[0])
+
+    def test_registros_simultaneos_del_mismo_correo(self):
+        self.db.latencia_s = 0.002
+        for ronda in range(5):
+            correo = f"carrera{ronda}@correo.com"
+            salida = threading.Barrier(4)
+            resultados = []
+
+            def registrar(numero):
+                salida.wait()
+                resultados.append(auth.registrar_usuario(f"Postor {numero}", correo, 'clave'))
+
+            hilos = [threading.Thread(target=registrar, args=(i,)) for i in range(4)]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+            self.assertEqual(sorted(ok for ok, _ in resultados), [False, False, False, True])
+
+        usuarios = self.usuarios()
+        self.assertEqual(len(usuarios), 5)
+        indice = self.indice()
+        self.assertEqual(len(indice), 5)
+        self.assertEqual({usuarios[usuario_id]['correo'] for usuario_id in indice.values()}, set(indice))
+
+    def test_cambio_de_correo_no_borra_la_entrada_de_otro_usuario(self):
+        auth.registrar_usuario('Ana', 'ana@correo.com', 'clave')
+        ana_id = auth.buscar_usuario('ana@correo.com').id
+        # Usuario antiguo sin indexar que comparte el correo (el registro anterior no lo impedía)
+        self.db.collection('usuarios').document('antiguo').set({'nombre': 'Antiguo', 'correo': 'ana@correo.com', 'rol': 'usuario'})
+
+        self.assertEqual(auth.actualizar_usuario('antiguo', {'correo': 'Antiguo@Correo.com'})[0], True)
+        self.assertEqual(self.indice(), {'ana@correo.com': ana_id, 'antiguo@correo.com': 'antiguo'})
+        self.assertEqual(auth.buscar_usuario('ana@correo.com').id, ana_id)
+
+        self.assertEqual(auth.actualizar_usuario(ana_id, {'correo': 'ana.nueva@correo.com'})[0], True)
+        self.assertEqual(self.indice(), {'ana.nueva@correo.com': ana_id, 'antiguo@correo.com': 'antiguo'})
+
+    def test_cambio_a_un_correo_ya_registrado(self):
+        auth.registrar_usuario('Ana', 'ana@correo.com', 'clave')
+        auth.registrar_usuario('Beto', 'beto@correo.com', 'clave')
+        beto_id = auth.buscar_usuario('beto@correo.com').id
+        self.assertEqual(auth.actualizar_usuario(beto_id, {'correo': ' ANA@correo.com'}),
+                         (False, "El correo electrónico ya está registrado."))
+        self.assertEqual(self.indice()['beto@correo.com'], beto_id)
+
+    def test_usuario_antiguo_se_indexa_al_buscarlo(self):
+        self.db.collection('usuarios').document('antiguo').set({'nombre': 'Antiguo', 'correo': 'antiguo@correo.com'})
+        self.assertEqual(auth.buscar_usuario('antiguo@correo.com').id, 'antiguo')
+        self.assertEqual(self.indice(), {'antiguo@correo.com': 'antiguo'})
+
+    def test_sin_consulta_anterior_tras_la_migracion(self):
+        self.db.collection('usuarios').document('antiguo').set({'nombre': 'Antiguo', 'correo': 'antiguo@correo.com'})
+        self.db.collection('configuracion').document('indice_correos').set({'completo': True})
+        self.assertTrue(auth.indice_correos_completo())
+        lecturas = self.db.estadisticas['lecturas']
+        # Tras la migración solo cuenta el índice: un correo que no está en él no existe
+        self.assertIsNone(auth.buscar_usuario('antiguo@correo.com'))
+        self.assertEqual(self.db.estadisticas['lecturas'] - lecturas, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import base_datos_local
+from base_datos_local import ClienteLocal, FieldFilter, TransaccionAbortada
+
+
+class PruebaConsultas(unittest.TestCase):
+    def setUp(self):
+        self.db = ClienteLocal()
+        for i, (autor, precio) in enumerate([('b', 30), ('a', 10), ('c', 20), ('a', 40), ('b', None)]):
+            self.db.collection('obras').document(f"o{i}").set({'autor': autor, 'precio': precio, 'orden': i})
+
+    def ids(self, consulta):
+        return [doc.id for doc in consulta.stream()]
+
+    def test_where(self):
+        consulta = self.db.collection('obras').where(filter=FieldFilter('autor', '==', 'a'))
+        self.assertEqual(sorted(self.ids(consulta)), ['o1', 'o3'])
+        consulta = self.db.collection('obras').where(filter=FieldFilter('precio', '>=', 20))
+        self.assertEqual(sorted(self.ids(consulta)), ['o0', 'o2', 'o3'])
+
+    def test_order_by_con_desempate_por_id(self):
+        consulta = self.db.collection('obras').order_by('autor').order_by('precio', direction=base_datos_local.DESCENDING)
+        self.assertEqual(self.ids(consulta), ['o3', 'o1', 'o0', 'o4', 'o2'])
+
+    def test_order_by_ordena_nulo_antes_que_numeros(self):
+        self.assertEqual(self.ids(self.db.collection('obras').order_by('precio')), ['o4', 'o1', 'o2', 'o0', 'o3'])
+
+    def test_paginacion_con_start_after_y_limit(self):
+        consulta = self.db.collection('obras').order_by('orden')
+        primera = list(consulta.limit(2).stream())
+        self.assertEqual([doc.id for doc in primera], ['o0', 'o1'])
+        segunda = self.ids(consulta.start_after(primera[-1]).limit(2))
+        self.assertEqual(segunda, ['o2', 'o3'])
+        self.assertEqual(self.ids(consulta.start_after({'orden': 3}).limit(2)), ['o4'])
+
+    def test_subcoleccion_independiente(self):
+        self.db.collection('obras').document('o0').collection('ofertas').document('x').set({'monto': 5})
+        self.assertEqual(self.ids(self.db.collection('obras').document('o0').collection('ofertas')), ['x'])
+        self.assertEqual(len(self.ids(self.db.collection('obras'))), 5)
+
+
+class PruebaTransacciones(unittest.TestCase):
+    def setUp(self):
+        self.db = ClienteLocal()
+        self.ref = self.db.collection('obras').document('o1')
+        self.ref.set({'precio': 10})
+
+    def test_escritura_concurrente_aborta_y_se_reintenta(self):
+        intentos = []
+
+        @base_datos_local.transactional
+        def subir(transaccion, ref):
+            precio = ref.get(transaction=transaccion).to_dict()['precio']
+            intentos.append(precio)
+            if len(intentos) == 1:
+                # Otro cliente escribe entre la lectura y la confirmación
+                ref.update({'precio': 15})
+            transaccion.update(ref, {'precio': precio + 1})
+
+        subir(self.db.transaction(), self.ref)
+        self.assertEqual(intentos, [10, 15])
+        self.assertEqual(self.ref.get().to_dict()['precio'], 16)
+        self.assertEqual(self.db.estadisticas['transacciones_abortadas'], 1)
+
+    def test_agotar_los_intentos_falla_con_el_error_encadenado(self):
+        @base_datos_local.transactional
+        def siempre_en_conflicto(transaccion, ref):
+            ref.get(transaction=transaccion)
+            ref.update({'precio': base_datos_local.Increment(1)})
+            transaccion.update(ref, {'precio': 0})
+
+        with self.assertRaises(ValueError) as contexto:
+            siempre_en_conflicto(self.db.transaction(max_attempts=3), self.ref)
+        self.assertIsInstance(contexto.exception.__cause__, TransaccionAbortada)
+        self.assertEqual(self.ref.get().to_dict()['precio'], 13)
+
+    def test_error_de_la_funcion_no_escribe_nada(self):
+        @base_datos_local.transactional
+        def fallar(transaccion, ref):
+            transaccion.update(ref, {'precio': 99})
+            raise RuntimeError("fallo")
+
+        with self.assertRaises(RuntimeError):
+            fallar(self.db.transaction(), self.ref)
+        self.assertEqual(self.ref.get().to_dict()['precio'], 10)
+
+
+class PruebaListeners(unittest.TestCase):
+    def test_tipos_de_cambio(self):
+        db = ClienteLocal()
+        db.collection('obras').document('o1').set({'precio': 10})
+        eventos = []
+        escucha = db.collection('obras').on_snapshot(
+            lambda docs, cambios, read_time: eventos.append([(c.type.name, c.document.id) for c in cambios]))
+        db.collection('obras').document('o2').set({'precio': 20})
+        db.collection('obras').document('o1').update({'precio': 11})
+        db.collection('obras').document('o2').delete()
+        self.assertTrue(db.esperar_listeners())
+        escucha.unsubscribe()
+        db.collection('obras').document('o3').set({'precio': 30})
+        self.assertTrue(db.esperar_listeners())
+
+        self.assertEqual(eventos, [[('ADDED', 'o1')], [('ADDED', 'o2')], [('MODIFIED', 'o1')], [('REMOVED', 'o2')]])
+
+    def test_consulta_filtrada_quita_lo_que_deja_de_cumplir_el_filtro(self):
+        db = ClienteLocal()
+        db.collection('obras').document('o1').set({'abierta': True})
+        eventos = []
+        db.collection('obras').where(filter=FieldFilter('abierta', '==', True)).on_snapshot(
+            lambda docs, cambios, read_time: eventos.append([(c.type.name, c.document.id) for c in cambios]))
+        db.collection('obras').document('o1').update({'abierta': False})
+        self.assertTrue(db.esperar_listeners())
+        self.assertEqual(eventos, [[('ADDED', 'o1')], [('REMOVED', 'o1')]])
+
+
+class PruebaSqlite(unittest.TestCase):
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.ruta = os.path.join(self.directorio, 'datos.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.directorio)
+
+    def test_los_datos_sobreviven_a_reabrir(self):
+        db = ClienteLocal(self.ruta)
+        db.collection('obras').document('o1').set({'nombre': 'Luz', 'etiquetas': ['a']})
+        db.collection('obras').document('o2').set({'nombre': 'Sombra'})
+        db.collection('obras').document('o1').collection('ofertas').document('x').set({'monto': 5})
+        db.collection('obras').document('o2').delete()
+        db.collection('obras').document('o1').update({'etiquetas': base_datos_local.ArrayUnion(['b'])})
+        db.close()
+
+        reabierta = ClienteLocal(self.ruta)
+        self.assertEqual([doc.id for doc in reabierta.collection('obras').stream()], ['o1'])
+        self.assertEqual(reabierta.collection('obras').document('o1').get().to_dict(), {'nombre': 'Luz', 'etiquetas': ['a', 'b']})
+        self.assertEqual(reabierta.collection('obras').document('o1').collection('ofertas').document('x').get().to_dict(), {'monto': 5})
+        reabierta.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+import apoyo
+
+import cierre_subasta
+import subasta
+
+AHORA = datetime(2026, 7, 14, 21, 0, tzinfo=timezone.utc)
+
+
+def oferta(usuario_id, monto, nombre=None):
+    return {'usuario_id': usuario_id, 'nombre': nombre or usuario_id, 'monto': monto}
+
+
+class PruebaCalcularGanadores(unittest.TestCase):
+    def test_agrupa_por_usuario(self):
+        obras = [
+            ('o1', {'nombre': 'Luz', 'autor': 'A', 'mejor_oferta': oferta('u1', 100)}),
+            ('o2', {'nombre': 'Sombra', 'autor': 'B', 'mejor_oferta': oferta('u1', 50)}),
+            ('o3', {'nombre': 'Bruma', 'autor': 'C', 'mejor_oferta': oferta('u2', 70)}),
+            ('o4', {'nombre': 'Sin ofertas'}),
+            ('o5', {'nombre': 'Antigua', 'historial_ofertas': [{'nombre': 'Sin id', 'monto': 40}]}),
+        ]
+        ganadores, sin_usuario = cierre_subasta.calcular_ganadores(obras)
+        self.assertEqual(sorted(ganadores), ['u1', 'u2'])
+        self.assertEqual(ganadores['u1']['total'], 150)
+        self.assertEqual([obra['obra_id'] for obra in ganadores['u1']['obras']], ['o1', 'o2'])
+        self.assertEqual(ganadores['u2']['obras'], [{'obra_id': 'o3', 'nombre': 'Bruma', 'autor': 'C', 'monto': 70}])
+        self.assertEqual(sin_usuario, ['o5'])
+
+    def test_empate_en_el_historial_lo_gana_el_menor_usuario_id(self):
+        historial = [oferta('u3', 90), oferta('u2', 90), {'nombre': 'Sin id', 'monto': 90}, oferta('u1', 80)]
+        for orden in (historial, list(reversed(historial))):
+            ganadores, sin_usuario = cierre_subasta.calcular_ganadores([('o1', {'historial_ofertas': orden})])
+            self.assertEqual(list(ganadores), ['u2'])
+            self.assertEqual(sin_usuario, [])
+
+
+class PruebaCierre(unittest.TestCase):
+    def setUp(self):
+        self.db = apoyo.vaciar_base_datos()
+        self.config_ref = self.db.collection('configuracion').document('subasta')
+
+    def crear_obra(self, obra_id, mejor=None, abierta=True):
+        datos = {'nombre': obra_id, 'ofertas': {'precio_base': 10, 'subasta_abierta': abierta}}
+        if mejor:
+            datos.update(mejor_oferta=mejor, precio_actual=mejor['monto'])
+        self.db.collection('obras_subasta').document(obra_id).set(datos)
+
+    def ganador(self, usuario_id):
+        return self.db.collection('ganadores').document(usuario_id).get().to_dict()
+
+    def test_cierra_las_obras_y_escribe_los_ganadores(self):
+        self.config_ref.set({'fecha_inicio': AHORA - timedelta(hours=2), 'fecha_fin': AHORA - timedelta(hours=1)})
+        self.crear_obra('o1', oferta('u1', 100))
+        self.crear_obra('o2')
+        self.assertEqual(cierre_subasta.cerrar_subasta(AHORA)[0], True)
+
+        for obra_doc in self.db.collection('obras_subasta').stream():
+            self.assertFalse(obra_doc.to_dict()['ofertas']['subasta_abierta'])
+        self.assertEqual(self.ganador('u1')['total'], 100)
+        self.assertEqual(self.config_ref.get().to_dict()['cierre']['estado'], cierre_subasta.CIERRE_COMPLETADO)
+        # Otro proceso que llega tarde no lo repite
+        self.assertEqual(cierre_subasta.cerrar_subasta(AHORA)[0], False)
+
+    def test_no_cierra_antes_de_tiempo(self):
+        self.config_ref.set({'fecha_inicio': AHORA - timedelta(hours=1), 'fecha_fin': AHORA + timedelta(hours=1)})
+        self.crear_obra('o1', oferta('u1', 100))
+        self.assertEqual(cierre_subasta.cerrar_subasta(AHORA)[0], False)
+        self.assertIsNone(self.ganador('u1'))
+
+    def test_repetir_el_mismo_cierre_conserva_el_pago(self):
+        fecha_fin = AHORA - timedelta(hours=1)
+        self.config_ref.set({'fecha_inicio': AHORA - timedelta(hours=2), 'fecha_fin': fecha_fin})
+        self.crear_obra('o1', oferta('u1', 100))
+        cierre_subasta.cerrar_subasta(AHORA)
+        self.db.collection('ganadores').document('u1').update({'pagado': True})
+
+        # Un cierre caído a medias se retoma pasado DURACION_MAXIMA_CIERRE
+        self.config_ref.update({'cierre': {'estado': cierre_subasta.CIERRE_EN_CURSO, 'fecha_fin': fecha_fin, 'inicio': AHORA}})
+        self.assertEqual(cierre_subasta.cerrar_subasta(AHORA + cierre_subasta.DURACION_MAXIMA_CIERRE * 2)[0], True)
+        self.assertTrue(self.ganador('u1')['pagado'])
+
+    def test_nueva_subasta_reemplaza_el_documento_de_ganadores(self):
+        self.config_ref.set({'fecha_inicio': AHORA - timedelta(days=8), 'fecha_fin': AHORA - timedelta(days=7)})
+        self.crear_obra('o1', oferta('u1', 100))
+        cierre_subasta.cerrar_subasta(AHORA - timedelta(days=6))
+        self.db.collection('ganadores').document('u1').update({'pagado': True})
+
+        nueva_fin = AHORA - timedelta(hours=1)
+        cierre_subasta.programar_subasta(AHORA - timedelta(hours=2), nueva_fin)
+        self.db.collection('obras_subasta').document('o1').delete()
+        self.crear_obra('o2', oferta('u1', 60))
+        self.assertEqual(cierre_subasta.cerrar_subasta(AHORA)[0], True)
+
+        resumen = self.ganador('u1')
+        self.assertNotIn('pagado', resumen)
+        self.assertEqual(resumen['fecha_fin'], nueva_fin)
+        self.assertEqual([obra['obra_id'] for obra in resumen['obras']], ['o2'])
+        self.assertEqual(resumen['total'], 60)
+        self.assertTrue(cierre_subasta.resumen_vigente(resumen, self.config_ref.get().to_dict()))
+
+    def test_programar_subasta_reabre_las_obras_cerradas(self):
+        self.config_ref.set({'fecha_inicio': AHORA - timedelta(days=8), 'fecha_fin': AHORA - timedelta(days=7)})
+        self.crear_obra('o1', oferta('u1', 100))
+        self.crear_obra('o2')
+        cierre_subasta.cerrar_subasta(AHORA - timedelta(days=6))
+        self.assertEqual(subasta.registrar_oferta('o2', {'id': 'u2', 'nombre': 'B'}, 50)[0], False)
+
+        inicio, fin = datetime.now(timezone.utc) - timedelta(minutes=1), datetime.now(timezone.utc) + timedelta(hours=1)
+        self.assertEqual(cierre_subasta.programar_subasta(inicio, fin), 2)
+        for obra_doc in self.db.collection('obras_subasta').stream():
+            self.assertTrue(obra_doc.to_dict()['ofertas']['subasta_abierta'])
+        self.assertEqual(self.config_ref.get().to_dict(), {'fecha_inicio': inicio, 'fecha_fin': fin})
+        self.assertEqual(subasta.registrar_oferta('o2', {'id': 'u2', 'nombre': 'B'}, 50)[0], True)
+        # Volver a guardar las fechas no reabre nada más
+        self.assertEqual(cierre_subasta.programar_subasta(inicio, fin), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
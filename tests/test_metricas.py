@@ -0,0 +1,40 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metricas
+
+
+class PruebaMedir(unittest.TestCase):
+    def setUp(self):
+        metricas.reiniciar()
+
+    def test_llamadas_concurrentes_de_una_funcion_decorada(self):
+        @metricas.medir('prueba.espera')
+        def esperar():
+            time.sleep(0.5)
+
+        hilos = [threading.Thread(target=esperar) for _ in range(2)]
+        for hilo in hilos:
+            hilo.start()
+            time.sleep(0.2)  # Las dos llamadas se solapan: la segunda empieza antes de que acabe la primera
+        for hilo in hilos:
+            hilo.join()
+
+        resumen = metricas.instantanea()['tiempos']['prueba.espera']
+        self.assertEqual(resumen['conteo'], 2)
+        self.assertGreaterEqual(resumen['suma_ms'], 1000)
+        self.assertGreaterEqual(resumen['max_ms'], 500)
+
+    def test_bloque_with(self):
+        with metricas.medir('prueba.bloque'):
+            time.sleep(0.05)
+        self.assertGreaterEqual(metricas.instantanea()['tiempos']['prueba.bloque']['suma_ms'], 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+
+import apoyo
+
+import base_datos
+import metricas
+import replica_catalogo
+import repositorio
+from replica_catalogo import ReplicaCatalogo
+
+
+def pasar_el_tiempo():
+    # El reloj del backend local tiene resolución de microsegundos: sin esta pausa, una
+    # escritura justo después de sincronizar podría tener la misma hora que la marca
+    time.sleep(0.002)
+
+
+class PruebaSincronizacion(unittest.TestCase):
+    def setUp(self):
+        self.db = apoyo.vaciar_base_datos()
+        metricas.reiniciar()
+        self.replica = ReplicaCatalogo(":memory:", None)
+        for i in range(5):
+            self.escribir(f"o{i}", nombre=f"Obra {i}", timestamp=datetime(2026, 1, 1 + i, tzinfo=timezone.utc))
+
+    def escribir(self, obra_id, **campos):
+        campos['actualizado'] = base_datos.SERVER_TIMESTAMP
+        self.db.collection('obras_subasta').document(obra_id).set(campos, merge=True)
+
+    def catalogo(self):
+        return {doc.id: doc.to_dict() for doc in self.db.collection('obras_subasta').stream()}
+
+    def assertReplicaIgualAlCatalogo(self):
+        self.assertEqual(dict(self.replica.obras()), self.catalogo())
+        # En el orden de las galerías: de la más nueva a la más antigua
+        self.assertEqual([obra_id for obra_id, _ in self.replica.obras()],
+                         [doc.id for doc in repositorio.consulta_obras().stream()])
+
+    def test_primera_sincronizacion_descarga_todo(self):
+        cambios = []
+        replica_catalogo.sincronizar(self.replica, cambios.extend)
+        self.assertReplicaIgualAlCatalogo()
+        self.assertEqual(sorted(cambios, key=lambda c: c[1]), [('ADDED', f"o{i}", self.catalogo()[f"o{i}"]) for i in range(5)])
+        self.assertIsNotNone(self.replica.marcas())
+
+    def test_sincronizar_solo_trae_los_cambios(self):
+        replica_catalogo.sincronizar(self.replica)
+        pasar_el_tiempo()
+        self.escribir('o1', nombre="Obra 1 editada")
+        repositorio.eliminar_obras(['o3'])
+        self.escribir('o9', nombre="Obra nueva", timestamp=datetime(2026, 2, 1, tzinfo=timezone.utc))
+
+        cambios = []
+        lecturas = self.db.estadisticas['lecturas']
+        replica_catalogo.sincronizar(self.replica, cambios.extend)
+        # Las dos obras escritas y la lápida, no el catálogo entero
+        self.assertEqual(self.db.estadisticas['lecturas'] - lecturas, 3)
+        self.assertReplicaIgualAlCatalogo()
+        self.assertEqual(sorted((tipo, obra_id) for tipo, obra_id, _ in cambios),
+                         [('ADDED', 'o9'), ('MODIFIED', 'o1'), ('REMOVED', 'o3')])
+        self.assertEqual(metricas.instantanea()['contadores']['replica.descargas_completas'], 1)
+
+        # Sin cambios nuevos, la siguiente sincronización no aplica nada
+        cambios.clear()
+        replica_catalogo.sincronizar(self.replica, cambios.extend)
+        self.assertEqual(cambios, [])
+
+    def test_lapida_anterior_a_una_obra_recreada(self):
+        replica_catalogo.sincronizar(self.replica)
+        pasar_el_tiempo()
+        repositorio.eliminar_obras(['o2'])
+        pasar_el_tiempo()
+        # importar_obras usa IDs deterministas: la misma obra puede volver a crearse
+        self.escribir('o2', nombre="Obra 2 reimportada", timestamp=datetime(2026, 1, 3, tzinfo=timezone.utc))
+        replica_catalogo.sincronizar(self.replica)
+        self.assertReplicaIgualAlCatalogo()
+        self.assertEqual(dict(self.replica.obras())['o2']['nombre'], "Obra 2 reimportada")
+
+    def test_replica_vencida_se_descarga_entera(self):
+        replica_catalogo.sincronizar(self.replica)
+        vieja = datetime.now(timezone.utc) - timedelta(days=repositorio.DIAS_RETENCION_LAPIDAS + 1)
+        self.replica.aplicar(sincronizada=vieja)
+        self.assertIsNone(self.replica.marcas())
+
+        # Borrados cuya lápida ya se purgó: solo una descarga completa puede enterarse
+        self.db.collection('obras_subasta').document('o4').delete()
+        self.replica.aplicar(obras=[('fantasma', {'nombre': "Fila sobrante"})])
+
+        cambios = []
+        replica_catalogo.sincronizar(self.replica, cambios.extend)
+        self.assertReplicaIgualAlCatalogo()
+        self.assertEqual(sorted((tipo, obra_id) for tipo, obra_id, _ in cambios if tipo == 'REMOVED'),
+                         [('REMOVED', 'fantasma'), ('REMOVED', 'o4')])
+        self.assertEqual(metricas.instantanea()['contadores']['replica.descargas_completas'], 2)
+        self.assertIsNotNone(self.replica.marcas())
+
+    def test_escuchar_mantiene_la_replica_al_dia(self):
+        replica_catalogo.sincronizar(self.replica)
+        pasar_el_tiempo()
+        # Cambio hecho con la galería cerrada: lo trae el primer snapshot
+        self.escribir('o0', nombre="Editada sin escuchar")
+        cambios = []
+        listeners = replica_catalogo.escuchar(self.replica, cambios.extend)
+        try:
+            self.escribir('o1', nombre="Editada en vivo")
+            repositorio.eliminar_obras(['o2'])
+            self.assertTrue(self.db.esperar_listeners())
+        finally:
+            for listener in listeners:
+                listener.unsubscribe()
+
+        self.assertReplicaIgualAlCatalogo()
+        self.assertEqual(sorted((tipo, obra_id) for tipo, obra_id, _ in cambios),
+                         [('MODIFIED', 'o0'), ('MODIFIED', 'o1'), ('REMOVED', 'o2')])
+        # Las marcas avanzaron: sincronizar después no vuelve a traer lo mismo
+        cambios.clear()
+        replica_catalogo.sincronizar(self.replica, cambios.extend)
+        self.assertEqual(cambios, [])
+
+    def test_replica_de_otra_base_se_descarta(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        ruta = os.path.join(directorio, 'replica.sqlite')
+        replica_catalogo.descargar_todo(ReplicaCatalogo(ruta, "sqlite:/a.sqlite"))
+
+        self.assertEqual(ReplicaCatalogo(ruta, "sqlite:/a.sqlite").ids(), set(self.catalogo()))
+        otra = ReplicaCatalogo(ruta, "sqlite:/b.sqlite")
+        self.assertEqual(otra.ids(), set())
+        self.assertIsNone(otra.marcas())
+
+
+if __name__ == '__main__':
+    unittest.main()
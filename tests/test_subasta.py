@@ -0,0 +1,71 @@
+import random
+import threading
+import unittest
+
+import apoyo
+
+import subasta
+
+
+class PruebaRegistrarOferta(unittest.TestCase):
+    def setUp(self):
+        self.db = apoyo.vaciar_base_datos()
+        self.obra_ref = self.db.collection('obras_subasta').document('o1')
+        self.obra_ref.set({'nombre': 'Luz', 'ofertas': {'precio_base': 100, 'subasta_abierta': True}})
+
+    def test_ofertas_concurrentes_sobre_una_obra(self):
+        # La latencia hace que las transacciones se solapen y choquen como con Firestore
+        self.db.latencia_s = 0.001
+        montos = list(range(101, 301))
+        random.Random(7).shuffle(montos)
+        aceptadas = []
+        lock = threading.Lock()
+
+        def postor(numero, propios):
+            for monto in propios:
+                ok, _ = subasta.registrar_oferta('o1', {'id': f"u{numero}", 'nombre': f"Postor {numero}"}, monto)
+                if ok:
+                    with lock:
+                        aceptadas.append(monto)
+
+        hilos = [threading.Thread(target=postor, args=(i, montos[i::8])) for i in range(8)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        ofertas = [doc for doc in self.obra_ref.collection('ofertas').stream()]
+        en_orden = [doc.to_dict()['monto'] for doc in sorted(ofertas, key=lambda d: (d.create_time, d.to_dict()['monto']))]
+        self.assertTrue(aceptadas)
+        self.assertEqual(sorted(en_orden), sorted(aceptadas))
+        # Cada oferta aceptada supera a todas las aceptadas antes que ella
+        self.assertEqual(en_orden, sorted(en_orden))
+        self.assertEqual(len(set(en_orden)), len(en_orden))
+
+        obra = self.obra_ref.get().to_dict()
+        self.assertEqual(obra['precio_actual'], max(aceptadas))
+        self.assertEqual(obra['mejor_oferta']['monto'], max(aceptadas))
+        self.assertEqual(obra['num_ofertas'], len(ofertas))
+
+    def test_oferta_que_no_supera_el_precio_actual(self):
+        self.assertEqual(subasta.registrar_oferta('o1', {'id': 'u1', 'nombre': 'A'}, 150)[0], True)
+        ok, mensaje = subasta.registrar_oferta('o1', {'id': 'u2', 'nombre': 'B'}, 150)
+        self.assertFalse(ok)
+        self.assertIn("150", mensaje)
+        self.assertFalse(subasta.registrar_oferta('o1', {'id': 'u2', 'nombre': 'B'}, 90)[0])
+        self.assertEqual(self.obra_ref.get().to_dict()['num_ofertas'], 1)
+
+    def test_subasta_cerrada(self):
+        self.obra_ref.update({'ofertas.subasta_abierta': False})
+        ok, mensaje = subasta.registrar_oferta('o1', {'id': 'u1', 'nombre': 'A'}, 500)
+        self.assertFalse(ok)
+        self.assertIn("cerrada", mensaje)
+        self.assertEqual(list(self.obra_ref.collection('ofertas').stream()), [])
+
+    def test_obra_inexistente(self):
+        self.assertEqual(subasta.registrar_oferta('no-existe', {'id': 'u1', 'nombre': 'A'}, 500),
+                         (False, "La obra ya no existe."))
+
+
+if __name__ == '__main__':
+    unittest.main()